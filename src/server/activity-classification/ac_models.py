@@ -0,0 +1,119 @@
+import os
+import json
+from collections import OrderedDict
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import StandardScaler
+import constants
+
+deepLearningPath = str(Path.cwd()) + '/src/server/deep-learning/'
+#deepLearningPath = "/home/strongcourage/maip/src/server/deep-learning/"
+
+# Models saved by ac_build_models.py (copied to models/<modelId>), loaded once and kept between the explanations of
+# the XAI server (ac_xai_server.py): (path of the model, model type) -> (modification time of the model file, model)
+loaded_models = OrderedDict()
+# Preprocessed datasets of the models: modelId -> (modification times of the datasets, datasets)
+loaded_datasets = OrderedDict()
+
+def get_model_path(modelId):
+  return os.path.join(deepLearningPath, 'models', modelId)
+
+def get_model_type(modelId):
+  # Model type of the build config of the model, e.g., "Neural Network", "XGBoost" or "LightGBM"
+  buildConfigFilePath = os.path.join(deepLearningPath, 'trainings', modelId, 'build-config.json')
+  with open(buildConfigFilePath) as f:
+    return json.load(f)['modelType']
+
+def read_model(modelFilePath, modelType):
+  if modelType == "Neural Network":
+    from tensorflow.keras.models import load_model
+    return load_model(modelFilePath)
+  elif modelType == "XGBoost":
+    import xgboost as xgb
+    model = xgb.XGBClassifier()
+    model.load_model(modelFilePath)
+    return model
+  elif modelType == "LightGBM":
+    import lightgbm as ltb
+    # The booster of the classifier is saved, it predicts the probabilities of the classes
+    return ltb.Booster(model_file=modelFilePath)
+  raise ValueError("Model type is not valid: " + str(modelType))
+
+def load_model(modelId, modelType=None):
+  """
+  Load the persisted model of an activity classification model, the model is read again only if its file has changed
+  since it was loaded
+
+  :param modelId: id of the model (file in the models folder)
+  :param modelType: "Neural Network", "XGBoost" or "LightGBM", read from the build config of the model if None
+  :return: the loaded model
+  """
+  if modelType is None:
+    modelType = get_model_type(modelId)
+  modelFilePath = get_model_path(modelId)
+  if not os.path.isfile(modelFilePath):
+    raise FileNotFoundError("Model does not exist: " + modelFilePath)
+
+  key = (modelFilePath, modelType)
+  modifiedAt = os.path.getmtime(modelFilePath)
+  cached = loaded_models.get(key)
+  if cached is not None and cached[0] == modifiedAt:
+    loaded_models.move_to_end(key)
+    return cached[1]
+
+  print("Load the model " + modelFilePath)
+  model = read_model(modelFilePath, modelType)
+  loaded_models[key] = (modifiedAt, model)
+  loaded_models.move_to_end(key)
+  while len(loaded_models) > constants.AC_MODELS_CACHE_SIZE:
+    loaded_models.popitem(last=False)
+  return model
+
+def preprocess_datasets(X_train, X_test, y_train_orig, y_test_orig):
+  # Convert the expected output into arrays, e.g., 1 -> [1,0,0], 2 -> [0,1,0], 3 -> [0,0,1]
+  prep_outputs = {1: [1,0,0], 2: [0,1,0], 3: [0,0,1]}
+
+  y_train = np.array(y_train_orig.map(prep_outputs).tolist())
+  y_test = np.array(y_test_orig.map(prep_outputs).tolist())
+
+  # Preprocessing the data
+  scaler = StandardScaler().fit(X_train)
+
+  # Apply transform to both the training/testing dataset.
+  X_train = scaler.transform(X_train)
+  X_test = scaler.transform(X_test)
+
+  return X_train, y_train, X_test, y_test
+
+def load_datasets(modelId):
+  """
+  Read and preprocess the training and testing datasets of a model, they are read again only if their files have
+  changed since they were read
+
+  :return: X_train, y_train, X_test, y_test (preprocessed), y_train_orig (classes 1, 2 or 3)
+  """
+  output_datasets_path = os.path.join(deepLearningPath, 'trainings', modelId, 'datasets')
+  train_data_path = os.path.join(output_datasets_path, 'Train_samples.csv')
+  test_data_path = os.path.join(output_datasets_path, 'Test_samples.csv')
+  modifiedAt = (os.path.getmtime(train_data_path), os.path.getmtime(test_data_path))
+  cached = loaded_datasets.get(modelId)
+  if cached is not None and cached[0] == modifiedAt:
+    loaded_datasets.move_to_end(modelId)
+    return cached[1]
+
+  train_data = pd.read_csv(train_data_path, delimiter=";")
+  test_data = pd.read_csv(test_data_path, delimiter=";")
+
+  X_train = train_data.drop(columns=['output'])
+  y_train_orig = train_data['output']
+  X_test = test_data.drop(columns=['output'])
+  y_test_orig = test_data['output']
+
+  X_train, y_train, X_test, y_test = preprocess_datasets(X_train, X_test, y_train_orig, y_test_orig)
+  datasets = (X_train, y_train, X_test, y_test, y_train_orig)
+  loaded_datasets[modelId] = (modifiedAt, datasets)
+  loaded_datasets.move_to_end(modelId)
+  while len(loaded_datasets) > constants.AC_MODELS_CACHE_SIZE:
+    loaded_datasets.popitem(last=False)
+  return datasets
@@ -0,0 +1,98 @@
+"""
+Long-lived XAI service of the activity classification models, the counterpart of deep-learning/xai_server.py (which
+cannot load these models: both folders have their own constants module). The loaded models and their preprocessed
+datasets are kept between the explanations (see ac_models.py), so that explaining the same model again only costs
+the explanation.
+
+Requests and responses are JSON objects, one per line, read from stdin and written to stdout:
+  {"id": 1, "type": "shap", "model": "<model id>", "numberBackgroundSamples": 100, "numberExplainedSamples": 10,
+   "maxDisplay": 15, "modelType": "XGBoost"}
+  {"id": 2, "type": "lime", "model": "<model id>", "sampleId": "5" or "5,6,7", "numberFeatures": 10,
+   "modelType": "XGBoost"}
+    -> {"id": ..., "ok": true, "explanation_time": <time of the explanation>, "time_ms": <time of the request>}
+       the explanations are saved in xai/<model id>/ as by ac_xai_shap.py and ac_xai_lime.py
+  {"id": 3, "command": "stats"} -> {"id": 3, "ok": true, "models": [...], "requests": <nb requests>}
+  {"id": 4, "command": "stop"}
+A failed request gets {"id": ..., "ok": false, "error": "<message>"}
+"""
+import sys
+
+# Responses are written to the original stdout, all the other outputs (prints, logs, progress bars) go to stderr
+PROTOCOL_OUT = sys.stdout
+sys.stdout = sys.stderr
+
+import json
+import os
+import timeit
+
+import matplotlib
+matplotlib.use('Agg')
+
+import ac_models
+from ac_xai_lime import explain_lime
+from ac_xai_shap import explain_shap
+
+
+class ACXAIServer:
+
+  def __init__(self):
+    self.nb_requests = 0
+    self.running = True
+
+  def handle(self, line):
+    """
+    :param line: JSON request
+    :return: JSON response
+    """
+    request_id = None
+    start = timeit.default_timer()
+    try:
+      request = json.loads(line)
+      request_id = request.get('id')
+      response = self._handle(request)
+    except Exception as e:
+      print(f"Request {request_id} failed: {e}")
+      response = {'ok': False, 'error': str(e)}
+    self.nb_requests += 1
+    response['id'] = request_id
+    response['time_ms'] = round((timeit.default_timer() - start) * 1000, 3)
+    return json.dumps(response)
+
+  def _handle(self, request):
+    command = request.get('command')
+    if command == 'stats':
+      models = [os.path.basename(path) for path, _ in ac_models.loaded_models]
+      return {'ok': True, 'models': models, 'requests': self.nb_requests}
+    if command == 'stop':
+      self.running = False
+      return {'ok': True}
+    if command is not None:
+      raise ValueError(f"Unknown command {command}")
+
+    modelId = request['model']
+    if not os.path.isfile(ac_models.get_model_path(modelId)):
+      raise FileNotFoundError(f"Model {modelId} does not exist")
+    # an empty model type (not given by the client) is read from the build config of the model
+    modelType = request.get('modelType') or None
+    xai_type = request['type']
+    if xai_type == 'shap':
+      time_taken = explain_shap(modelId, request['numberBackgroundSamples'], request['numberExplainedSamples'],
+                                request['maxDisplay'], modelType)
+    elif xai_type == 'lime':
+      time_taken = explain_lime(modelId, request['sampleId'], request['numberFeatures'], modelType)
+    else:
+      raise ValueError(f"Unknown XAI type {xai_type}")
+    return {'ok': True, 'explanation_time': time_taken}
+
+  def serveStdin(self):
+    for line in sys.stdin:
+      if not line.strip():
+        continue
+      PROTOCOL_OUT.write(self.handle(line) + '\n')
+      PROTOCOL_OUT.flush()
+      if not self.running:
+        break
+
+
+if __name__ == "__main__":
+  ACXAIServer().serveStdin()
@@ -8,76 +8,61 @@ import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 import timeit
-import xgboost as xgb
-import lightgbm as ltb
 from pathlib import Path
-from tensorflow.keras.models import load_model
 from pydoc import classname
 from datetime import datetime
-from sklearn.preprocessing import StandardScaler
-from tensorflow.keras.models import Sequential
-from tensorflow.keras.layers import Dense
 from sklearn.inspection import permutation_importance
 import constants
+from ac_models import load_model, get_model_type, load_datasets
 
 deepLearningPath = str(Path.cwd()) + '/src/server/deep-learning/'
 #deepLearningPath = "/home/strongcourage/maip/src/server/deep-learning/"
 
-def preprocess_datasets(X_train, X_test, y_train_orig, y_test_orig):
-  # Convert the expected output into arrays, e.g., 1 -> [1,0,0], 2 -> [0,1,0], 3 -> [0,0,1]
-  prep_outputs = {1: [1,0,0], 2: [0,1,0], 3: [0,0,1]}
-
-  y_train = np.array(y_train_orig.map(prep_outputs).tolist())
-  y_test = np.array(y_test_orig.map(prep_outputs).tolist())
-
-  # Preprocessing the data
-  scaler = StandardScaler().fit(X_train)
-
-  # Apply transform to both the training/testing dataset.
-  X_train = scaler.transform(X_train)
-  X_test = scaler.transform(X_test)
-
-  return X_train, y_train, X_test, y_test
-
-# TODO: should use load_model() instead
-def get_model(modelType, X_train, y_train, y_train_orig):
-  model = None
-  if modelType == "Neural Network":
-    model = Sequential()
-    model.add(Dense(12, input_shape=(21,), activation='relu'))
-    model.add(Dense(8, activation='relu'))
-    model.add(Dense(3, activation='sigmoid'))
-    model.compile(loss='binary_crossentropy', optimizer='adam', metrics=['accuracy'])
-    model.fit(X_train, y_train, epochs=150, batch_size=10)
-  elif modelType == "XGBoost":
-    model = xgb.XGBClassifier()
-    model.fit(X_train, y_train)
-  elif modelType == "LightGBM":
-    model = ltb.LGBMClassifier()
-    model.fit(X_train, y_train_orig)
-  else:
-    print("ERROR: Model type is not valid")
-  return model
-
-def running_shap(model, numberBackgroundSamples, numberExplainedSamples, maxDisplay, modelType):
+def get_model(modelId, modelType):
+  # Explain the model saved by ac_build_models.py, it is loaded once per process (see ac_models.load_model)
+  return load_model(modelId, modelType)
+
+def get_explainer(model, modelType, background):
+  # Exact TreeSHAP for the tree ensembles, gradients for the Keras models, KernelSHAP if they cannot be used
+  explainer = None
+  try:
+    if modelType in ("XGBoost", "LightGBM"):
+      explainer = shap.TreeExplainer(model)
+    elif modelType == "Neural Network" and constants.AC_SHAP_NN_EXPLAINER == 'deep':
+      explainer = shap.DeepExplainer(model, background)
+    elif modelType == "Neural Network" and constants.AC_SHAP_NN_EXPLAINER == 'gradient':
+      explainer = shap.GradientExplainer(model, background)
+  except Exception as e:
+    print("Cannot create the explainer of the model, use KernelExplainer: " + str(e))
+  if explainer is None:
+    explainer = shap.KernelExplainer(model.predict, background)
+  return explainer
+
+def get_class_shap_values(shap_values, nb_classes):
+  # SHAP values of each class (samples x features), explainers return either a list with one array per class
+  # or an array with the classes as last dimension
+  if isinstance(shap_values, list):
+    return [np.asarray(values) for values in shap_values]
+  shap_values = np.asarray(shap_values)
+  if shap_values.ndim == 3:
+    return [shap_values[:, :, i] for i in range(shap_values.shape[2])]
+  return [shap_values] * nb_classes
+
+def running_shap(model, modelId, X_train, X_test, numberBackgroundSamples, numberExplainedSamples, maxDisplay, modelType):
   classes = ['Web', 'Interactive', 'Video']
 
-  background = shap.sample(X_train, int(numberBackgroundSamples))
+  background = np.asarray(shap.sample(X_train, int(numberBackgroundSamples)), dtype=np.float32)
 
   #background = X_train[np.random.choice(X_train.shape[0], int(numberBackgroundSamples), replace=False)]
 
-  if modelType == "LightGBM":
-    # set background to TreeExplainer ?
-    explainer = shap.TreeExplainer(model)
-  else:
-    # maximum of background is X_train
-    explainer = shap.KernelExplainer(model.predict, background)
+  explainer = get_explainer(model, modelType, background)
 
   with warnings.catch_warnings():
     warnings.filterwarnings("ignore")
     X_test_sample = shap.sample(X_test, int(numberExplainedSamples))
-    shap_values = explainer.shap_values(X_test_sample)
+    shap_values = explainer.shap_values(np.asarray(X_test_sample, dtype=np.float32))
     #print(shap_values)
+  shap_values = get_class_shap_values(shap_values, len(classes))
 
   explanations_path = deepLearningPath + '/xai/' + modelId
   if not os.path.exists(explanations_path):
@@ -103,6 +88,8 @@ def running_shap(model, numberBackgroundSamples, numberExplainedSamples, maxDisp
     shap.summary_plot(shap_values[i], X_test_sample)
     #plt.savefig(os.path.join(explanations_path, f'{label}_summary_plot.png'))
     #plt.clf()  # Clear the current figure after saving
+  # the figures are not kept by the long-lived XAI server
+  plt.close('all')
 
   shap_dict = {}
   for idx, label in enumerate(classes):
@@ -115,6 +102,8 @@ def running_shap(model, numberBackgroundSamples, numberExplainedSamples, maxDisp
     #json.dump(shap_dict, file, indent=2, ensure_ascii=False)
     #print("SHAP summary values dumped to " + jsonfile)
 
+  return type(explainer).__name__
+
   # # Convert SHAP values into a dictionary with class labels as keys
   # shap_dict = {}
   # for idx, label in enumerate(classes):
@@ -128,6 +117,35 @@ def running_shap(model, numberBackgroundSamples, numberExplainedSamples, maxDisp
   # print("SHAP values dumped to shap_values.json")
   # print(json.dump(shap_dict, file, indent=2, ensure_ascii=False))
 
+def explain_shap(modelId, numberBackgroundSamples, numberExplainedSamples, maxDisplay, modelType=None):
+  """
+  Produce the SHAP explanations of a model in xai/<modelId>/ and save the time taken for them
+
+  :return: time taken for the explanations (in seconds)
+  """
+  if modelType is None:
+    # the explainer depends on the type of the model
+    modelType = get_model_type(modelId)
+
+  X_train, y_train, X_test, y_test, y_train_orig = load_datasets(modelId)
+  model = get_model(modelId, modelType)
+
+  # Compute time for producing explanations and save it to file, with the explainer used
+  start = timeit.default_timer()
+  explainerName = running_shap(model, modelId, X_train, X_test, numberBackgroundSamples, numberExplainedSamples,
+                               maxDisplay, modelType)
+  time_taken = timeit.default_timer() - start
+  print("Time taken for SHAP (" + explainerName + ") in seconds: ", time_taken)
+  xai_path = deepLearningPath + '/xai/' + modelId
+  statsfile = os.path.join(xai_path, 'time_stats_shap.txt')
+  print(statsfile)
+  with open(statsfile, "w") as f:
+    f.write(str(time_taken))
+    f.close()
+  with open(os.path.join(xai_path, 'time_stats_shap.json'), "w") as f:
+    json.dump({"explainer": explainerName, "time": time_taken}, f)
+  return time_taken
+
 if __name__ == "__main__":
   if len(sys.argv) < 5 or len(sys.argv) > 6:
     print('Invalid inputs')
@@ -142,29 +160,4 @@ if __name__ == "__main__":
     if len(sys.argv) == 6:
       modelType = sys.argv[5]
 
-    output_path = deepLearningPath + '/trainings/' + modelId
-    output_datasets_path = output_path + '/datasets/'
-    train_data_path = os.path.join(output_datasets_path,'Train_samples.csv')
-    test_data_path = os.path.join(output_datasets_path,'Test_samples.csv')
-    train_data = pd.read_csv(train_data_path, delimiter=";")
-    test_data = pd.read_csv(test_data_path, delimiter=";")
-
-    X_train = train_data.drop(columns=['output'])
-    y_train_orig = train_data['output']
-    X_test = test_data.drop(columns=['output'])
-    y_test_orig = test_data['output']
-
-    X_train, y_train, X_test, y_test = preprocess_datasets(X_train, X_test, y_train_orig, y_test_orig)
-
-    model = get_model(modelType, X_train, y_train, y_train_orig)
-
-    # Compute time for producing explanations and save it to file
-    generation_iters = 1
-    time_taken = timeit.timeit(lambda: running_shap(model, numberBackgroundSamples, numberExplainedSamples, maxDisplay, modelType), number=generation_iters)
-    print("Time taken for SHAP in seconds: ", time_taken)
-    xai_path = deepLearningPath + '/xai/' + modelId
-    statsfile = os.path.join(xai_path, 'time_stats_shap.txt')
-    print(statsfile)
-    with open(statsfile, "w") as f:
-      f.write(str(time_taken))
-      f.close()
\ No newline at end of file
+    explain_shap(modelId, numberBackgroundSamples, numberExplainedSamples, maxDisplay, modelType)
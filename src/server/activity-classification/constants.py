@@ -3,4 +3,11 @@ AC_FEATURES = ['session_time', '%tcp_protocol', '%udp_protocol', 'ul_data_volume
               '%ul_volume', 'dl_data_volume', 'max_dl_volume', 'min_dl_volume', 
               'avg_dl_volume', 'std_dl_volume', '%dl_volume', 'nb_uplink_packet', 
               'nb_downlink_packet', 'ul_packet', 'dl_packet', 'kB/s', 'nb_packet/s'
-              ]
\ No newline at end of file
+              ]
+
+# Number of models (and their preprocessed datasets) kept loaded by ac_models.py in the AC XAI server
+AC_MODELS_CACHE_SIZE = 4
+
+# SHAP explainer of the Neural Network models: 'gradient' (GradientExplainer), 'deep' (DeepExplainer) or 'kernel'
+# (KernelExplainer), the XGBoost and LightGBM models are explained with the exact TreeExplainer
+AC_SHAP_NN_EXPLAINER = 'gradient'
@@ -0,0 +1,141 @@
+"""
+Summaries of the training set of a model used by the SHAP and LIME explanations, built once per model and saved with
+its results (trainings/<model name>/results/), so that the cost of an explanation depends on the size of the summary
+instead of the size of the training set:
+- background_<method>_<size>.pkl: weighted background samples (k-means centers weighted by the size of their cluster,
+  or a lightweight coreset weighted by the inverse of the sampling probability) for SHAP,
+- lime_stats.pkl: quartiles of the features and statistics of each quartile over the whole training set, which
+  LimeTabularExplainer would otherwise calculate again for each explainer.
+A summary is built again when the training set (scaled) is not the one it was built from.
+"""
+import os
+import pickle
+
+import numpy as np
+
+import constants
+from liteModel import modelResultPaths
+
+
+def dataFingerprint(x):
+    """
+    :param x: training samples (scaled)
+    :return: shape and checksum of the samples, to check that a saved summary was built from them
+    """
+    x = np.asarray(x, dtype=np.float64)
+    return {'shape': list(x.shape), 'sum': float(x.sum()), 'squares': float(np.square(x).sum())}
+
+
+def kmeansSummary(x, size, seed=0):
+    """
+    :return: centers of the k-means clusters of the samples, and the number of samples of each cluster
+    """
+    from sklearn.cluster import MiniBatchKMeans
+
+    kmeans = MiniBatchKMeans(n_clusters=size, random_state=seed, n_init=3,
+                             batch_size=max(1024, 3 * size)).fit(x)
+    weights = np.bincount(kmeans.labels_, minlength=size).astype(np.float64)
+    kept = weights > 0
+    return kmeans.cluster_centers_[kept].astype(np.float32), weights[kept]
+
+
+def coresetSummary(x, size, seed=0):
+    """
+    Lightweight coreset (Bachem et al., 2018): samples drawn with a probability mixing the uniform distribution and
+    the squared distance to the mean, weighted by the inverse of their probability
+    """
+    rng = np.random.default_rng(seed)
+    x = np.asarray(x, dtype=np.float64)
+    distances = np.square(x - x.mean(0)).sum(1)
+    total = distances.sum()
+    probs = 0.5 / len(x) + (0.5 * distances / total if total > 0 else 0.5 / len(x))
+    probs = probs / probs.sum()
+    chosen = rng.choice(len(x), size=size, replace=True, p=probs)
+    return x[chosen].astype(np.float32), 1.0 / (size * probs[chosen])
+
+
+def summarize(x, size, method=constants.XAI_BACKGROUND_METHOD, seed=0):
+    """
+    :param x: training samples (scaled)
+    :param size: number of samples of the summary
+    :param method: 'kmeans' or 'coreset'
+    :return: samples of the summary and their weights (number of training samples they represent)
+    """
+    x = np.asarray(x, dtype=np.float32)
+    if len(x) <= size:
+        return x, np.ones(len(x))
+    if method == 'kmeans':
+        return kmeansSummary(x, size, seed)
+    if method == 'coreset':
+        return coresetSummary(x, size, seed)
+    raise ValueError(f"Unknown background summary method {method}")
+
+
+def limeStats(x):
+    """
+    :param x: training samples (scaled)
+    :return: training_data_stats of LimeTabularExplainer (quartile discretization), the same statistics the
+    QuartileDiscretizer of LIME calculates over the training samples
+    """
+    x = np.asarray(x, dtype=np.float64)
+    stats = {'means': {}, 'stds': {}, 'mins': {}, 'maxs': {}, 'bins': {}, 'feature_values': {},
+             'feature_frequencies': {}}
+    for feature in range(x.shape[1]):
+        column = x[:, feature]
+        qts = np.unique(np.percentile(column, [25, 50, 75]))
+        discretized = np.searchsorted(qts, column)
+        stats['bins'][feature] = qts.tolist()
+        stats['means'][feature] = []
+        stats['stds'][feature] = []
+        for value in range(len(qts) + 1):
+            selection = column[discretized == value]
+            stats['means'][feature].append(float(selection.mean()) if len(selection) > 0 else 0.0)
+            stats['stds'][feature].append((float(selection.std()) if len(selection) > 0 else 0.0) + 0.00000000001)
+        stats['mins'][feature] = [float(column.min())] + qts.tolist()
+        stats['maxs'][feature] = qts.tolist() + [float(column.max())]
+        values, counts = np.unique(discretized, return_counts=True)
+        stats['feature_values'][feature] = values.tolist()
+        stats['feature_frequencies'][feature] = (counts / counts.sum()).tolist()
+    return stats
+
+
+def cachedSummary(model_path, file_name, x, build):
+    """
+    :param model_path: path of the model
+    :param file_name: name of the summary in the results of the model
+    :param x: training samples (scaled)
+    :param build: function building the summary from x
+    :return: the summary saved with the model if it was built from x, otherwise the summary built and saved
+    """
+    fingerprint = dataFingerprint(x)
+    for result_path in modelResultPaths(model_path):
+        path = os.path.join(result_path, file_name)
+        if os.path.isfile(path):
+            with open(path, 'rb') as f:
+                saved = pickle.load(f)
+            if saved.get('fingerprint') == fingerprint:
+                return saved['summary']
+
+    summary = build(x)
+    result_path = modelResultPaths(model_path)[-1]
+    os.makedirs(result_path, exist_ok=True)
+    with open(os.path.join(result_path, file_name), 'wb') as f:
+        pickle.dump({'fingerprint': fingerprint, 'summary': summary}, f)
+    print(f"Saved the summary {file_name} of the training set in {result_path}")
+    return summary
+
+
+def loadBackground(model_path, x, size, method=constants.XAI_BACKGROUND_METHOD):
+    """
+    :return: background samples of the model (summary of size samples of the training samples x) and their weights
+    """
+    size = min(int(size), len(x))
+    return cachedSummary(model_path, f'background_{method}_{size}.pkl', x,
+                         lambda data: summarize(data, size, method))
+
+
+def loadLimeStats(model_path, x):
+    """
+    :return: training_data_stats of LimeTabularExplainer for the training samples x of the model
+    """
+    return cachedSummary(model_path, 'lime_stats.pkl', x, limeStats)
@@ -38,6 +38,11 @@ AD_FEATURES = ['ip.session_id', 'meta.direction', 'ip.pkts_per_flow', 'duration'
 
 AD_FEATURES_OUTPUT = AD_FEATURES + ['malware']
 
+# Bins of packet lengths (bytes) and time between packets (ms) based on
+# "MalDetect: A Structure of Encrypted Malware Traffic Detection" by Jiyuan Liu et al.
+AD_BINS_LEN = [0, 150, 300, 450, 600, 750, 900, 1050, 1200, 1350, 1500, 10000]
+AD_BINS_TIME = [0, 50, 100, 150, 200, 250, 300, 350, 400, 450, 500, 550]
+
 DISCRETE_FEATURES = [
   'ip.pkts_per_flow', 'ip.header_len', 'ip.payload_len',
   '(-0.001, 50.0]', '(50.0, 100.0]', '(100.0, 150.0]', '(150.0, 200.0]',
@@ -95,4 +100,131 @@ IPV6_FEATURES = ["time",
               "ip.last_packet_time",
               "ip.src",
               "ip.dst"
-              ]
\ No newline at end of file
+              ]
+
+# Attributes (in order) reported by mmt-probe for each event, ip events also keep the time of the report
+EVENT_FEATURES = {"ipv4-event": IPV4_FEATURES,
+                  "ipv6-event": IPV6_FEATURES,
+                  "tcp-event": TCP_FEATURES,
+                  "tls-event": TLS_FEATURES}
+
+IP_EVENTS = ["ipv4-event", "ipv6-event"]
+
+# Attributes that are kept as strings, all the other attributes are numeric
+EVENT_STRING_FEATURES = ["ip.src", "ip.dst"]
+
+# Maximal number of lines of a mmt-probe report kept in memory at once
+REPORT_CHUNK_SIZE = 100000
+
+# Reports larger than this size (in bytes) are streamed in chunks instead of being loaded at once
+REPORT_CHUNKED_MIN_SIZE = 512 * 1024 * 1024
+
+# Idle time (in seconds) after which the features of a flow are finalized when the report is streamed
+# (the long-session-timeout of mmt-probe, after which mmt-probe closes the session)
+FLOW_IDLE_TIMEOUT = 6000
+
+# Number of processes calculating the features of a report (1: in the calling process)
+FEATURE_EXTRACTION_WORKERS = 1
+# Reports with fewer ip events are calculated in the calling process, as starting the workers would take longer
+PARALLEL_MIN_EVENTS = 50000
+
+# Version of the calculation of the features (to be increased whenever the features of a report change), the cached
+# features of another version (or of another AD_FEATURES) are not reused
+FEATURE_SCHEMA_VERSION = 1
+# Maximal size (in bytes) of the cache of features, the least recently used reports are evicted above it
+FEATURE_CACHE_MAX_SIZE = 2 * 1024 * 1024 * 1024
+
+# Maximal number of models kept loaded by the prediction server (the least recently used is unloaded)
+PREDICTION_MODELS_CACHE_SIZE = 4
+
+# Export of the trained models to TensorFlow Lite (see liteModel.py): quantized variant exported besides the float32
+# model (None, 'float16' or 'int8'), variant used by the predictions and the explanations ('auto': the quantized
+# variant if it passed its check against the Keras model, float32 otherwise), number of test samples
+# the exported models are checked on (and of samples calibrating the int8 variant), minimal agreement of the classes
+# predicted by an exported model and by the Keras model for the exported model to be kept, number of samples given to
+# the interpreter at once, and number of threads of the interpreter
+LITE_MODEL_QUANTIZATION = 'float16'
+LITE_MODEL_VARIANT = 'auto'
+LITE_MODEL_PARITY_SAMPLES = 10000
+LITE_MODEL_CALIBRATION_SAMPLES = 500
+LITE_MODEL_MIN_AGREEMENT = 0.99
+LITE_MODEL_BATCH_SIZE = 4096
+LITE_MODEL_THREADS = None
+
+# Maximal number of models whose XAI artifacts (model, scaled data, explainers) are kept by an XAI server
+XAI_MODELS_CACHE_SIZE = 2
+
+# SHAP explainer of the Keras models: 'gradient' (GradientExplainer, expected gradients), 'deep' (DeepExplainer,
+# DeepLIFT) or 'kernel' (model-agnostic KernelSHAP). The TFLite models have no gradients, they are always
+# explained with KernelSHAP
+XAI_SHAP_KERAS_EXPLAINER = 'gradient'
+
+# KernelSHAP of the SAE-CNN models (kernelShap.BatchKernelExplainer): number of coalitions evaluated per explained
+# sample (None: 2 * number of features + 2048, as shap's 'auto'), maximal size (in bytes) of the synthetic samples
+# predicted at once, and batch size of these predictions
+XAI_SHAP_NSAMPLES = None
+XAI_SHAP_MEMORY_BUDGET = 1024 * 1024 * 1024
+XAI_SHAP_PREDICT_BATCH_SIZE = 8192
+
+# Summary of the training set used as background by the explanations (backgroundSummary.py): 'kmeans' (weighted
+# k-means centers) or 'coreset' (weighted lightweight coreset). The size of the SHAP background is the number of
+# background samples of the request, the LIME explainers are built on XAI_LIME_BACKGROUND_SIZE samples
+XAI_BACKGROUND_METHOD = 'kmeans'
+XAI_LIME_BACKGROUND_SIZE = 1000
+
+# Number of processes explaining the samples of a batch of LIME explanations (xai-lime-batch.py), each process loads
+# the model and its explainer once
+XAI_LIME_BATCH_WORKERS = 4
+
+# Batch prediction of several reports: number of processes calculating the features of the reports, and number of
+# flows above which the features gathered so far are predicted (bounds the memory used by one model.predict call)
+PREDICTION_BATCH_WORKERS = 4
+PREDICTION_BATCH_MAX_FLOWS = 500000
+
+# Online pipeline: number of capture windows waiting between two stages, number of windows analysed by mmt-probe at
+# the same time, maximal number of windows predicted in one batch, and interval (in seconds) between two checks of
+# the capture folder
+ONLINE_QUEUE_SIZE = 4
+ONLINE_PROBE_WORKERS = 2
+ONLINE_BATCH_WINDOWS = 8
+ONLINE_POLL_INTERVAL = 1
+
+# Idle time (in seconds) after which the flows carried across the windows of the online detection are finalized
+# (the default-session-timeout of mmt-probe)
+ONLINE_FLOW_IDLE_TIMEOUT = 60
+
+# Fine-tuning of a deployed model on new samples (retrain.py --finetune): learning rate of the fine-tuning, number of
+# old training samples replayed with the new ones (reservoir sample, 0: no replay), part of the samples kept for the
+# validation, and number of epochs without improvement of the validation loss after which the training stops
+FINETUNE_LEARNING_RATE = 0.0001
+FINETUNE_REPLAY_SIZE = 20000
+FINETUNE_VALIDATION_SPLIT = 0.2
+FINETUNE_PATIENCE = 3
+
+# Training sets streamed from the disk instead of being loaded (featureDataset.py): size (in bytes) from which a
+# training file is streamed (a folder of shards is always streamed), number of samples read at once, and number of
+# samples the shuffling of the stream draws from
+TRAINING_STREAM_MIN_SIZE = 1024 * 1024 * 1024
+TRAINING_CHUNK_ROWS = 65536
+TRAINING_SHUFFLE_BUFFER = 100000
+
+# Training of the SAE-CNN models (training_parameters of the build config: pretrain_sae, freeze_encoders): pre-training
+# of the autoencoders on the normal/malicious samples before the CNN, and whether the pre-trained autoencoders are
+# frozen (or fine-tuned) during the training of the CNN
+SAE_PRETRAINING = False
+SAE_FREEZE_ENCODERS = True
+
+# CPU performance profile of the training (cpuProfile.py, cpu_profile of the training parameters): threads of an
+# operation (None: the cores available to the process) and operations run in parallel, XLA auto-clustering, oneDNN
+# operations (None: default of TensorFlow), bfloat16 mixed precision ('auto': only if the CPU supports bfloat16
+# natively), and selection of the batch size of the CNN by throughput among the batch sizes, each measured over a
+# number of training steps
+CPU_PROFILE = False
+CPU_PROFILE_INTRA_OP_THREADS = None
+CPU_PROFILE_INTER_OP_THREADS = 2
+CPU_PROFILE_XLA = True
+CPU_PROFILE_ONEDNN = True
+CPU_PROFILE_MIXED_PRECISION = 'auto'
+CPU_PROFILE_AUTO_BATCH_SIZE = True
+CPU_PROFILE_BATCH_SIZES = [32, 64, 128, 256, 512, 1024]
+CPU_PROFILE_BATCH_STEPS = 20
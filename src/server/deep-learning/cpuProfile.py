@@ -0,0 +1,200 @@
+"""
+CPU performance profile of the training of the SAE-CNN models (cpu_profile of the training parameters), for the hosts
+training without GPU:
+- thread pools of TensorFlow sized to the cores available to the process,
+- XLA auto-clustering of the operations, and the oneDNN operations of TensorFlow,
+- bfloat16 mixed precision, by default only on the CPUs computing bfloat16 natively (AVX512-BF16, AMX),
+- batch size of the CNN selected by measuring the throughput of the training with several sizes.
+The profile must be applied before TensorFlow runs its first operation (the thread pools cannot be changed afterward),
+and before TensorFlow is imported for the oneDNN setting: trainer.py and retrain.py import sae_cnn once it is applied.
+The duration of the epochs is saved with the results of the training (epoch_times.json), profile or not.
+"""
+import json
+import os
+import sys
+import time
+
+import constants
+
+EPOCH_TIMES_FILE = 'epoch_times.json'
+
+
+def profileSettings(cpu_profile):
+    """
+    :param cpu_profile: cpu_profile of the training parameters: false/None (no profile), true (default settings), or
+    dictionary of the settings to change (intra_op_threads, inter_op_threads, xla, onednn, mixed_precision,
+    auto_batch_size, batch_sizes, batch_steps)
+    :return: settings of the profile, None if there is no profile
+    """
+    if not cpu_profile:
+        return None
+    settings = {
+        'intra_op_threads': constants.CPU_PROFILE_INTRA_OP_THREADS,
+        'inter_op_threads': constants.CPU_PROFILE_INTER_OP_THREADS,
+        'xla': constants.CPU_PROFILE_XLA,
+        'onednn': constants.CPU_PROFILE_ONEDNN,
+        'mixed_precision': constants.CPU_PROFILE_MIXED_PRECISION,
+        'auto_batch_size': constants.CPU_PROFILE_AUTO_BATCH_SIZE,
+        'batch_sizes': constants.CPU_PROFILE_BATCH_SIZES,
+        'batch_steps': constants.CPU_PROFILE_BATCH_STEPS,
+    }
+    if isinstance(cpu_profile, dict):
+        unknown = set(cpu_profile) - set(settings)
+        if unknown:
+            raise ValueError(f"Unknown settings of the CPU profile: {', '.join(sorted(unknown))}")
+        settings.update(cpu_profile)
+    return settings
+
+
+def availableCores():
+    """
+    :return: number of cores the process can run on
+    """
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def nativeBfloat16():
+    """
+    :return: True if the CPU computes bfloat16 natively (AVX512-BF16 or AMX-BF16 flags, Linux only)
+    """
+    try:
+        with open('/proc/cpuinfo') as f:
+            for line in f:
+                if line.startswith('flags'):
+                    flags = line.split(':', 1)[1].split()
+                    return 'avx512_bf16' in flags or 'amx_bf16' in flags
+    except OSError:
+        pass
+    return False
+
+
+def setMixedPrecision(policy_name):
+    """
+    Sets the global dtype policy of both Keras implementations used by sae_cnn.py (tf.keras and the legacy
+    tensorflow.python.keras)
+    """
+    import tensorflow as tf
+    from tensorflow.python.keras.mixed_precision import policy as legacy_policy
+
+    tf.keras.mixed_precision.set_global_policy(policy_name)
+    legacy_policy.set_global_policy(policy_name)
+
+
+def applyProfile(settings):
+    """
+    Applies the settings of a profile to TensorFlow, before its first operation
+
+    :param settings: settings of the profile (see profileSettings), None to keep the defaults of TensorFlow
+    :return: settings actually applied (threads and mixed precision resolved), None if there is no profile
+    """
+    if settings is None:
+        return None
+    applied = dict(settings)
+    if applied['onednn'] is not None:
+        # read by TensorFlow when it is imported: only effective if it is not yet
+        if 'tensorflow' in sys.modules:
+            print("TensorFlow is already imported, TF_ENABLE_ONEDNN_OPTS is left to "
+                  f"{os.environ.get('TF_ENABLE_ONEDNN_OPTS', 'its default')}")
+        else:
+            os.environ['TF_ENABLE_ONEDNN_OPTS'] = '1' if applied['onednn'] else '0'
+
+    import tensorflow as tf
+
+    applied['intra_op_threads'] = applied['intra_op_threads'] or availableCores()
+    applied['inter_op_threads'] = applied['inter_op_threads'] or 1
+    try:
+        tf.config.threading.set_intra_op_parallelism_threads(applied['intra_op_threads'])
+        tf.config.threading.set_inter_op_parallelism_threads(applied['inter_op_threads'])
+    except RuntimeError as e:
+        print(f"The thread pools of TensorFlow are already created, they are not changed: {e}")
+        applied['intra_op_threads'] = tf.config.threading.get_intra_op_parallelism_threads()
+        applied['inter_op_threads'] = tf.config.threading.get_inter_op_parallelism_threads()
+
+    if applied['xla']:
+        tf.config.optimizer.set_jit(True)
+
+    if applied['mixed_precision'] == 'auto':
+        applied['mixed_precision'] = nativeBfloat16()
+    setMixedPrecision('mixed_bfloat16' if applied['mixed_precision'] else 'float32')
+    print(f"CPU profile: {applied}")
+    return applied
+
+
+def trainingThroughput(model, x, y, batch_size, steps):
+    """
+    :return: number of samples per second of the training of the model with batches of batch_size samples
+    """
+    model.train_on_batch(x[:batch_size], y[:batch_size])  # traces the training step
+    nb_batches = max(1, len(x) // batch_size)
+    start = time.perf_counter()
+    for step in range(steps):
+        begin = (step % nb_batches) * batch_size
+        model.train_on_batch(x[begin:begin + batch_size], y[begin:begin + batch_size])
+    return steps * batch_size / (time.perf_counter() - start)
+
+
+def selectBatchSize(model, x, y, batch_sizes, steps):
+    """
+    Measures the throughput of the training of the (compiled) model with each batch size, the weights of the model are
+    restored afterward, its optimizer must be compiled again
+
+    :param x, y: training samples and labels, at least one batch of the smallest size
+    :return: batch size with the best throughput, and the throughput of each batch size
+    """
+    weights = model.get_weights()
+    throughputs = {}
+    for batch_size in sorted(batch_sizes):
+        if batch_size > len(x):
+            break
+        throughputs[batch_size] = trainingThroughput(model, x, y, batch_size, steps)
+        print(f"Batch size {batch_size}: {throughputs[batch_size]:.0f} samples/s")
+    model.set_weights(weights)
+    if not throughputs:
+        return None, throughputs
+    return max(throughputs, key=throughputs.get), throughputs
+
+
+def epochTimer():
+    """
+    :return: Keras callback recording the duration (in seconds) of each epoch in its attribute times
+    """
+    from tensorflow.python.keras.callbacks import Callback
+
+    class EpochTimer(Callback):
+        def __init__(self):
+            super().__init__()
+            self.times = []
+            self.start = None
+
+        def on_epoch_begin(self, epoch, logs=None):
+            self.start = time.perf_counter()
+
+        def on_epoch_end(self, epoch, logs=None):
+            self.times.append(time.perf_counter() - self.start)
+
+    return EpochTimer()
+
+
+def epochStats(times, nb_samples=None, batch_size=None):
+    """
+    :param times: duration of the epochs
+    :param nb_samples: number of training samples of an epoch, None if unknown (streamed training set)
+    :return: statistics of the epochs of a training
+    """
+    stats = {'epochs': times, 'total': sum(times), 'mean': sum(times) / len(times) if times else None,
+             'batch_size': batch_size}
+    if nb_samples is not None and times:
+        stats['samples_per_second'] = nb_samples / stats['mean']
+    return stats
+
+
+def saveEpochTimes(result_path, stats):
+    """
+    Saves the duration of the epochs of the training next to time_stats.txt
+    """
+    statsfile = os.path.join(result_path, EPOCH_TIMES_FILE)
+    with open(statsfile, 'w') as f:
+        json.dump(stats, f, indent=2)
+    print(f"Epoch times saved to {statsfile}")
@@ -5,6 +5,7 @@ import numpy as np
 import pandas as pd
 from sklearn.utils import shuffle
 from file_utils import listFiles
+from featureStore import FEATURE_STORE_EXTENSION, readFeatures, writeFeatures
 sys.path.append(sys.path[0] + '/..')
 # from mmt.readerMMT import pickleFeatureFilesFromFile
 
@@ -16,7 +17,7 @@ Functions creating training and testing datasets
 def createTrainTestSet(pickle_files, training_ratio, dataset_output_path):
     """
     Creates a training and testing .csv files with balanced 0/1 classes
-    :param path: folder with .pkl files (already calculated dataframes with ML features)
+    :param path: folder with .parquet or .pkl files (already calculated dataframes with ML features)
     :param nb_train_samples: number of train samples
     :param nb_test_samples: number of test samples
     :return:
@@ -28,15 +29,15 @@ def createTrainTestSet(pickle_files, training_ratio, dataset_output_path):
     # if norm_rest <= 0:
     #     print('Number of sample must be a positive number')
     #     return False
-    all_pickle_files = listFiles(pickle_files,'.pkl')
+    all_pickle_files = listFiles(pickle_files, FEATURE_STORE_EXTENSION) + listFiles(pickle_files, '.pkl')
     if len(all_pickle_files) <= 0:
-        print('There is no .pkl file in ' + pickle_file_path)
+        print('There is no .parquet or .pkl file in ' + pickle_files)
         return False
     for c_file in all_pickle_files:
         # Reading next file + cleaning data
         print("Processing {}".format(c_file))
         pickle_file_path = str(pickle_files + c_file)
-        data = pd.read_pickle(pickle_file_path)
+        data = readFeatures(pickle_file_path)
         print("Data samples before cleaning: " + str(len(data)))
         data = data[np.isfinite(data).all(1)]  # get rid of inf values
         print("Data samples after cleaning: " + str(len(data)))
@@ -98,8 +99,8 @@ def createTrainTestSet(pickle_files, training_ratio, dataset_output_path):
 
     train = train.replace(np.nan, 0)
     test = test.replace(np.nan, 0)
-    train.to_csv(str(dataset_output_path) + "Train_samples.csv", index=False)
-    test.to_csv(str(dataset_output_path) + "Test_samples.csv", index=False)
+    writeFeatures(train, str(dataset_output_path) + "Train_samples.csv")
+    writeFeatures(test, str(dataset_output_path) + "Test_samples.csv")
 
 
 if __name__ == '__main__':
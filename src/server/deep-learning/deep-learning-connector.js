@@ -28,6 +28,7 @@ const {
 const fs = require('fs');
 const path = require('path');
 const sessionManager = require('../utils/sessionManager');
+const { predictReport, predictReports, closeStream } = require('./prediction-server');
 
 /**
  * The building status
@@ -50,6 +51,21 @@ const predictingStatus = {
   config: null, // the configuration of the last prediction
 };
 
+/**
+ * Id of the stream of reports of the ongoing online prediction in the prediction server (see predictReport)
+ */
+let onlineStream = null;
+
+/**
+ * Release the flows carried by the prediction server for a stream of reports
+ * @param {String} stream id of the stream
+ */
+const releaseStream = (stream) => {
+  closeStream(stream).catch((err) => {
+    console.error(`[prediction-server] Failed to close the stream ${stream}:`, err.message || err);
+  });
+};
+
 /**
  * The retrain status
  */
@@ -140,7 +156,10 @@ const prepareTraining = (buildConfig, callback) => {
  *    nb_epoch_cnn: 5,
  *    nb_epoch_sae: 2,
  *    batch_size_cnn: 16,
- *    batch_size_sae: 32
+ *    batch_size_sae: 32,
+ *    pretrain_sae: false, // optional, pre-train the autoencoders before the CNN
+ *    freeze_encoders: true, // optional, keep the pre-trained autoencoders frozen while training the CNN
+ *    cpu_profile: false // optional, CPU performance profile: true, or settings such as { mixed_precision: true }
  *  }
  * }
  * @param {Function} callback callback function after setting up the building process
@@ -189,6 +208,10 @@ const retrainModel = (retrainConfig, callback) => {
     nb_epoch_sae,
     batch_size_cnn,
     batch_size_sae,
+    pretrain_sae,
+    freeze_encoders,
+    cpu_profile,
+    finetune, // continue the training of the model on the training dataset instead of training a new model
   } = training_parameters;
 
   if (retrainStatus.isRunning) {
@@ -267,7 +290,12 @@ const retrainModel = (retrainConfig, callback) => {
   const logFile = `${LOG_PATH}retraining_${retrainId.replace('.h5', '')}.log`;
   const resultsPath = `${TRAINING_PATH}${retrainId.replace('.h5', '')}/results`;
   createFolderSync(resultsPath);
-  spawnCommand(PYTHON_CMD, [`${DEEP_LEARNING_PATH}/retrain.py`, trainingDatasetFile, testingDatasetFile, resultsPath, nb_epoch_cnn, nb_epoch_sae, batch_size_cnn, batch_size_sae,], logFile, () => {
+  // Fine-tuning replays a sample of the training dataset of the model with the new samples
+  const retrainArgs = finetune
+    ? ['--finetune', inputModelFilePath, trainingDatasetFile, testingDatasetFile, resultsPath, nb_epoch_cnn, batch_size_cnn, path.join(trainingPath, 'Train_samples.csv')]
+    : [trainingDatasetFile, testingDatasetFile, resultsPath, nb_epoch_cnn, nb_epoch_sae, batch_size_cnn, batch_size_sae,
+      JSON.stringify({ pretrain_sae, freeze_encoders, cpu_profile })];
+  spawnCommand(PYTHON_CMD, [`${DEEP_LEARNING_PATH}/retrain.py`, ...retrainArgs], logFile, () => {
     retrainStatus.isRunning = false;
     console.log('Finish retraining the model');
   });
@@ -285,10 +313,61 @@ const stopOnlinePrediction = (callback) => {
   console.log('Going to stop online prediction');
   stopMMT(() => {
     predictingStatus.isRunning = false;
+    if (onlineStream) {
+      // the flows carried across the reports of the online prediction are released by the prediction server
+      releaseStream(onlineStream);
+      onlineStream = null;
+    }
     return callback(predictingStatus);
   });
 };
 
+/**
+ * Predict a report with the prediction server (the model stays loaded between predictions),
+ * fall back to a prediction.py process if the server fails
+ * @param {String} csvPath Path to the report
+ * @param {String} modelPath Path to the model
+ * @param {String} resultPath Path to the location where the prediction output will be stored
+ * @param {String} logPath Path to the log of the prediction
+ * @param {Function} callback called once the prediction is done
+ * @param {String} stream id of the stream of consecutive reports (online prediction), see predictReport
+ */
+const predictWithServer = (csvPath, modelPath, resultPath, logPath, callback, stream = null) => {
+  predictReport(csvPath, modelPath, resultPath, stream)
+    .then((result) => {
+      fs.appendFile(logPath, `Predicted ${result.flows} flows (${result.attacks} attacks) in ${result.time_ms} ms\n`, () => callback());
+    })
+    .catch((err) => {
+      console.error('[prediction-server] Prediction failed, run prediction.py instead:', err.message || err);
+      if (stream) {
+        // the flows carried by the stream miss this report: the next reports start a new stream
+        releaseStream(stream);
+      }
+      spawnCommand(PYTHON_CMD, [`${DEEP_LEARNING_PATH}/prediction.py`, csvPath, modelPath, resultPath], logPath, callback);
+    });
+};
+
+/**
+ * Predict several reports together with the prediction server (the predictions of each report are stored in
+ * resultPath/<report file name>/, see prediction.reportResultFolders), fall back to a prediction.py --batch process if the server fails
+ * @param {Array} reports Paths to the reports, folders of reports or glob patterns
+ * @param {String} modelPath Path to the model
+ * @param {String} resultPath Path to the location where the prediction outputs will be stored
+ * @param {String} logPath Path to the log of the prediction
+ * @param {Function} callback called once the predictions are done
+ */
+const predictReportsWithServer = (reports, modelPath, resultPath, logPath, callback) => {
+  predictReports(reports, modelPath, resultPath)
+    .then((result) => {
+      const nbFlows = Object.values(result.reports).reduce((total, report) => total + report.flows, 0);
+      fs.appendFile(logPath, `Predicted ${Object.keys(result.reports).length} reports (${nbFlows} flows) in ${result.time_ms} ms\n`, () => callback());
+    })
+    .catch((err) => {
+      console.error('[prediction-server] Prediction failed, run prediction.py instead:', err.message || err);
+      spawnCommand(PYTHON_CMD, [`${DEEP_LEARNING_PATH}/prediction.py`, '--batch', modelPath, resultPath, ...reports], logPath, callback);
+    });
+};
+
 /**
  * Start online prediction process
  * - Read the list of completed report file (which has both .csv and .sem files)
@@ -331,9 +410,10 @@ const startOnlinePrediction = (reportPath, modelPath, predictionPath, logPath, c
   // We have the .sem file, going to process the report
   console.log(`Got the sem file: ${currentSemFile}`);
   const csvPath = `${reportPath}/${currentReport}`;
-  spawnCommand(PYTHON_CMD, [`${DEEP_LEARNING_PATH}/prediction.py`, csvPath, modelPath, `${predictionPath}/${currentReport}/`], logPath, () => {
+  // The reports of the online mmt-probe are consecutive windows of the same traffic: the flows are carried over
+  predictWithServer(csvPath, modelPath, `${predictionPath}/${currentReport}/`, logPath, () => {
     startOnlinePrediction(reportPath, modelPath, predictionPath, logPath, currentIndex + 1);
-  });
+  }, predictionPath);
 };
 
 /**
@@ -381,6 +461,17 @@ const startOnlinePrediction = (reportPath, modelPath, predictionPath, logPath, c
  *    }
  *  }
  * }
+ *
+ * - Analyze all the reports of a report folder (predicted together, one result folder per report)
+ * {
+ *  modelId: 'model-01',
+ *  inputTraffic:{
+ *    type: 'reports',
+ *    value: {
+ *      reportId: 'report-tcp_segmented_fpm.pcap-40f5e3ce-d0a7-4cd7-8f98-d9016bbbfd79'
+ *    }
+ *  }
+ * }
  * @param {Function} callback callback function after setting up the predicting process
  */
 const startPredicting = async (predictConfig, callback) => {
@@ -416,7 +507,7 @@ const startPredicting = async (predictConfig, callback) => {
               // Create session in session manager
               const session = sessionManager.createSession('prediction', predictionId, 'offline', { config: predictConfig });
               
-              spawnCommand(PYTHON_CMD, [`${DEEP_LEARNING_PATH}/prediction.py`, csvPath, modelPath, predictionPath], logFile, () => {
+              predictWithServer(csvPath, modelPath, predictionPath, logFile, () => {
                 // Mark session as completed
                 sessionManager.completeSession('prediction', predictionId);
               });
@@ -431,6 +522,31 @@ const startPredicting = async (predictConfig, callback) => {
             }
           });
           break;
+        case 'reports':
+          // All the .csv reports of a report folder, predicted together
+          // eslint-disable-next-line no-case-declarations
+          const reportFolder = `${REPORT_PATH}/${value.reportId}`;
+          isFileExist(reportFolder, async (folder) => {
+            if (!folder) {
+              callback({
+                error: `The input traffic ${JSON.stringify(value)} doest not exist`,
+              });
+            } else {
+              const session = sessionManager.createSession('prediction', predictionId, 'offline', { config: predictConfig });
+
+              predictReportsWithServer([reportFolder], modelPath, predictionPath, logFile, () => {
+                sessionManager.completeSession('prediction', predictionId);
+              });
+
+              callback({
+                isRunning: session.isRunning,
+                lastPredictedAt: session.createdAt,
+                lastPredictedId: session.sessionId,
+                config: session.config
+              });
+            }
+          });
+          break;
         case 'online':
           // Start MMTOnline
           // eslint-disable-next-line no-case-declarations
@@ -457,6 +573,9 @@ const startPredicting = async (predictConfig, callback) => {
                 config: session.config
               });
               
+              // a new online prediction never continues the flows of a previous one with the same prediction path
+              releaseStream(predictionPath);
+              onlineStream = predictionPath;
               startOnlinePrediction(csvRootPath, modelPath, predictionPath, logFile, 0);
             }
           });
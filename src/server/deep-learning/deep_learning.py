@@ -6,6 +6,8 @@ from pathlib import Path
 from trafficToFeature import trafficToFeatures
 from createDatasetMMT import createTrainTestSet
 from trainer import train_model
+from featureStore import FEATURE_FILE_EXTENSION
+import constants
 
 deepLearningPath = str(Path.cwd()) + '/src/server/deep-learning/'
 
@@ -40,7 +42,9 @@ def train_model_from_csv(datasets, training_ratio, buildId, training_parameters
   Args:
     datasets (Array): List of dataset to be used for training
     training_ratio (Number): the ratio of training dataset and testing dataset
-    training_parameters (Object): Parameter for training
+    training_parameters (Object): Parameter for training (optional pretrain_sae and freeze_encoders: pre-training of
+      the autoencoders, frozen or fine-tuned during the training of the CNN; optional cpu_profile: CPU performance
+      profile of the training, see cpuProfile.profileSettings)
   """
   print('Build id: ' + buildId)
   # Prepare locations
@@ -50,9 +54,9 @@ def train_model_from_csv(datasets, training_ratio, buildId, training_parameters
   for dtset in datasets:
     csvPath = dtset['csvPath']
     isAttack = dtset['isAttack']
-    pickle_file_path = os.path.join(output_pickle_files_location, os.path.basename(csvPath).split('/')[-1] + '.pkl')
+    pickle_file_path = os.path.join(output_pickle_files_location, os.path.basename(csvPath).split('/')[-1] + FEATURE_FILE_EXTENSION)
     trafficToFeatures(csvPath, pickle_file_path, isAttack)
-    print('A new pickle file at: ' + pickle_file_path + '(' + str(isAttack) + ')')
+    print('A new features file at: ' + pickle_file_path + '(' + str(isAttack) + ')')
 
   # Create dataset
   createTrainTestSet(output_pickle_files_location, training_ratio, output_datasets_location)
@@ -60,7 +64,10 @@ def train_model_from_csv(datasets, training_ratio, buildId, training_parameters
   train_data_path = os.path.join(output_datasets_location,'Train_samples.csv')
   test_data_path = os.path.join(output_datasets_location,'Test_samples.csv')
   # training model
-  train_model(train_data_path, test_data_path, output_result_location,training_parameters['nb_epoch_cnn'], training_parameters['nb_epoch_sae'], training_parameters['batch_size_cnn'],training_parameters['batch_size_sae'])
+  train_model(train_data_path, test_data_path, output_result_location,training_parameters['nb_epoch_cnn'], training_parameters['nb_epoch_sae'], training_parameters['batch_size_cnn'],training_parameters['batch_size_sae'],
+              pretrain_sae=training_parameters.get('pretrain_sae', constants.SAE_PRETRAINING),
+              freeze_encoders=training_parameters.get('freeze_encoders', constants.SAE_FREEZE_ENCODERS),
+              cpu_profile=training_parameters.get('cpu_profile', constants.CPU_PROFILE))
   print('New model has been created at: ' + output_result_location)
   shutil.copy(output_result_location + 'model.h5', os.path.join(deepLearningPath, 'models', buildId +'.h5'))
   return buildId
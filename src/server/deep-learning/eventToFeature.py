@@ -1,10 +1,13 @@
+import csv
+import os
 import sys
 import numpy
 from pathlib import Path
 import pandas as pd
-from scipy.stats import entropy
 import constants
+from flowFeatures import FLOW_KEYS, FlowFeatureAccumulator, packetDeltas
 import argparse
+from concurrent.futures import ProcessPoolExecutor
 
 sys.path.append(sys.path[0] + '/..')
 
@@ -14,7 +17,7 @@ from python_logger import get_logger
 
 logger = get_logger('eventToFeature')
 
-def calculateFeatures(ip_traffic, tcp_traffic, tls_traffic):
+def calculateFeatures(ip_traffic, tcp_traffic, tls_traffic, workers=None):
     """
     Calculates ML features based on traffic extracted from mmt-probe .csv. Features are calculated per flow and direction
     where direction is identified by mmt-probe. Remark: features are calculated and returned including the direction
@@ -23,389 +26,153 @@ def calculateFeatures(ip_traffic, tcp_traffic, tls_traffic):
     :param ip_traffic:
     :param tcp_traffic:
     :param tls_traffic:
+    :param workers: number of processes calculating the features, the events are partitioned by hash of ip.session_id
+    between them (by default constants.FEATURE_EXTRACTION_WORKERS, 1 calculates them in the current process)
     :return: Ip of flows and dataframe with ML features (per flow+direction)
     """
+    # Packet Time: time between each ip packet and the previous one in the report
+    # (calculated before partitioning, as it does not depend on the flow of the packets)
+    ip_traffic = ip_traffic.assign(delta=packetDeltas(ip_traffic['time']))
+
+    if workers is None:
+        workers = constants.FEATURE_EXTRACTION_WORKERS
+    if workers <= 1 or len(ip_traffic) < constants.PARALLEL_MIN_EVENTS:
+        return _shardFeatures((ip_traffic, tcp_traffic, tls_traffic))
+
+    shards = [_sessionShards(traffic, workers) for traffic in (ip_traffic, tcp_traffic, tls_traffic)]
+    logger.debug(f"Calculate features of {len(ip_traffic)} ip events with {workers} workers")
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = [result for result in pool.map(_shardFeatures, zip(*shards)) if len(result[1]) > 0]
+    # Sessions are in one shard only, sorting by flow gives the same order as the single process calculation
+    ips = pd.concat([flows_ips for flows_ips, _ in results], ignore_index=True)
+    features = pd.concat([flows_features for _, flows_features in results], ignore_index=True)
+    ips = ips.sort_values(FLOW_KEYS, ignore_index=True)
+    features = features.sort_values(FLOW_KEYS, ignore_index=True)
+    return ips, features
 
-    # Bins of packet lengths and time between packets based on
-    # "MalDetect: A Structure of Encrypted Malware Traffic Detection" by Jiyuan Liu et al.
-
-    bins_len = [0, 150, 300, 450, 600, 750, 900, 1050, 1200, 1350, 1500, 10000]
-    bins_time = [0, 50, 100, 150, 200, 250, 300, 350, 400, 450, 500, 550]
-    #print("traffic")
-    #print(ip_traffic)
-    #print(ip_traffic["meta.direction"])
-    ## saving unique ips based on ip_traffic
-    ips = ip_traffic.groupby(["ip.session_id", "meta.direction"])[["ip.src", "ip.dst"]].apply(
-                                                                                        lambda x: list(numpy.unique(x)))
-    ips = ips.to_frame().reset_index()
-    ips.columns = ["ip.session_id", "meta.direction", "ip"]
-    ips["ip.session_id"] = ips["ip.session_id"].astype(int)
-    #print("Features (IPS):")
-    #print(ips)
-    #print(ips["meta.direction"])
-    ips["meta.direction"] = ips["meta.direction"].astype(int)
-    ip_traffic.drop(columns=["ip.src", "ip.dst"], inplace=True)
-
-    ip_traffic = ip_traffic.apply(pd.to_numeric)
-    tcp_traffic = tcp_traffic.apply(pd.to_numeric)
-    tls_traffic = tls_traffic.apply(pd.to_numeric)
-    ip_traffic['meta.direction'] = ip_traffic['meta.direction'].astype(int)
-    tcp_traffic['meta.direction'] = tcp_traffic['meta.direction'].astype(int)
-    tcp_traffic['tcp.src_port'] = tcp_traffic['tcp.src_port'].astype(int)
-    tcp_traffic['tcp.dest_port'] = tcp_traffic['tcp.dest_port'].astype(int)
-    tls_traffic['meta.direction'] = tls_traffic['meta.direction'].astype(int)
-
-    ## deleting tcp and tls samples that have ip.session_id that was not present in ip_traffic (means that ip.session_id is wrongly assigned?)
-    ids_tcp = tcp_traffic["ip.session_id"].unique().tolist()
-    ids_ip = ip_traffic["ip.session_id"].unique().tolist()
-    ids_tls = tls_traffic["ip.session_id"].unique().tolist()
-    diff_tcp = set(ids_tcp) - set(ids_ip)
-    diff_tls = set(ids_tls) - set(ids_ip)
-    tcp_traffic = tcp_traffic[~tcp_traffic['ip.session_id'].isin(diff_tcp)]
-    tls_traffic = tls_traffic[~tls_traffic['ip.session_id'].isin(diff_tls)]
-
-    ip_traffic.set_index(["ip.session_id", "meta.direction"], inplace=True)
-    tcp_traffic.set_index(["ip.session_id", "meta.direction"], inplace=True)
-
-    ## Overall counters
-    # total_traffic_nb = any_traffic['time'].count()  ## total number of any packets in csv
-    # ip_total_nb = ip_traffic.groupby("ip.session_id")['time'].count().sum()  ## total number of ip packets in csv
-    ip_pkts_per_flow = ip_traffic.groupby(["ip.session_id", "meta.direction"])['time'].count().reset_index().rename(
-        columns={"time": "ip.pkts_per_flow"})  ## number of ip packets per session id
-
-    ## Duration of flow: time between first and last received packet in one flow (i.e. in one direction per one session id)
-    duration = ip_traffic.groupby(["ip.session_id", "meta.direction"])[
-        ['ip.first_packet_time']].min().reset_index().merge(
-        ip_traffic.groupby(["ip.session_id", "meta.direction"])[['ip.last_packet_time']].max().reset_index())
-    duration['duration'] = duration['ip.last_packet_time'] - duration['ip.first_packet_time']
-
-    features = ip_pkts_per_flow.merge(duration).drop(columns=['ip.first_packet_time', 'ip.last_packet_time'])
-    duration = duration.iloc[0:0]
-    ip_total_per_session = ip_pkts_per_flow.iloc[0:0]
-
-    #####
-    ip_header_len = ip_traffic.groupby(["ip.session_id", "meta.direction"])["ip.header_len"].sum().reset_index()
-    features = features.merge(ip_header_len)
-
-    ip_tot_len = ip_traffic.groupby(["ip.session_id", "meta.direction"])["ip.tot_len"].sum().reset_index().rename(
-        columns={"ip.tot_len": "ip.bytes_tot_len"})  ### ?? TODO
-    ip_tot_len["ip.payload_len"] = ip_tot_len["ip.bytes_tot_len"] - ip_header_len["ip.header_len"]
-    ip_tot_len = ip_tot_len.drop(columns='ip.bytes_tot_len')
-    features = features.merge(ip_tot_len)
-    ip_header_len = ip_header_len.iloc[0:0]
-    ip_tot_len = ip_tot_len.iloc[0:0]
-
-    ip_avg_len = ip_traffic.groupby(["ip.session_id"])["ip.tot_len"].mean().reset_index().rename(
-        columns={"ip.tot_len": "ip.avg_bytes_tot_len"})
-    features = features.merge(ip_avg_len)
-    ip_avg_len = ip_avg_len.iloc[0:0]
-
-    # Packet Time
-    ip_traffic['delta'] = (ip_traffic['time'] - ip_traffic['time'].shift()).fillna(0)
-    ip_traffic['delta'] = ip_traffic['delta'] * 1000  # seconds to ms
-    # df = ip_traffic.copy()
-    # df = ip_traffic[['ip.session_id', 'meta.direction', 'delta']].copy()
-    df = ip_traffic[['delta']].copy()
-    #####
-
-    #print("Times between packets")
-    time_between_pkts_sum = df.groupby(['ip.session_id', 'meta.direction'])['delta'].sum().reset_index().rename(
-        columns={"delta": "time_between_pkts_sum"})
-    time_between_pkts_avg = df.groupby(['ip.session_id', 'meta.direction'])['delta'].mean().reset_index().rename(
-        columns={"delta": "time_between_pkts_avg"})
-    time_between_pkts_max = df.groupby(['ip.session_id', 'meta.direction'])['delta'].max().reset_index().rename(
-        columns={"delta": "time_between_pkts_max"})
-    time_between_pkts_min = df.groupby(['ip.session_id', 'meta.direction'])['delta'].min().reset_index().rename(
-        columns={"delta": "time_between_pkts_min"})
-    time_between_pkts_std = df.groupby(['ip.session_id', 'meta.direction'])['delta'].std().reset_index().rename(
-        columns={"delta": "time_between_pkts_std"})
-
-    features = features.merge(time_between_pkts_sum)
-    features = features.merge(time_between_pkts_avg)
-    features = features.merge(time_between_pkts_max)
-    features = features.merge(time_between_pkts_min)
-    features = features.merge(time_between_pkts_std)
-
-    time_between_pkts_sum = time_between_pkts_sum[0:0]
-    time_between_pkts_avg = time_between_pkts_avg[0:0]
-    time_between_pkts_max = time_between_pkts_max[0:0]
-    time_between_pkts_min = time_between_pkts_min[0:0]
-    time_between_pkts_std = time_between_pkts_std[0:0]
-
-    #print("SPTime Sequence")
-    # Fix for pandas compatibility: use apply instead of value_counts with groupby
-    def count_time_bins(x):
-        return pd.cut(x, bins=bins_time, duplicates='drop').value_counts(sort=False)
-    
-    time = df.groupby(['ip.session_id', 'meta.direction'])['delta'].apply(count_time_bins)
-    df = df.iloc[0:0]
-    
-    # Convert the result to a proper DataFrame for pivot_table
-    time = time.reset_index()
-    time.columns = ['ip.session_id', 'meta.direction', 'delta', 'county']
-    
-    sptime = time.pivot_table(index=['ip.session_id', 'meta.direction'], columns='delta',
-                              values='county')  # ,fill_value=0)
-    sptime.columns = sptime.columns.astype(str)
-    sptime = sptime.reset_index()
-
-    features = features.merge(sptime)
-    time = time.iloc[0:0]
-    sptime = sptime.iloc[0:0]
-
-    if not tcp_traffic.empty:
-        #print("TCP features")
-
-        # TCP packets number per flow
-        tcp_pkts_per_flow = tcp_traffic.groupby(["ip.session_id", "meta.direction"])[
-            ['tcp.src_port']].count().reset_index().rename(
-            columns={
-                "tcp.src_port": "tcp_pkts_per_flow"})  ## number of tcp packets per flow, and per direction (0 = client->server)
-
-        features = pd.merge(features, tcp_pkts_per_flow, how='outer', left_on=["ip.session_id", "meta.direction"],
-                            right_on=["ip.session_id", "meta.direction"])
-
-        features['pkts_rate'] = features['tcp_pkts_per_flow'] / features['duration']
-
-        tcp_pkts_per_flow = tcp_pkts_per_flow.iloc[0:0]
-
-        # # TCP bytes sum per flow
-        tcp_bytes_per_flow = tcp_traffic.groupby(["ip.session_id", "meta.direction"])[
-            ['tcp.payload_len']].sum().reset_index().rename(
-            columns={
-                "tcp.payload_len": "tcp_bytes_per_flow"})  ## sum of tcp bytes per flow per direction (0 = client->server)
-
-        features = pd.merge(features, tcp_bytes_per_flow, how='outer', on=["ip.session_id", "meta.direction"])
-
-        features['byte_rate'] = features['tcp_pkts_per_flow'] / features['duration']
-        tcp_bytes_per_flow = tcp_bytes_per_flow.iloc[0:0]
-
-        features = features.merge(tcp_traffic.groupby(['ip.session_id', 'meta.direction'])[
-                                      'tcp.tcp_session_payload_up_len'].count().reset_index(), how='outer', on=["ip.session_id", "meta.direction"])
-        features = features.merge(tcp_traffic.groupby(['ip.session_id', 'meta.direction'])[
-                                      'tcp.tcp_session_payload_down_len'].count().reset_index(), how='outer', on=["ip.session_id", "meta.direction"])
-
-        ## Sequence: Packet length and time sequences counted in bins, each bin stored as separate column
-        # Packet length
-
-        #print("SPL Sequence")
-        # print("tcp_traffic - number of columns: " + str(len(tcp_traffic.columns)))
-        # print("tcp_traffic - number of rows: " + str(len(tcp_traffic.index)))
-        # tcp_traffic.to_csv('tcp_traffic.csv')
-        
-        # Fix for pandas compatibility: use apply instead of value_counts with groupby
-        def count_bins(x):
-            return pd.cut(x, bins=bins_len, duplicates='drop').value_counts(sort=False)
-        
-        packet_len = tcp_traffic.groupby(['ip.session_id', 'meta.direction'])['tcp.payload_len'].apply(count_bins)
-        
-        # Convert the result to a proper DataFrame for pivot_table
-        packet_len = packet_len.reset_index()
-        packet_len.columns = ['ip.session_id', 'meta.direction', 'tcp.payload_len', 'county']
-
-        # pivot_table to get columns out of segregated and divided packet lengths
-        spl = packet_len.pivot_table(index=['ip.session_id', 'meta.direction'], columns='tcp.payload_len',
-                              values='county')  # ,fill_value=0)
-        packet_len = packet_len.iloc[0:0]
-        spl.columns = spl.columns.astype(str)
-        spl = spl.reset_index()
-
-        features = pd.merge(features, spl, how='outer', left_on=["ip.session_id", "meta.direction"],
-                            right_on=["ip.session_id", "meta.direction"])
-        spl = spl.iloc[0:0]
-
-        #print("Flags")
-        # Flags: counts the number of turned on flags for each session and direction
-        flag_list = ['tcp.fin', 'tcp.syn', 'tcp.rst', 'tcp.psh', 'tcp.ack', 'tcp.urg']
-        tcp_flags_cnt_flow = tcp_traffic.groupby(['ip.session_id', 'meta.direction'])[flag_list].aggregate(
-            lambda g: g.eq(
-                1.0).sum()).reset_index()  # .drop(columns=['tcp.src_port', 'tcp.dest_port', 'tcp.payload_len','tcp.tcp_session_payload_up_len', 'tcp.tcp_session_payload_down_len'])
-
-        features = pd.merge(features, tcp_flags_cnt_flow, how='outer', left_on=["ip.session_id", "meta.direction"],
-                            right_on=["ip.session_id", "meta.direction"])
-        tcp_flags_cnt_flow = tcp_flags_cnt_flow.iloc[0:0]
-
-        ## Source and destination ports greater/less or equal to 1024 ( > ephemeral ports)
-        # src ports
-        #print("Ports")
-        # tcp_traffic.groupby(['ip.session_id', 'meta.direction'])[['tcp.src_port']].apply(lambda x: len(x[x>3])/len(x) )
-        sports = tcp_traffic.groupby(['ip.session_id', 'meta.direction'])[['tcp.src_port']].apply(
-            lambda x: (x > 1024).sum()).reset_index().rename(columns={'tcp.src_port': 'sport_g'}).merge(
-            tcp_traffic.groupby(['ip.session_id', 'meta.direction'])[['tcp.src_port']].agg(
-                lambda x: (x <= 1024).sum()).reset_index().rename(columns={'tcp.src_port': 'sport_le'})
-        )
-
-        features = pd.merge(features, sports, how='outer', left_on=["ip.session_id", "meta.direction"],
-                            right_on=["ip.session_id", "meta.direction"])
-
-        sports = sports.iloc[0:0]
-
-        # dest port
-        dports = tcp_traffic.groupby(['ip.session_id', 'meta.direction'])[['tcp.dest_port']].apply(
-            lambda x: (x > 1024).sum()).reset_index().rename(columns={'tcp.dest_port': 'dport_g'}).merge(
-            tcp_traffic.groupby(['ip.session_id', 'meta.direction'])[['tcp.dest_port']].agg(
-                lambda x: (x <= 1024).sum()).reset_index().rename(columns={'tcp.dest_port': 'dport_le'})
-        )
-        features = pd.merge(features, dports, how='outer', left_on=["ip.session_id", "meta.direction"],
-                            right_on=["ip.session_id", "meta.direction"])
-        dports = dports.iloc[0:0]
-
-        #print("Min/max pkts")
-
-        mean_tcp_pkts = tcp_traffic.groupby(['ip.session_id', 'meta.direction'])[
-            'tcp.src_port'].mean().reset_index().rename(
-            columns={"tcp.src_port": "mean_tcp_pkts"})
-        std_tcp_pkts = tcp_traffic.groupby(['ip.session_id', 'meta.direction'])[
-            'tcp.src_port'].std().reset_index().rename(
-            columns={"tcp.src_port": "std_tcp_pkts"})
-        min_tcp_pkts = tcp_traffic.groupby(['ip.session_id', 'meta.direction'])[
-            'tcp.src_port'].min().reset_index().rename(
-            columns={"tcp.src_port": "min_tcp_pkts"})
-        max_tcp_pkts = tcp_traffic.groupby(['ip.session_id', 'meta.direction'])[
-            'tcp.src_port'].max().reset_index().rename(
-            columns={"tcp.src_port": "max_tcp_pkts"})
-
-        features = features.merge(mean_tcp_pkts, how='outer', on=["ip.session_id", "meta.direction"])
-        features = features.merge(std_tcp_pkts, how='outer', on=["ip.session_id", "meta.direction"])
-        features = features.merge(min_tcp_pkts, how='outer', on=["ip.session_id", "meta.direction"])
-        features = features.merge(max_tcp_pkts, how='outer', on=["ip.session_id", "meta.direction"])
-        mean_tcp_pkts = mean_tcp_pkts[0:0]
-        std_tcp_pkts = std_tcp_pkts[0:0]
-        min_tcp_pkts = min_tcp_pkts[0:0]
-        max_tcp_pkts = max_tcp_pkts[0:0]
-
-        #print("Entropy pkts")
-        entropy_tcp_pkts = tcp_traffic.groupby(['ip.session_id', 'meta.direction'])['tcp.src_port'].apply(
-            lambda x: entropy(
-                x.value_counts(), base=2)).to_frame().reset_index().rename(columns={'tcp.src_port': 'entropy_tcp_pkts'})
-        features = pd.merge(features, entropy_tcp_pkts, how='outer', left_on=["ip.session_id", "meta.direction"],
-                            right_on=["ip.session_id", "meta.direction"])
-
-        entropy_tcp_pkts = entropy_tcp_pkts.iloc[0:0]
-
-        # Min, max, std and mean of packet length in each session+direction
-        #print("Min/max pkts")
-        mean_tcp_len = tcp_traffic.groupby(['ip.session_id', 'meta.direction'])[
-            'tcp.payload_len'].mean().reset_index().rename(
-            columns={"tcp.payload_len": "mean_tcp_len"})
-        std_tcp_len = tcp_traffic.groupby(['ip.session_id', 'meta.direction'])[
-            'tcp.payload_len'].std().reset_index().rename(
-            columns={"tcp.payload_len": "std_tcp_len"})
-        min_tcp_len = tcp_traffic.groupby(['ip.session_id', 'meta.direction'])[
-            'tcp.payload_len'].min().reset_index().rename(
-            columns={"tcp.payload_len": "min_tcp_len"})
-        max_tcp_len = tcp_traffic.groupby(['ip.session_id', 'meta.direction'])[
-            'tcp.payload_len'].max().reset_index().rename(
-            columns={"tcp.payload_len": "max_tcp_len"})
-        features = features.merge(mean_tcp_len, how='outer', left_on=["ip.session_id", "meta.direction"],
-                            right_on=["ip.session_id", "meta.direction"])
-        features = features.merge(std_tcp_len, how='outer', left_on=["ip.session_id", "meta.direction"],
-                            right_on=["ip.session_id", "meta.direction"])
-        features = features.merge(min_tcp_len, how='outer', left_on=["ip.session_id", "meta.direction"],
-                            right_on=["ip.session_id", "meta.direction"])
-        features = features.merge(max_tcp_len, how='outer', left_on=["ip.session_id", "meta.direction"],
-                            right_on=["ip.session_id", "meta.direction"])
-        mean_tcp_len = mean_tcp_len[0:0]
-        std_tcp_len = std_tcp_len[0:0]
-        min_tcp_len = min_tcp_len[0:0]
-        max_tcp_len = max_tcp_len[0:0]
-
-        #print("Entropy len")
-
-        #TODO: if MMT-probe will be able to provide any other attributes of TLS traffic they should be processed here
-        if not tls_traffic.empty:
-            #print("TLS features")
-            # TLS packets number per flow
-            tls_pkts_per_flow = tls_traffic.groupby(["ip.session_id", "meta.direction"])[
-                ['ssl.tls_version']].count().reset_index().rename(
-                columns={"time": "tls_pkts_per_flow"})
-
-            features = pd.merge(features, tls_pkts_per_flow, how='outer', on=["ip.session_id", "meta.direction"])
-            tls_pkts_per_flow = tls_pkts_per_flow.iloc[0:0]
-
-    #Features should have always same columns (as predefined), hence in case some features were not calculated due to
-    # the lack of data (e.g. no TCP packets) the columns should be added anyway filled with 0 values
-    features = features.reindex(features.columns.union(constants.AD_FEATURES[3:], sort=False), axis=1, fill_value=0)
-
-    # ips = features['ip.session_id', 'meta.direction']
-    # features.drop(columns=['ip.session_id', 'meta.direction'], inplace=True)
-    # features.reset_index(inplace=True)
-    # features.drop(columns=['delta'], inplace=True)
-
-    #print("Created {} feature samples".format(features.shape[0]))
 
-    return ips, features
+def _sessionShards(traffic, nb_shards):
+    """
+    Partitions events by hash of their ip.session_id, hence all the events of a session are in the same shard.
+    """
+    shard_ids = pd.util.hash_pandas_object(traffic["ip.session_id"], index=False).to_numpy() % nb_shards
+    return [traffic[shard_ids == shard] for shard in range(nb_shards)]
 
-def readMMTReportFile(csv_path):
+
+def _shardFeatures(traffic):
+    """
+    Calculates the features of the flows of (ip, tcp, tls) events, the ip events must contain the delta column.
+    """
+    accumulator = FlowFeatureAccumulator()
+    accumulator.update(*traffic)
+    return accumulator.features()
+
+
+def _eventFrame(report_name, rows):
     """
-    Reads .csv report from MMT-probe, since the columns in .csv can have variable length it takes the maximal possible
-    length.
+    Builds a typed dataframe of one event from the raw (string) rows collected by readMMTReportChunks.
+
+    :param report_name: name of the event (key of constants.EVENT_FEATURES)
+    :param rows: list of rows, each being the list of attribute values of the event
+    :return: DataFrame with the attributes of the event as columns
+    """
+    columns = constants.EVENT_FEATURES[report_name]
+    if not rows:
+        return pd.DataFrame(columns=columns)
+    values = list(zip(*rows))
+    data = {}
+    for col, col_values in zip(columns, values):
+        if col in constants.EVENT_STRING_FEATURES:
+            data[col] = numpy.array(col_values, dtype=object)
+        else:
+            data[col] = pd.to_numeric(numpy.array(col_values, dtype=object))
+    return pd.DataFrame(data, columns=columns)
+
+
+def readMMTReportChunks(csv_path, chunk_size=constants.REPORT_CHUNK_SIZE):
+    """
+    Reads .csv report from MMT-probe in a single pass. Each line is routed by its report id and event name directly
+    into the buffer of its event, so the memory used is bounded by the chunk size and not by the size of the report.
+    Security reports (id 10) are appended to security-reports.csv next to the report.
 
     :param csv_path: path to the .csv mmt probe report
-    :return: DataFrame with all data from .csv
+    :param chunk_size: maximal number of lines kept in memory before being converted into typed dataframes
+    :return: generator of dictionaries event name -> DataFrame with the attributes of the events of one chunk
     """
-    with open(csv_path, 'r') as temp:
-        col_count = [len(l.split(",")) for l in temp.readlines()]
-        # print("col_count")
-        # print(col_count)
-        col_names = [i for i in range(0, max(col_count))]
-        types_dict = {'0': int, '1': int, '2': "string", '3': 'float', '4': 'string'}
-        types_dict.update({col: str for col in col_names if col not in types_dict})
-        df = pd.read_csv(csv_path, header=None, delimiter=",", names=col_names, dtype=types_dict)
-        #print("Read {} lines".format(df.shape[0]))
-        return df
-
-
-def extractReport(df, report_name):
+    security_path = Path.joinpath(Path(csv_path).parent.absolute(), "security-reports.csv")
+    security_file = None
+    buffers = {report_name: [] for report_name in constants.EVENT_FEATURES}
+    nb_lines = 0
+    try:
+        with open(csv_path, 'r', newline='') as report:
+            for line in csv.reader(report):
+                if not line:
+                    continue
+                if line[0] == "10":
+                    if security_file is None:
+                        security_file = open(security_path, 'a', newline='')
+                        security_writer = csv.writer(security_file)
+                    security_writer.writerow(line)
+                    continue
+                if line[0] != "1000" or len(line) < 5:
+                    continue
+                report_name = line[4]
+                if report_name not in buffers:
+                    continue
+                # ip events keep the time (4th column) of the report, other events only their attributes
+                if report_name in constants.IP_EVENTS:
+                    values = [line[3]] + line[5:]
+                else:
+                    values = line[5:]
+                if len(values) != len(constants.EVENT_FEATURES[report_name]):
+                    continue
+                buffers[report_name].append(values)
+                nb_lines += 1
+                if nb_lines >= chunk_size:
+                    yield {name: _eventFrame(name, rows) for name, rows in buffers.items()}
+                    buffers = {report_name: [] for report_name in constants.EVENT_FEATURES}
+                    nb_lines = 0
+        if nb_lines > 0:
+            yield {name: _eventFrame(name, rows) for name, rows in buffers.items()}
+    finally:
+        if security_file is not None:
+            security_file.close()
+
+
+def readMMTReportFile(csv_path):
     """
-    Function extracting a proper dataframe with mmt-probe attributes about particular report (based on report_name).
+    Reads .csv report from MMT-probe and returns one typed dataframe per event.
 
-    :param df: DataFrame with all data from .csv
-    :param report_name: report to extract - possible values are in accordance with events predefined at the beginning of
-    the script : (currently) tls_event, tcp_event, ipv4_event, ipv6_event
-    :return:
+    :param csv_path: path to the .csv mmt probe report
+    :return: dictionary event name -> DataFrame with all the attributes of this event in the .csv
     """
-    new_df = df[df[4] == report_name].copy()
-    # if report_name == "any-event":
-    #     if not new_df.empty:
-    #         new_df.columns = any_event  ##colnames from mmt-probe conf file
-    #     else:
-    #         new_df = pd.DataFrame(columns=any_event)
-    if report_name == "ipv4-event":
-        new_df.drop(columns=[0, 1, 2, 4],
-                    inplace=True)  # ignoring 3 first columns (report id, ?, filepath) and 5th (report name)
-        new_df.dropna(axis=1, inplace=True)
-        # print(new_df)
-        if not new_df.empty:
-            new_df.columns = constants.IPV4_FEATURES  ##colnames from mmt-probe conf file
+    frames = {report_name: [] for report_name in constants.EVENT_FEATURES}
+    for chunk in readMMTReportChunks(csv_path):
+        for report_name, df in chunk.items():
+            if not df.empty:
+                frames[report_name].append(df)
+    events = {}
+    for report_name, dfs in frames.items():
+        if dfs:
+            events[report_name] = pd.concat(dfs, ignore_index=True)
         else:
-            new_df = pd.DataFrame(columns=constants.IPV4_FEATURES)
-
-    elif report_name == "ipv6-event":
-        new_df.drop(columns=[0, 1, 2, 4],
-                    inplace=True)  # ignoring 3 first columns (report id, ?, filepath) and 5th (report name)
-        new_df.dropna(axis=1, inplace=True)
-        # print(new_df)
-        if not new_df.empty:
-            new_df.columns = constants.IPV6_FEATURES  ##colnames from mmt-probe conf file
-        else:
-            new_df = pd.DataFrame(columns=constants.IPV6_FEATURES)
+            events[report_name] = pd.DataFrame(columns=constants.EVENT_FEATURES[report_name])
+    return events
 
-    else:
-        new_df.drop(columns=[0, 1, 2, 3, 4],
-                    inplace=True)  # ignoring 3 first columns (report id, ?, time, filepath) and 5th (report name)
-        new_df.dropna(axis=1, inplace=True)
-        if report_name == "tcp-event":
-            if not new_df.empty:
-                new_df.columns = constants.TCP_FEATURES  ##colnames from mmt-probe conf file
-            else:
-                new_df = pd.DataFrame(columns=constants.TCP_FEATURES)
-        elif report_name == "tls-event":
-            if not new_df.empty:
-                new_df.columns = constants.TLS_FEATURES  ##colnames from mmt-probe conf file
-            else:
-                new_df = pd.DataFrame(columns=constants.TLS_FEATURES)
-    return new_df
+
+def mergeIpEvents(ipv4_traffic, ipv6_traffic):
+    """
+    Merges ipv4 and ipv6 events into one ip-event dataframe, the attributes missing in ipv6 events are filled with 0
+
+    :param ipv4_traffic: DataFrame of ipv4-event
+    :param ipv6_traffic: DataFrame of ipv6-event
+    :return: DataFrame of ip events
+    """
+    ip_traffic = pd.concat([ipv4_traffic, ipv6_traffic], sort=False, ignore_index=True)
+    ip_traffic = ip_traffic.replace(numpy.nan, 0)
+    for col in ["ip.header_len", "ip.tot_len"]:
+        ip_traffic[col] = ip_traffic[col].astype('int64')
+    return ip_traffic
 
 
 def readAndExtractEvents(path):
@@ -416,35 +183,86 @@ def readAndExtractEvents(path):
     :param path: path to .csv created by MMT-probe
     :return: ip_traffic, tcp_traffic, tls_traffic - dataframes consisting of mmt-probe attributes from each of monitored events
     """
-    df = readMMTReportFile(path)
+    events = readMMTReportFile(path)
+    ip_traffic = mergeIpEvents(events["ipv4-event"], events["ipv6-event"])
+    return ip_traffic, events["tcp-event"], events["tls-event"]
 
-    # any_traffic = p1.extractReport("any-event")
-    report_parent_path = Path(path).parent.absolute()
-    ipv4_traffic = extractReport(df, "ipv4-event")
-    ipv6_traffic = extractReport(df, "ipv6-event")
-    ip_traffic = ipv4_traffic.append(ipv6_traffic, sort=False)
-    ip_traffic = ip_traffic.replace(numpy.nan, 0)
-    tcp_traffic = extractReport(df, "tcp-event")
-    tls_traffic = extractReport(df, "tls-event")
-    security_reports = df[df[0] == "10"].copy()
-    # security_reports = security_reports.dropna(axis=1)
-    if not security_reports.empty:
-        security_reports.to_csv(Path.joinpath(report_parent_path,"security-reports.csv"), mode='a', index=False, header=None)
-    df = df[0:0]
 
-    return ip_traffic, tcp_traffic, tls_traffic
+def chunkedCalculateFeatures(csv_path, chunk_size=constants.REPORT_CHUNK_SIZE, idle_timeout=constants.FLOW_IDLE_TIMEOUT):
+    """
+    Calculates ML features of a .csv mmt-probe report streamed in chunks, for reports larger than the memory. The
+    aggregates of the flows are carried from one chunk to the next, and the features of a session are finalized once
+    its flows have been idle for idle_timeout seconds (or at the end of the report). Hence the memory used is bounded
+    by the number of active flows, and the features are the same as calculateFeatures on the whole report.
+
+    :param csv_path: path to .csv created by MMT-probe
+    :param chunk_size: number of lines of the report read at once
+    :param idle_timeout: idle time (in seconds) after which the features of a session are finalized
+    :return: Ip of flows and dataframe with ML features (per flow+direction)
+    """
+    accumulator = FlowFeatureAccumulator()
+    finalized = []
+    last_time = {report_name: None for report_name in constants.IP_EVENTS}
+    # In the whole report, ipv6 events follow ipv4 events, hence the delta of the first ipv6 packet is relative to
+    # the last ipv4 packet of the report: it is only known at the end and its session is kept until then
+    pending = None
+    for events in readMMTReportChunks(csv_path, chunk_size):
+        deltas = []
+        for report_name in constants.IP_EVENTS:
+            times = events[report_name]['time']
+            delta = packetDeltas(times, last_time[report_name])
+            if len(times) > 0:
+                if report_name == "ipv6-event" and last_time[report_name] is None:
+                    delta.iloc[0] = numpy.nan
+                    pending = events[report_name].iloc[[0]][FLOW_KEYS + ['time']]
+                last_time[report_name] = times.iloc[-1]
+            deltas.append(delta)
+        ip_traffic = mergeIpEvents(events["ipv4-event"], events["ipv6-event"])
+        ip_traffic['delta'] = pd.concat(deltas, ignore_index=True).astype(float)
+        accumulator.update(ip_traffic, events["tcp-event"], events["tls-event"])
+
+        if not ip_traffic.empty:
+            idle_sessions = accumulator.idleSessions(ip_traffic['time'].max(), idle_timeout)
+            if pending is not None:
+                idle_sessions = [session for session in idle_sessions if session != pending[FLOW_KEYS[0]].iloc[0]]
+            if idle_sessions:
+                finalized.append(accumulator.split(idle_sessions).features())
+
+    if pending is not None:
+        first_ipv4_delta = 0 if last_time["ipv4-event"] is None else pending['time'].iloc[0] - last_time["ipv4-event"]
+        accumulator.updateDeltas(pending.assign(delta=first_ipv4_delta * 1000))
+    finalized.append(accumulator.features())
+
+    ips = pd.concat([flows_ips for flows_ips, _ in finalized], ignore_index=True)
+    features = pd.concat([flows_features for _, flows_features in finalized], ignore_index=True)
+    ips = ips.sort_values(FLOW_KEYS, ignore_index=True)
+    features = features.sort_values(FLOW_KEYS, ignore_index=True)
+    return ips, features
+
 
-def eventsToFeatures(in_csv):
+def eventsToFeatures(in_csv, chunk_size=None, workers=None):
     """
     Based on .csv mmt-probe report extracts the report attributes, and calculates ML features.
     :param in_csv: input .csv report file
+    :param chunk_size: if set, the report is streamed in chunks of chunk_size lines (see chunkedCalculateFeatures),
+    by default only the reports larger than constants.REPORT_CHUNKED_MIN_SIZE are streamed
+    :param workers: number of processes calculating the features of a report loaded at once (see calculateFeatures)
     :return: ips, p1_features - Dataframe of calculated ML features per flow and direction and IPs matching the flows
     """
     logger.debug(f"Convert from events to features {in_csv}")
-    ip_traffic, tcp_traffic, tls_traffic = readAndExtractEvents(in_csv)
-    if not ip_traffic.empty:
-        logger.debug("eventsToFeatures")
-        ips, p1_features = calculateFeatures(ip_traffic, tcp_traffic, tls_traffic)
+    if chunk_size is None and os.path.getsize(in_csv) >= constants.REPORT_CHUNKED_MIN_SIZE:
+        chunk_size = constants.REPORT_CHUNK_SIZE
+    if chunk_size:
+        logger.debug(f"Stream the report in chunks of {chunk_size} lines")
+        ips, p1_features = chunkedCalculateFeatures(in_csv, chunk_size)
+    else:
+        ip_traffic, tcp_traffic, tls_traffic = readAndExtractEvents(in_csv)
+        if ip_traffic.empty:
+            ips, p1_features = [], []
+        else:
+            logger.debug("eventsToFeatures")
+            ips, p1_features = calculateFeatures(ip_traffic, tcp_traffic, tls_traffic, workers)
+    if len(p1_features) > 0:
         p1_features = p1_features.fillna(0)
         logger.info(f"Extracted {p1_features.shape[0]} features")
         return ips, p1_features
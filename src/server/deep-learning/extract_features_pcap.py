@@ -1,11 +1,11 @@
 import os
 import subprocess
 import sys
-import pandas as pd
 
 # Add parent directory to path for imports
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
 from python_logger import get_logger, print_status, print_error
+from featureStore import FEATURE_FILE_EXTENSION, readFeatures, writeFeatures
 
 logger = get_logger('extract_features_pcap')
 
@@ -24,7 +24,7 @@ def process_pcap(pcap_file, is_malicious):
     """
     base_name = os.path.splitext(os.path.basename(pcap_file))[0]
     output_dir = f"/tmp/{base_name}-reports"
-    output_pkl = f"/tmp/{base_name}.pkl"
+    output_pkl = f"/tmp/{base_name}{FEATURE_FILE_EXTENSION}"
     output_csv = f"/tmp/{base_name}.csv"
 
     if not os.path.exists(output_dir):
@@ -39,19 +39,19 @@ def process_pcap(pcap_file, is_malicious):
     feature_extraction_command = f"python3 trafficToFeature.py {report_csv} {output_pkl} {is_malicious}"
     run_command(feature_extraction_command)
 
-    # Step 3: Convert the pickle file to CSV
+    # Step 3: Convert the features file to CSV
     convert_pkl_to_csv(output_pkl, output_csv)
 
 def convert_pkl_to_csv(input_pkl, output_csv):
-    """Converts a pickle (.pkl) file to a CSV file."""
+    """Converts a features file (.pkl or .parquet) to a CSV file."""
     try:
-        df = pd.read_pickle(input_pkl)
+        df = readFeatures(input_pkl)
 
         # Clean data efficiently
         df = df[df.notnull().all(axis=1)]  # Remove rows with NaN values
         df = df.replace([float('inf'), float('-inf')], 0)  # Replace infinities
 
-        df.to_csv(output_csv, index=False)
+        writeFeatures(df, output_csv)
         logger.info(f"Successfully processed {len(df)} features to {output_csv}")
     except Exception as e:
         print_error(f"Error processing file {input_pkl}: {e}")
@@ -0,0 +1,192 @@
+"""
+Cache of the ML features calculated from mmt-probe reports, shared by the trainings, the feature extractions and the
+predictions. An entry is addressed by the hash of the content of the report and of the feature schema: a report which
+is renamed or used by another build is not processed again, and the features of another schema are never reused.
+The cache is bounded in size, the least recently used entries are evicted.
+"""
+import fcntl
+import hashlib
+import json
+import os
+import sys
+from contextlib import contextmanager
+
+import constants
+from eventToFeature import eventsToFeatures
+from featureStore import FEATURE_FILE_EXTENSION, readFeatures, writeFeatures
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from python_logger import get_logger, print_error
+
+logger = get_logger('featureCache')
+
+FEATURE_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'features-cache')
+
+
+def schemaDigest():
+    """
+    :return: hash of the feature schema (version of the calculation and names of the features)
+    """
+    schema = f"{constants.FEATURE_SCHEMA_VERSION}:{','.join(constants.AD_FEATURES)}"
+    return hashlib.sha256(schema.encode()).hexdigest()
+
+
+def reportKey(in_csv):
+    """
+    :param in_csv: mmt-probe report path
+    :return: key of the features of the report in the cache
+    """
+    digest = hashlib.sha256(schemaDigest().encode())
+    with open(in_csv, 'rb') as report:
+        for block in iter(lambda: report.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class FeatureCache:
+    """
+    Features (and ips of the flows) of the reports stored in a directory, one pair of files per report. The recency of
+    an entry is the modification time of its files, the hit/miss counts are kept in stats.json.
+    """
+
+    def __init__(self, path=FEATURE_CACHE_PATH, max_size=constants.FEATURE_CACHE_MAX_SIZE):
+        self.path = path
+        self.max_size = max_size
+        os.makedirs(self.path, exist_ok=True)
+
+    def _entryFiles(self, key):
+        return [os.path.join(self.path, f"{key}.{part}{FEATURE_FILE_EXTENSION}") for part in ('features', 'ips')]
+
+    def get(self, key):
+        """
+        :param key: key of the report (see reportKey)
+        :return: ips, features of the report, or None if they are not in the cache
+        """
+        features_file, ips_file = self._entryFiles(key)
+        try:
+            features = readFeatures(features_file)
+            ips = readFeatures(ips_file)
+            for entry_file in (features_file, ips_file):
+                os.utime(entry_file)
+        except (OSError, ValueError):
+            self._count('misses')
+            return None
+        self._count('hits')
+        ips['ip'] = ips['ip'].map(list)
+        return ips, features
+
+    def put(self, key, ips, features):
+        """
+        Adds the features of a report, and evicts the least recently used entries if the cache is too large.
+        """
+        for entry_file, df in zip(self._entryFiles(key), (features, ips)):
+            # Written aside and renamed, so that concurrent readers never see a partial file
+            tmp_file = f"{entry_file}.{os.getpid()}.tmp{FEATURE_FILE_EXTENSION}"
+            writeFeatures(df, tmp_file)
+            os.replace(tmp_file, entry_file)
+        self._evict()
+
+    def stats(self):
+        """
+        :return: dictionary with the number of hits, misses, entries and the size of the cache (in bytes)
+        """
+        with self._lock():
+            stats = self._readStats()
+        entries = self._entries()
+        stats['entries'] = len(entries)
+        stats['size'] = sum(size for _, size, _ in entries)
+        return stats
+
+    def clear(self):
+        for key, _, _ in self._entries():
+            self._remove(key)
+
+    def _entries(self):
+        """
+        :return: list of (key, size, last use) of the entries of the cache
+        """
+        entries = {}
+        for name in os.listdir(self.path):
+            if not name.endswith(FEATURE_FILE_EXTENSION) or '.tmp' in name:
+                continue
+            try:
+                file_stat = os.stat(os.path.join(self.path, name))
+            except OSError:
+                continue
+            key = name.split('.')[0]
+            size, last_use = entries.get(key, (0, 0))
+            entries[key] = (size + file_stat.st_size, max(last_use, file_stat.st_mtime))
+        return [(key, size, last_use) for key, (size, last_use) in entries.items()]
+
+    def _evict(self):
+        with self._lock():
+            entries = sorted(self._entries(), key=lambda entry: entry[2])
+            size = sum(entry_size for _, entry_size, _ in entries)
+            for key, entry_size, _ in entries[:-1]:
+                if size <= self.max_size:
+                    break
+                logger.debug(f"Evict the features {key} from the cache")
+                self._remove(key)
+                size -= entry_size
+
+    def _remove(self, key):
+        for entry_file in self._entryFiles(key):
+            try:
+                os.remove(entry_file)
+            except FileNotFoundError:
+                pass
+
+    def _count(self, counter):
+        with self._lock():
+            stats = self._readStats()
+            stats[counter] += 1
+            with open(os.path.join(self.path, 'stats.json'), 'w') as stats_file:
+                json.dump(stats, stats_file)
+
+    def _readStats(self):
+        try:
+            with open(os.path.join(self.path, 'stats.json')) as stats_file:
+                return json.load(stats_file)
+        except (OSError, ValueError):
+            return {'hits': 0, 'misses': 0}
+
+    @contextmanager
+    def _lock(self):
+        with open(os.path.join(self.path, '.lock'), 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def cachedEventsToFeatures(in_csv, cache=None):
+    """
+    Same as eventToFeature.eventsToFeatures, the features of a report already processed are read from the cache.
+
+    :param in_csv: input .csv report file
+    :param cache: FeatureCache (by default the one shared by all the scripts)
+    :return: ips, p1_features - Dataframe of calculated ML features per flow and direction and IPs matching the flows
+    """
+    cache = cache if cache is not None else FeatureCache()
+    key = reportKey(in_csv)
+    cached = cache.get(key)
+    if cached is not None:
+        logger.debug(f"Features of {in_csv} read from the cache ({key})")
+        return cached
+    ips, p1_features = eventsToFeatures(in_csv)
+    if len(p1_features) == 0:
+        return ips, p1_features
+    cache.put(key, ips, p1_features)
+    return ips, p1_features
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2 or sys.argv[1] not in ('stats', 'clear'):
+        print_error('Invalid inputs')
+        print_error('python featureCache.py <stats|clear>')
+        sys.exit(1)
+    elif sys.argv[1] == 'stats':
+        print(json.dumps(FeatureCache().stats()))
+    else:
+        FeatureCache().clear()
@@ -0,0 +1,136 @@
+"""
+Streaming of the training sets of features to the training of the models (tf.data): the features file, or the shards
+of a folder of features files, is read by chunks, scaled on the fly and shuffled through a bounded buffer, with the
+next batches prefetched during the training. The training set is never loaded in memory at once, so its size is not
+limited by the RAM, and the samples are not copied into intermediate arrays (shuffled copy, normal/malicious copies).
+"""
+import glob
+import os
+
+import numpy as np
+import pandas as pd
+
+import constants
+from featureScaler import FeatureScaler, saveScaler
+from featureStore import FEATURE_STORE_EXTENSION, columnarPath, pq
+
+EXCLUDED_FEATURES = ['ip.session_id', 'meta.direction']
+
+
+def isStreamed(train_data_path):
+    """
+    :return: True if the training set is a folder of shards, or a file too large to be loaded at once
+    """
+    return os.path.isdir(train_data_path) or os.path.getsize(train_data_path) >= constants.TRAINING_STREAM_MIN_SIZE
+
+
+def shardPaths(path):
+    """
+    :param path: features file, or folder of features files (.parquet, .csv or .pkl)
+    :return: features files, a .csv file with an up to date Parquet copy is replaced by its copy
+    """
+    paths = [path] if os.path.isfile(path) else sorted(glob.glob(os.path.join(path, '*.parquet')) +
+                                                        glob.glob(os.path.join(path, '*.csv')) +
+                                                        glob.glob(os.path.join(path, '*.pkl')))
+    shards = []
+    for shard in paths:
+        if shard.endswith('.csv') and pq is not None:
+            columnar_path = columnarPath(shard)
+            if os.path.isfile(columnar_path) and os.path.getmtime(columnar_path) >= os.path.getmtime(shard):
+                shard = columnar_path
+        if shard not in shards:
+            shards.append(shard)
+    return shards
+
+
+def readShard(path, chunk_rows=constants.TRAINING_CHUNK_ROWS):
+    """
+    :return: generator of the chunks (dataframes of at most chunk_rows samples) of a features file, without the
+    columns identifying the flows
+    """
+    if path.endswith(FEATURE_STORE_EXTENSION):
+        parquet_file = pq.ParquetFile(path)
+        columns = [col for col in parquet_file.schema_arrow.names if col not in EXCLUDED_FEATURES]
+        for batch in parquet_file.iter_batches(batch_size=chunk_rows, columns=columns):
+            yield batch.to_pandas()
+    elif path.endswith('.pkl'):
+        # pickles cannot be read partially
+        df = pd.read_pickle(path).drop(columns=EXCLUDED_FEATURES, errors='ignore')
+        for start in range(0, len(df), chunk_rows):
+            yield df.iloc[start:start + chunk_rows]
+    else:
+        for chunk in pd.read_csv(path, chunksize=chunk_rows):
+            yield chunk.drop(columns=EXCLUDED_FEATURES, errors='ignore')
+
+
+def readChunks(path, rng=None, chunk_rows=constants.TRAINING_CHUNK_ROWS):
+    """
+    :param rng: numpy random generator shuffling the order of the shards, None to keep their order
+    :return: generator of the chunks of all the shards of path
+    """
+    shards = shardPaths(path)
+    if rng is not None:
+        rng.shuffle(shards)
+    for shard in shards:
+        yield from readShard(shard, chunk_rows)
+
+
+def fitScaler(path, result_path):
+    """
+    Fits the min-max scaler of the training set chunk by chunk and saves it with the model
+
+    :return: FeatureScaler fitted on the training set
+    """
+    from sklearn.preprocessing import MinMaxScaler
+
+    scaler = MinMaxScaler()
+    features = None
+    for chunk in readChunks(path):
+        features = list(chunk.columns[:-1])
+        scaler.partial_fit(np.asarray(chunk.iloc[:, :-1], np.float32))
+    if features is None:
+        raise ValueError(f"There is no training sample in {path}")
+    saveScaler(scaler, features, result_path)
+    return FeatureScaler(features, scaler.data_min_, scaler.data_max_)
+
+
+def streamDataset(path, scaler, batch_size, shuffle_buffer=constants.TRAINING_SHUFFLE_BUFFER, seed=None):
+    """
+    :param path: features file or folder of features files of the training set (features then label)
+    :param scaler: FeatureScaler of the model, applied to the batches
+    :param batch_size: number of samples of the batches
+    :param shuffle_buffer: number of samples the shuffling draws from, shuffled again at each epoch
+    :return: tf.data.Dataset of the batches (scaled features, labels), read again from the files at each epoch
+    """
+    import tensorflow as tf
+
+    nb_features = len(scaler.features)
+    rng = np.random.default_rng(seed)
+
+    def chunks():
+        for chunk in readChunks(path, rng):
+            yield np.asarray(chunk.iloc[:, :-1], np.float32), np.asarray(chunk.iloc[:, -1], np.float32)
+
+    data_min = tf.constant(scaler.data_min, tf.float32)
+    scale = tf.constant(scaler.scale, tf.float32)
+    dataset = tf.data.Dataset.from_generator(chunks, output_signature=(
+        tf.TensorSpec(shape=(None, nb_features), dtype=tf.float32),
+        tf.TensorSpec(shape=(None,), dtype=tf.float32)))
+    return (dataset.unbatch()
+            .shuffle(shuffle_buffer, seed=seed, reshuffle_each_iteration=True)
+            .batch(batch_size)
+            .map(lambda x, y: ((x - data_min) * scale, y), num_parallel_calls=tf.data.AUTOTUNE)
+            .prefetch(tf.data.AUTOTUNE))
+
+
+def streamTrainingData(train_data_path, test_data, result_path, batch_size):
+    """
+    Streamed counterpart of tools.dataScale_cnn: the scaler is fitted on the training set read by chunks (and saved
+    with the model), the training set is streamed, the test set (loaded) is scaled
+
+    :return: dataset of the training batches, x_test, y_test, scaler
+    """
+    scaler = fitScaler(train_data_path, result_path)
+    x_test = scaler.transform(test_data[scaler.features])
+    y_test = np.asarray(test_data.iloc[:, -1], np.float32)
+    return streamDataset(train_data_path, scaler, batch_size), x_test, y_test, scaler
@@ -0,0 +1,97 @@
+"""
+Scaler of the features fitted at training time and saved with the model (scaler.json: names of the features and
+per-feature min/max, scaler.pkl: the fitted MinMaxScaler), so that the predictions and the explanations scale the
+features exactly as the training did, without fitting the scaler again.
+FeatureScaler only needs numpy and pandas: the predictions do not import scikit-learn.
+"""
+import json
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+
+from liteModel import modelResultPaths
+
+SCALER_FILE = 'scaler.json'
+
+
+class FeatureScaler:
+    """
+    Min-max scaling of the features, same results as the fitted sklearn MinMaxScaler (feature_range=(0, 1))
+    """
+
+    def __init__(self, features, data_min, data_max):
+        self.features = list(features)
+        self.data_min = np.asarray(data_min, dtype=np.float64)
+        self.data_max = np.asarray(data_max, dtype=np.float64)
+        data_range = self.data_max - self.data_min
+        # constant features are not scaled, as sklearn does
+        self.scale = 1.0 / np.where(data_range == 0, 1.0, data_range)
+        self.n_features_in_ = len(self.data_min)
+
+    def select(self, df):
+        """
+        :param df: dataframe of features, with the names of the features the scaler was fitted on
+        :return: the columns of these features, in the order of self.features
+        :raise ValueError: if some of these features are missing
+        """
+        missing = [feature for feature in self.features if feature not in df.columns]
+        if missing:
+            raise ValueError(f"Missing features: {', '.join(map(str, missing))}")
+        return df[self.features]
+
+    def transform(self, x):
+        """
+        :param x: features, array in the order of self.features or dataframe (see select)
+        :return: scaled features (float32 array)
+        """
+        if isinstance(x, pd.DataFrame):
+            x = self.select(x)
+        x = np.asarray(x, dtype=np.float64)
+        return ((x - self.data_min) * self.scale).astype(np.float32)
+
+    def inverse_transform(self, x):
+        x = np.asarray(x, dtype=np.float64)
+        return (x / self.scale + self.data_min).astype(np.float32)
+
+
+def saveScaler(scaler, features, result_path):
+    """
+    Saves a fitted MinMaxScaler with the model
+
+    :param scaler: fitted MinMaxScaler
+    :param features: names of the features (columns the scaler was fitted on)
+    :param result_path: folder of the results of the training
+    """
+    os.makedirs(result_path, exist_ok=True)
+    with open(os.path.join(result_path, 'scaler.pkl'), 'wb') as f:
+        pickle.dump(scaler, f)
+    with open(os.path.join(result_path, SCALER_FILE), 'w') as f:
+        json.dump({'features': list(features), 'min': scaler.data_min_.tolist(), 'max': scaler.data_max_.tolist()},
+                  f)
+
+
+def scalerPath(model_path):
+    """
+    :param model_path: path of the Keras model (results/model.h5 of a training, or models/<model id>.h5)
+    :return: path of the scaler saved with the model, None if there is none
+    """
+    for result_path in modelResultPaths(model_path):
+        path = os.path.join(result_path, SCALER_FILE)
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+def loadScaler(model_path):
+    """
+    :param model_path: path of the Keras model
+    :return: FeatureScaler saved with the model, None if the model was trained without saving its scaler
+    """
+    path = scalerPath(model_path)
+    if path is None:
+        return None
+    with open(path) as f:
+        saved = json.load(f)
+    return FeatureScaler(saved['features'], saved['min'], saved['max'])
@@ -0,0 +1,94 @@
+"""
+Storage of the dataframes of ML features (per flow) in a columnar format (Parquet): typed columns, compressed and
+readable by columns. The .csv datasets are kept for the users (download, view) as they are, a Parquet copy is written
+next to them (by writeFeatures, the readers never write) and read instead of parsing the .csv again.
+"""
+import os
+from pathlib import Path
+
+import pandas as pd
+
+FEATURE_STORE_EXTENSION = '.parquet'
+FEATURE_STORE_COMPRESSION = 'zstd'
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:
+    # pyarrow is optional: without it the features are stored and read as before (.pkl/.csv)
+    pq = None
+
+# Extension of the files of features written by the feature extraction
+FEATURE_FILE_EXTENSION = FEATURE_STORE_EXTENSION if pq is not None else '.pkl'
+
+
+def columnarPath(path):
+    """
+    :param path: path of a features file (.csv or .pkl)
+    :return: path of the Parquet copy of the file
+    """
+    return str(Path(path).with_suffix(FEATURE_STORE_EXTENSION))
+
+
+def featuresPath(path):
+    """
+    :param path: path of a features file (.parquet or .pkl), the other paths are returned as they are
+    :return: the path with the extension of the features files written here (FEATURE_FILE_EXTENSION: .pkl when
+    pyarrow is not installed)
+    """
+    path = str(path)
+    if path.endswith(FEATURE_STORE_EXTENSION) or path.endswith('.pkl'):
+        return str(Path(path).with_suffix(FEATURE_FILE_EXTENSION))
+    return path
+
+
+def writeFeatures(df, path, columnar_copy=True):
+    """
+    Writes a dataframe of features. The format is chosen by the extension of the path (.parquet, .pkl or .csv)
+
+    :param df: dataframe of features
+    :param path: output file
+    :param columnar_copy: write also the Parquet copy of a .csv file (if pyarrow is installed)
+    """
+    path = str(path)
+    if path.endswith(FEATURE_STORE_EXTENSION):
+        df.to_parquet(path, index=False, compression=FEATURE_STORE_COMPRESSION)
+    elif path.endswith('.pkl'):
+        df.to_pickle(path)
+    else:
+        df.to_csv(path, index=False)
+        if columnar_copy and pq is not None:
+            df.to_parquet(columnarPath(path), index=False, compression=FEATURE_STORE_COMPRESSION)
+
+
+def readFeatures(path, columns=None, exclude=None):
+    """
+    Reads a dataframe of features written by writeFeatures (or any .csv of features). A .csv file is read from its
+    Parquet copy when the copy is up to date (same types as the parsed .csv), nothing is written.
+
+    :param path: features file (.parquet, .pkl or .csv)
+    :param columns: columns to read (all by default)
+    :param exclude: columns not to read
+    :return: dataframe of features
+    """
+    path = str(path)
+    exclude = set(exclude or [])
+    if not path.endswith(FEATURE_STORE_EXTENSION) and not path.endswith('.pkl') and pq is not None:
+        columnar_path = columnarPath(path)
+        if os.path.isfile(columnar_path) and os.path.getmtime(columnar_path) >= os.path.getmtime(path):
+            path = columnar_path
+
+    if path.endswith(FEATURE_STORE_EXTENSION):
+        if columns is None and exclude:
+            columns = [col for col in pq.read_schema(path).names if col not in exclude]
+        return pd.read_parquet(path, columns=columns)
+    elif path.endswith('.pkl'):
+        return _project(pd.read_pickle(path), columns, exclude)
+    else:
+        usecols = columns if columns is not None else (lambda col: col not in exclude)
+        return pd.read_csv(path, delimiter=",", usecols=usecols)
+
+
+def _project(df, columns, exclude):
+    if columns is not None:
+        return df[columns]
+    return df.drop(columns=[col for col in df.columns if col in exclude])
@@ -0,0 +1,435 @@
+import numpy
+import pandas as pd
+import constants
+
+"""
+Incremental calculation of the ML features per flow, where a flow is identified by the session id and the direction
+given by mmt-probe. Instead of aggregating and merging the whole traffic feature by feature, the traffic is
+aggregated once per event into partial aggregates (counts, sums, min/max, moments, histogram bins) which are combined
+with the aggregates of the previously seen traffic. Hence the traffic can be fed chunk by chunk.
+"""
+
+FLOW_KEYS = ["ip.session_id", "meta.direction"]
+
+FLAG_FEATURES = ['tcp.fin', 'tcp.syn', 'tcp.rst', 'tcp.psh', 'tcp.ack', 'tcp.urg']
+
+
+def _binLabels(bins):
+    return [str(pd.Interval(bins[i], bins[i + 1])) for i in range(len(bins) - 1)]
+
+
+TIME_BINS_LABELS = _binLabels(constants.AD_BINS_TIME)
+LEN_BINS_LABELS = _binLabels(constants.AD_BINS_LEN)
+
+
+def packetDeltas(times, previous_time=None):
+    """
+    Calculates the time between consecutive packets (in ms), whatever the flow they belong to.
+
+    :param times: Series with the time of each packet
+    :param previous_time: time of the packet preceding the first one, if any (e.g. last packet of the previous chunk)
+    :return: Series of the time between each packet and the previous one, 0 for the very first packet
+    """
+    delta = times - times.shift()
+    if len(times) > 0 and previous_time is not None:
+        delta.iloc[0] = times.iloc[0] - previous_time
+    return delta.fillna(0) * 1000
+
+
+def _countBins(traffic, column, bins, labels):
+    """
+    Counts the values of a column falling into each bin (right-closed, as pd.cut), per flow. The bin of every packet
+    is found at once and scattered into a (flow x bin) matrix of counts.
+
+    :return: DataFrame indexed by flow with one column per bin
+    """
+    grouped = traffic.groupby(FLOW_KEYS)
+    flows = grouped.ngroup().to_numpy()
+    nb_flows = grouped.ngroups
+    nb_bins = len(bins) - 1
+    bin_ids = numpy.searchsorted(bins, traffic[column].to_numpy(dtype=float), side='left') - 1
+    in_bins = (bin_ids >= 0) & (bin_ids < nb_bins)
+    counts = numpy.bincount(flows[in_bins] * nb_bins + bin_ids[in_bins], minlength=nb_flows * nb_bins)
+    return pd.DataFrame(counts.reshape(nb_flows, nb_bins), index=grouped.size().index, columns=labels)
+
+
+def _deltaPartial(ip_traffic):
+    """
+    Partial aggregates of the time between packets per flow: moments and SPTime sequence (counted in bins).
+    """
+    part = _momentsPartial(ip_traffic.groupby(FLOW_KEYS), 'delta', 'delta')
+    return part.join(_countBins(ip_traffic, 'delta', constants.AD_BINS_TIME, TIME_BINS_LABELS))
+
+
+def _momentsPartial(grouped, column, prefix):
+    """
+    Partial moments (count, sum, sum of squared deviations, min, max) of a column per flow.
+    """
+    part = grouped[column].agg(['count', 'sum', 'var', 'min', 'max'])
+    part['var'] = (part['var'] * (part['count'] - 1)).fillna(0)
+    part.columns = [f'{prefix}_n', f'{prefix}_sum', f'{prefix}_m2', f'{prefix}_min', f'{prefix}_max']
+    return part
+
+
+def _moments(prefix):
+    return {f'{prefix}_n': 'sum', f'{prefix}_sum': 'sum', f'{prefix}_m2': 'm2', f'{prefix}_min': 'min',
+            f'{prefix}_max': 'max'}
+
+
+IP_RULES = {'pkts': 'sum', 'first_packet_time': 'min', 'last_packet_time': 'max', 'header_len': 'sum',
+            'tot_len': 'sum', 'last_seen': 'max', **_moments('delta'),
+            **{label: 'sum' for label in TIME_BINS_LABELS}}
+
+SESSION_RULES = {'tot_len_sum': 'sum', 'tot_len_n': 'sum'}
+
+TCP_RULES = {'pkts': 'sum', 'bytes': 'sum', 'payload_up': 'sum', 'payload_down': 'sum',
+             'sport_g': 'sum', 'sport_le': 'sum', 'dport_g': 'sum', 'dport_le': 'sum',
+             **_moments('sport'), **_moments('len'),
+             **{flag: 'sum' for flag in FLAG_FEATURES},
+             **{label: 'sum' for label in LEN_BINS_LABELS}}
+
+TLS_RULES = {'pkts': 'sum'}
+
+
+def combineAggregates(frames, rules):
+    """
+    Combines partial aggregates of the same flows (e.g. calculated on consecutive chunks of traffic) into one.
+
+    :param frames: list of DataFrames of partial aggregates indexed by the same keys
+    :param rules: combination rule of each column: 'sum', 'min', 'max' or 'm2' (sum of squared deviations of a
+    moment, combined with the '_n' and '_sum' columns of the same prefix)
+    :return: DataFrame with one row per key
+    """
+    frames = [frame for frame in frames if frame is not None and not frame.empty]
+    if not frames:
+        return None
+    df = pd.concat(frames)
+    if not df.index.has_duplicates:
+        return df
+    levels = list(range(df.index.nlevels))
+    grouped = df.groupby(level=levels)
+    combined = grouped.agg({col: rule for col, rule in rules.items() if rule != 'm2'})
+    for col, rule in rules.items():
+        if rule != 'm2':
+            continue
+        prefix = col[:-len('_m2')]
+        n = df[f'{prefix}_n']
+        total_mean = grouped[f'{prefix}_sum'].transform('sum') / grouped[f'{prefix}_n'].transform('sum')
+        deviation = n * (df[f'{prefix}_sum'] / n - total_mean) ** 2
+        deviation = deviation.where(n > 0, 0)
+        combined[col] = grouped[col].sum() + deviation.groupby(level=levels).sum()
+    return combined[list(rules)]
+
+
+class FlowFeatureAccumulator:
+    """
+    Keeps the aggregates of the traffic per flow and calculates the ML features (constants.AD_FEATURES) from them.
+
+    The ip traffic given to update() must contain a 'delta' column: the time (in ms) since the previous ip packet of
+    the report (see packetDeltas), as this time does not depend on the flow of the packets.
+    """
+
+    def __init__(self):
+        self.ip = None  # aggregates of ip events per flow
+        self.sessions = None  # aggregates of ip events per session (both directions)
+        self.ips = None  # unique (flow, ip address)
+        self.tcp = None  # aggregates of tcp events per flow
+        self.tcp_ports = None  # number of tcp packets per flow and source port
+        self.tls = None  # aggregates of tls events per flow
+
+    def update(self, ip_traffic, tcp_traffic, tls_traffic):
+        """
+        Adds traffic to the aggregates of the flows.
+
+        :param ip_traffic: DataFrame of ip events with the delta column
+        :param tcp_traffic: DataFrame of tcp events
+        :param tls_traffic: DataFrame of tls events
+        """
+        if not ip_traffic.empty:
+            self._updateIp(ip_traffic)
+        if not tcp_traffic.empty:
+            self._updateTcp(tcp_traffic)
+        if not tls_traffic.empty:
+            self._updateTls(tls_traffic)
+
+    def _updateIp(self, ip_traffic):
+        grouped = ip_traffic.groupby(FLOW_KEYS)
+        part = grouped.agg(pkts=('time', 'count'),
+                           first_packet_time=('ip.first_packet_time', 'min'),
+                           last_packet_time=('ip.last_packet_time', 'max'),
+                           header_len=('ip.header_len', 'sum'),
+                           tot_len=('ip.tot_len', 'sum'),
+                           last_seen=('time', 'max'))
+        part = part.join(_deltaPartial(ip_traffic))
+        self.ip = combineAggregates([self.ip, part], IP_RULES)
+
+        sessions = ip_traffic.groupby("ip.session_id")["ip.tot_len"].agg(tot_len_sum='sum', tot_len_n='count')
+        self.sessions = combineAggregates([self.sessions, sessions], SESSION_RULES)
+
+        ips = pd.concat([ip_traffic[FLOW_KEYS + [col]].rename(columns={col: 'ip'}) for col in ["ip.src", "ip.dst"]])
+        self.ips = pd.concat([self.ips, ips]).drop_duplicates()
+
+    def updateDeltas(self, deltas):
+        """
+        Adds the time between packets of ip packets already given to update() with an unknown (NaN) delta.
+
+        :param deltas: DataFrame with the flow keys and the delta column
+        """
+        part = _deltaPartial(deltas).reindex(columns=IP_RULES)
+        part = part.fillna({col: 0 for col, rule in IP_RULES.items() if rule == 'sum'})
+        self.ip = combineAggregates([self.ip, part], IP_RULES)
+
+    def _updateTcp(self, tcp_traffic):
+        grouped = tcp_traffic.groupby(FLOW_KEYS)
+        part = grouped.agg(pkts=('tcp.src_port', 'count'),
+                           bytes=('tcp.payload_len', 'sum'),
+                           payload_up=('tcp.tcp_session_payload_up_len', 'count'),
+                           payload_down=('tcp.tcp_session_payload_down_len', 'count'))
+        # Source and destination ports greater/less or equal to 1024 ( > ephemeral ports)
+        ports = pd.DataFrame({'sport_g': tcp_traffic['tcp.src_port'] > 1024,
+                              'sport_le': tcp_traffic['tcp.src_port'] <= 1024,
+                              'dport_g': tcp_traffic['tcp.dest_port'] > 1024,
+                              'dport_le': tcp_traffic['tcp.dest_port'] <= 1024})
+        part = part.join(ports.groupby([tcp_traffic[key] for key in FLOW_KEYS]).sum())
+        part = part.join(_momentsPartial(grouped, 'tcp.src_port', 'sport'))
+        part = part.join(_momentsPartial(grouped, 'tcp.payload_len', 'len'))
+        # Flags: counts the number of turned on flags
+        part = part.join(tcp_traffic[FLAG_FEATURES].eq(1).groupby([tcp_traffic[key] for key in FLOW_KEYS]).sum())
+        part = part.join(_countBins(tcp_traffic, 'tcp.payload_len', constants.AD_BINS_LEN, LEN_BINS_LABELS))
+        self.tcp = combineAggregates([self.tcp, part], TCP_RULES)
+
+        ports = tcp_traffic.groupby(FLOW_KEYS + ['tcp.src_port']).size().to_frame('pkts')
+        self.tcp_ports = combineAggregates([self.tcp_ports, ports], {'pkts': 'sum'})
+
+    def _updateTls(self, tls_traffic):
+        part = tls_traffic.groupby(FLOW_KEYS).agg(pkts=('ssl.tls_version', 'count'))
+        self.tls = combineAggregates([self.tls, part], TLS_RULES)
+
+    def idleSessions(self, now, timeout):
+        """
+        :param now: current time of the traffic
+        :param timeout: idle time (in seconds) after which a session is considered finished
+        :return: session ids of which no ip packet has been seen for more than timeout seconds
+        """
+        if self.ip is None:
+            return []
+        last_seen = self.ip['last_seen'].groupby(level=0).max()
+        return last_seen.index[last_seen < now - timeout].tolist()
+
+    def split(self, sessions):
+        """
+        Moves the aggregates of the given sessions out of this accumulator.
+
+        :param sessions: session ids
+        :return: new FlowFeatureAccumulator with the aggregates of the sessions
+        """
+        return self._select(sessions, move=True)
+
+    def select(self, sessions):
+        """
+        :param sessions: session ids
+        :return: new FlowFeatureAccumulator with a copy of the aggregates of the sessions
+        """
+        return self._select(sessions, move=False)
+
+    def _select(self, sessions, move):
+        selected = FlowFeatureAccumulator()
+        for name in vars(self):
+            aggregates = getattr(self, name)
+            if aggregates is None:
+                continue
+            if isinstance(aggregates.index, pd.MultiIndex) or aggregates.index.name == FLOW_KEYS[0]:
+                in_sessions = aggregates.index.get_level_values(0).isin(sessions)
+            else:
+                in_sessions = aggregates[FLOW_KEYS[0]].isin(sessions).to_numpy()
+            setattr(selected, name, aggregates[in_sessions] if in_sessions.any() else None)
+            if move:
+                setattr(self, name, aggregates[~in_sessions] if not in_sessions.all() else None)
+        return selected
+
+    def features(self):
+        """
+        Calculates the ML features of all the flows seen so far. Features are calculated including the direction
+        and session id, both columns should be dropped before feeding them into ML model
+
+        :return: Ips of flows and dataframe with ML features (per flow+direction) in constants.AD_FEATURES order
+        """
+        if self.ip is None:
+            return pd.DataFrame(columns=FLOW_KEYS + ['ip']), pd.DataFrame(columns=constants.AD_FEATURES)
+
+        ip = self.ip
+        features = pd.DataFrame(index=ip.index)
+        features['ip.pkts_per_flow'] = ip['pkts']
+        ## Duration of flow: time between first and last received packet in one flow
+        features['duration'] = ip['last_packet_time'] - ip['first_packet_time']
+        features['ip.header_len'] = ip['header_len']
+        features['ip.payload_len'] = ip['tot_len'] - ip['header_len']
+        sessions = self.sessions
+        avg_len = sessions['tot_len_sum'] / sessions['tot_len_n']
+        features['ip.avg_bytes_tot_len'] = avg_len.reindex(ip.index.get_level_values(0)).values
+        features['time_between_pkts_sum'] = ip['delta_sum']
+        features['time_between_pkts_avg'] = ip['delta_sum'] / ip['delta_n']
+        features['time_between_pkts_max'] = ip['delta_max']
+        features['time_between_pkts_min'] = ip['delta_min']
+        features['time_between_pkts_std'] = _std(ip, 'delta')
+        features = features.join(ip[TIME_BINS_LABELS])
+
+        ## tcp and tls flows whose session id was not present in ip traffic are ignored
+        ## (means that ip.session_id is wrongly assigned?)
+        ip_sessions = sessions.index
+        tcp = _filterSessions(self.tcp, ip_sessions)
+        if tcp is not None:
+            tcp_features = pd.DataFrame(index=tcp.index)
+            tcp_features['tcp_pkts_per_flow'] = tcp['pkts']
+            tcp_features['tcp_bytes_per_flow'] = tcp['bytes']
+            tcp_features['tcp.tcp_session_payload_up_len'] = tcp['payload_up']
+            tcp_features['tcp.tcp_session_payload_down_len'] = tcp['payload_down']
+            tcp_features = tcp_features.join(tcp[LEN_BINS_LABELS])
+            tcp_features = tcp_features.join(tcp[FLAG_FEATURES])
+            tcp_features = tcp_features.join(tcp[['sport_g', 'sport_le', 'dport_g', 'dport_le']])
+            tcp_features['mean_tcp_pkts'] = tcp['sport_sum'] / tcp['sport_n']
+            tcp_features['std_tcp_pkts'] = _std(tcp, 'sport')
+            tcp_features['min_tcp_pkts'] = tcp['sport_min']
+            tcp_features['max_tcp_pkts'] = tcp['sport_max']
+            tcp_features['entropy_tcp_pkts'] = self._portsEntropy(tcp.index)
+            # Min, max, std and mean of packet length in each session+direction
+            tcp_features['mean_tcp_len'] = tcp['len_sum'] / tcp['len_n']
+            tcp_features['std_tcp_len'] = _std(tcp, 'len')
+            tcp_features['min_tcp_len'] = tcp['len_min']
+            tcp_features['max_tcp_len'] = tcp['len_max']
+            #TODO: if MMT-probe will be able to provide any other attributes of TLS traffic they should be processed here
+            tls = _filterSessions(self.tls, ip_sessions)
+            if tls is not None:
+                tcp_features = tcp_features.join(tls['pkts'].rename('ssl.tls_version'), how='outer')
+            features = features.join(tcp_features, how='outer')
+            features['pkts_rate'] = features['tcp_pkts_per_flow'] / features['duration']
+            features['byte_rate'] = features['tcp_pkts_per_flow'] / features['duration']
+
+        #Features should have always same columns (as predefined), hence in case some features were not calculated due
+        # to the lack of data (e.g. no TCP packets) the columns should be added anyway filled with 0 values
+        features = features.sort_index().reset_index()
+        features = features.reindex(columns=constants.AD_FEATURES, fill_value=0)
+
+        ips = self.ips.sort_values(FLOW_KEYS + ['ip']).groupby(FLOW_KEYS)['ip'].agg(list).reset_index()
+        return ips, features
+
+    def _portsEntropy(self, index):
+        """
+        Entropy (base 2) of the source ports of the tcp packets of each flow, as scipy.stats.entropy of the number of
+        packets per port, computed with segmented sums over the ports of all the flows at once.
+        """
+        ports = self.tcp_ports['pkts']
+        grouped = ports.groupby(level=[0, 1])
+        probabilities = ports / grouped.transform('sum')
+        ports_entropy = (-probabilities * numpy.log2(probabilities)).groupby(level=[0, 1]).sum()
+        return ports_entropy.reindex(index)
+
+
+def _std(aggregates, prefix):
+    """
+    Sample standard deviation (as pandas std) from the moments of a column, NaN for flows with one value.
+    """
+    return numpy.sqrt(aggregates[f'{prefix}_m2'] / (aggregates[f'{prefix}_n'] - 1).where(
+        aggregates[f'{prefix}_n'] > 1))
+
+
+def _filterSessions(aggregates, sessions):
+    if aggregates is None:
+        return None
+    aggregates = aggregates[aggregates.index.get_level_values(0).isin(sessions)]
+    if aggregates.empty:
+        return None
+    return aggregates
+
+
+class OnlineFlowFeatures:
+    """
+    Keeps the aggregates of the flows across consecutive windows of traffic (e.g. the reports of the capture windows
+    of the online detection), so that a long-lived flow is not cut into one fragment per window. Each window only
+    adds its own packets to the aggregates, and the features of the flows which got packets are emitted. Sessions
+    idle for more than idle_timeout seconds are finalized and their aggregates are dropped.
+
+    When the windows are analysed by separate mmt-probe runs, the session ids restart in every window: with
+    remap_sessions, the sessions of a window are matched to the active sessions by their ips and tcp ports, and get
+    ids unique across the windows.
+    """
+
+    def __init__(self, idle_timeout=constants.ONLINE_FLOW_IDLE_TIMEOUT, remap_sessions=False):
+        self.idle_timeout = idle_timeout
+        self.remap_sessions = remap_sessions
+        self.accumulator = FlowFeatureAccumulator()
+        self.last_time = None  # time of the last ip packet of the previous window
+        self.sessions = {}  # signature of the active sessions -> session id, orientation (with remap_sessions)
+        self.next_session_id = 0
+
+    def update(self, ip_traffic, tcp_traffic, tls_traffic):
+        """
+        Adds the traffic of a window to the flows.
+
+        :param ip_traffic: DataFrame of ip events of the window (ipv4 and ipv6 merged)
+        :param tcp_traffic: DataFrame of tcp events of the window
+        :param tls_traffic: DataFrame of tls events of the window
+        :return: (ips, features) of the flows updated by the window and (ips, features) of the flows finalized as
+        they have been idle for too long
+        """
+        if self.remap_sessions:
+            ip_traffic, tcp_traffic, tls_traffic = self._remapSessions(ip_traffic, tcp_traffic, tls_traffic)
+        ip_traffic = ip_traffic.assign(delta=packetDeltas(ip_traffic['time'], self.last_time))
+        if not ip_traffic.empty:
+            self.last_time = ip_traffic['time'].iloc[-1]
+        self.accumulator.update(ip_traffic, tcp_traffic, tls_traffic)
+
+        finalized = FlowFeatureAccumulator()
+        if not ip_traffic.empty:
+            idle_sessions = self.accumulator.idleSessions(ip_traffic['time'].max(), self.idle_timeout)
+            if idle_sessions:
+                finalized = self.accumulator.split(idle_sessions)
+                idle_sessions = set(idle_sessions)
+                self.sessions = {signature: session for signature, session in self.sessions.items()
+                                 if session[0] not in idle_sessions}
+        updated_sessions = pd.concat([traffic[FLOW_KEYS[0]] for traffic in (ip_traffic, tcp_traffic, tls_traffic)])
+        updated = self.accumulator.select(updated_sessions.unique())
+        return updated.features(), finalized.features()
+
+    def _remapSessions(self, ip_traffic, tcp_traffic, tls_traffic):
+        """
+        Replaces the session ids of the window by ids unique across the windows: a session with the same signature
+        (ips and tcp ports) as an active session gets its id, the other sessions get new ids. mmt-probe sets the
+        direction of a session from its first packet in the window: the directions of a session whose first packet
+        in the window goes the other way than in the window it started are swapped.
+        """
+        ips = ip_traffic.groupby(FLOW_KEYS[0])[['ip.src', 'ip.dst', FLOW_KEYS[1]]].first()
+        reversed_ips = ips[FLOW_KEYS[1]] != 0
+        signatures = pd.Series([tuple(sorted(pair)) for pair in zip(ips['ip.src'], ips['ip.dst'])], index=ips.index)
+        # orientation of a session: ip (and tcp port) sending the packets of direction 0
+        orientations = ips['ip.src'].where(~reversed_ips, ips['ip.dst']).map(lambda ip: (ip,))
+        if not tcp_traffic.empty:
+            ports = tcp_traffic.groupby(FLOW_KEYS[0])[['tcp.src_port', 'tcp.dest_port', FLOW_KEYS[1]]].first()
+            reversed_ports = ports[FLOW_KEYS[1]] != 0
+            src_ports = ports['tcp.src_port'].where(~reversed_ports, ports['tcp.dest_port'])
+            ports = pd.Series([tuple(sorted(pair)) for pair in zip(ports['tcp.src_port'], ports['tcp.dest_port'])],
+                              index=ports.index)
+            signatures = signatures + ports.reindex(signatures.index).map(
+                lambda pair: pair if isinstance(pair, tuple) else ())
+            orientations = orientations + src_ports.reindex(orientations.index).map(
+                lambda port: () if pd.isna(port) else (port,))
+        session_ids = {}
+        reversed_sessions = set()
+        window_ids = set()
+        for session, signature in signatures.items():
+            # Sessions of the same window are different sessions even with the same signature
+            if signature not in self.sessions or self.sessions[signature][0] in window_ids:
+                self.sessions[signature] = (self.next_session_id, orientations[session])
+                self.next_session_id += 1
+            session_ids[session], orientation = self.sessions[signature]
+            if orientation != orientations[session]:
+                reversed_sessions.add(session)
+            window_ids.add(session_ids[session])
+        remapped = []
+        for traffic in (ip_traffic, tcp_traffic, tls_traffic):
+            traffic = traffic[traffic[FLOW_KEYS[0]].isin(session_ids)]
+            directions = traffic[FLOW_KEYS[1]].where(~traffic[FLOW_KEYS[0]].isin(reversed_sessions),
+                                                     1 - traffic[FLOW_KEYS[1]])
+            remapped.append(traffic.assign(**{FLOW_KEYS[0]: traffic[FLOW_KEYS[0]].map(session_ids),
+                                              FLOW_KEYS[1]: directions}))
+        return remapped
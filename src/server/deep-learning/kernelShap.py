@@ -0,0 +1,134 @@
+"""
+KernelSHAP with batched evaluations of the model: the coalitions of many explained samples are predicted together, in
+a few large predictions whose size is bounded by a memory budget, instead of one prediction per explained sample (and
+many small batches inside it) as shap.KernelExplainer does.
+
+The same coalitions are used for all the explained samples, so the weighted least squares of KernelSHAP are solved
+once for all of them.
+"""
+import itertools
+import math
+import timeit
+
+import numpy as np
+
+import constants
+
+# Coalitions are enumerated instead of sampled when there are at most this number of features
+MAX_ENUMERATED_FEATURES = 20
+
+
+def kernelCoalitions(nb_features, nsamples, rng):
+    """
+    :param nb_features: number of features
+    :param nsamples: number of coalitions
+    :param rng: numpy random generator
+    :return: coalitions (nsamples x nb_features array of 0/1) and their weights in the least squares. All the
+    coalitions with their Shapley kernel weights if there are fewer than nsamples, otherwise coalitions drawn from the
+    Shapley kernel (with their complements) and uniform weights
+    """
+    if nb_features <= MAX_ENUMERATED_FEATURES and 2 ** nb_features - 2 <= nsamples:
+        masks = np.array([mask for mask in itertools.product([0, 1], repeat=nb_features)
+                          if 0 < sum(mask) < nb_features], dtype=np.float32)
+        sizes = masks.sum(1)
+        binomials = np.array([math.comb(nb_features, int(size)) for size in sizes], dtype=np.float64)
+        weights = (nb_features - 1) / (binomials * sizes * (nb_features - sizes))
+        return masks, weights
+
+    sizes = np.arange(1, nb_features)
+    size_probs = (nb_features - 1) / (sizes * (nb_features - sizes))
+    nb_drawn = max(1, nsamples // 2)
+    drawn_sizes = rng.choice(sizes, size=nb_drawn, p=size_probs / size_probs.sum())
+    # random subset of each drawn size: the features with the smallest random ranks
+    ranks = rng.random((nb_drawn, nb_features)).argsort(1).argsort(1)
+    masks = (ranks < drawn_sizes[:, np.newaxis]).astype(np.float32)
+    masks = np.vstack([masks, 1 - masks])
+    return masks, np.ones(len(masks))
+
+
+class BatchKernelExplainer:
+    """
+    KernelSHAP explainer of one output of a model, with the shap_values interface of the shap explainers
+    """
+
+    def __init__(self, predict, background, nsamples=constants.XAI_SHAP_NSAMPLES,
+                 memory_budget=constants.XAI_SHAP_MEMORY_BUDGET, output=-1, seed=None, background_weights=None):
+        """
+        :param predict: prediction function of the model (e.g. model.predict)
+        :param background: background samples, whose features replace the features out of a coalition
+        :param background_weights: weights of the background samples (e.g. sizes of the k-means clusters), None for
+        uniform weights
+        :param nsamples: number of coalitions per explained sample, None for 2 * number of features + 2048
+        :param memory_budget: maximal size (in bytes) of the synthetic samples predicted at once
+        :param output: index of the explained output of the model
+        """
+        self.predict = predict
+        self.background = np.asarray(background, dtype=np.float32)
+        weights = np.ones(len(self.background)) if background_weights is None else np.asarray(background_weights)
+        self.background_weights = weights / weights.sum()
+        self.memory_budget = memory_budget
+        self.output = output
+        nb_features = self.background.shape[1]
+        self.masks, kernel_weights = kernelCoalitions(nb_features, nsamples or 2 * nb_features + 2048,
+                                                      np.random.default_rng(seed))
+        # The constraint sum(phi) = f(x) - E[f(x)] eliminates the last feature, the weighted least squares of the
+        # other features become a projection shared by all the explained samples
+        eliminated = self.masks[:, :-1] - self.masks[:, -1:]
+        weighted = eliminated.T * kernel_weights
+        self.projection = np.linalg.pinv(weighted @ eliminated) @ weighted
+        self.expected_value = float(self.outputs(self.background) @ self.background_weights)
+        self.nb_explained = 0
+        self.explain_time = 0.0
+
+    def outputs(self, x):
+        y = np.asarray(self.predict(x, batch_size=constants.XAI_SHAP_PREDICT_BATCH_SIZE, verbose=0))
+        return y.reshape(len(x), -1)[:, self.output].astype(np.float64)
+
+    def samplesPerBatch(self):
+        """
+        :return: number of explained samples whose synthetic samples fit in the memory budget
+        """
+        nb_coalitions, nb_features = self.masks.shape
+        sample_size = nb_coalitions * len(self.background) * nb_features * 4
+        return max(1, int(self.memory_budget // sample_size))
+
+    def shap_values(self, x, **kwargs):
+        """
+        :param x: samples to explain
+        :return: SHAP values of the explained output, (samples, features) array
+        """
+        start = timeit.default_timer()
+        x = np.asarray(x, dtype=np.float32).reshape(len(x), -1)
+        nb_features = x.shape[1]
+        values = []
+        for begin in range(0, len(x), self.samplesPerBatch()):
+            batch = x[begin:begin + self.samplesPerBatch()]
+            # synthetic samples: features of the explained sample in the coalition, of a background sample elsewhere
+            # (explained samples x coalitions x background samples x features)
+            synthetic = np.where(self.masks[np.newaxis, :, np.newaxis, :] > 0,
+                                 batch[:, np.newaxis, np.newaxis, :],
+                                 self.background[np.newaxis, np.newaxis, :, :])
+            coalition_outputs = self.outputs(synthetic.reshape(-1, nb_features)).reshape(
+                len(batch), len(self.masks), len(self.background)) @ self.background_weights
+            values.append(self.solve(coalition_outputs, self.outputs(batch)))
+        self.nb_explained += len(x)
+        self.explain_time += timeit.default_timer() - start
+        return np.concatenate(values) if values else np.empty((0, nb_features))
+
+    def solve(self, coalition_outputs, sample_outputs):
+        """
+        :param coalition_outputs: expected outputs of the coalitions of the explained samples (samples x coalitions)
+        :param sample_outputs: outputs of the explained samples
+        :return: SHAP values of the explained samples (samples x features)
+        """
+        delta = sample_outputs - self.expected_value
+        targets = coalition_outputs - self.expected_value - self.masks[:, -1][np.newaxis, :] * delta[:, np.newaxis]
+        phi = targets @ self.projection.T
+        return np.hstack([phi, (delta - phi.sum(1))[:, np.newaxis]])
+
+    @property
+    def throughput(self):
+        """
+        :return: explained samples per second
+        """
+        return self.nb_explained / self.explain_time if self.explain_time > 0 else 0.0
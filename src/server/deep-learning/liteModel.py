@@ -0,0 +1,194 @@
+"""
+Export of the trained SAE-CNN models to TensorFlow Lite, and inference of the exported models with the TFLite
+interpreter only (tflite-runtime), which avoids importing TensorFlow and loading the Keras model for each prediction.
+
+The export is done at the end of the training, next to model.h5: model.tflite (float32) and optionally a quantized
+variant (model_float16.tflite or model_int8.tflite). Each exported model is checked against the Keras model on test
+samples, a variant whose predictions differ too much is not kept. The results of the checks are saved in export.json.
+By default, the predictions use the quantized variant if it has been kept, the float32 model otherwise.
+"""
+import hashlib
+import json
+import os
+import timeit
+
+import numpy as np
+
+import constants
+
+try:
+    from tflite_runtime.interpreter import Interpreter
+except ImportError:
+    Interpreter = None
+
+TRAININGS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'trainings')
+LITE_MODEL_VARIANTS = ['float32', 'float16', 'int8']
+
+
+def liteModelName(variant):
+    return 'model.tflite' if variant == 'float32' else f'model_{variant}.tflite'
+
+
+def fileDigest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class LiteModel:
+    """
+    Model exported to TFLite, with the part of the interface of the Keras models used by the predictions and the
+    explanations (input_shape, predict)
+    """
+
+    def __init__(self, path, interpreter_class=None):
+        interpreter_class = interpreter_class or Interpreter
+        self.path = path
+        self.interpreter = interpreter_class(model_path=path, num_threads=constants.LITE_MODEL_THREADS)
+        self.input = self.interpreter.get_input_details()[0]
+        self.output = self.interpreter.get_output_details()[0]
+        self.input_shape = (None,) + tuple(int(dim) for dim in self.input['shape'][1:])
+        self.batch_size = None  # batch size the tensors are allocated for
+
+    def predict(self, x, batch_size=constants.LITE_MODEL_BATCH_SIZE, **kwargs):
+        """
+        :param x: samples (array or dataframe)
+        :param batch_size: number of samples given to the interpreter at once
+        :return: outputs of the model, as Keras model.predict
+        """
+        x = np.asarray(x, dtype=np.float32).reshape((-1,) + self.input_shape[1:])
+        outputs = []
+        for start in range(0, len(x), batch_size):
+            batch = x[start:start + batch_size]
+            if self.batch_size != len(batch):
+                self.interpreter.resize_tensor_input(self.input['index'], [len(batch)] + list(self.input_shape[1:]))
+                self.interpreter.allocate_tensors()
+                self.batch_size = len(batch)
+            self.interpreter.set_tensor(self.input['index'], batch)
+            self.interpreter.invoke()
+            outputs.append(self.interpreter.get_tensor(self.output['index']).copy())
+        if not outputs:
+            return np.empty((0,) + tuple(self.output['shape'][1:]), dtype=np.float32)
+        return np.concatenate(outputs)
+
+
+def checkParity(model, lite_model, x):
+    """
+    :param model: Keras model
+    :param lite_model: LiteModel exported from the model
+    :param x: test samples
+    :return: dictionary with the maximal difference of the outputs, the agreement of the predicted classes, the
+    prediction times and whether the exported model can replace the Keras model
+    """
+    start = timeit.default_timer()
+    y_keras = np.asarray(model.predict(x, verbose=0)).reshape(-1)
+    keras_time = timeit.default_timer() - start
+    start = timeit.default_timer()
+    y_lite = lite_model.predict(x).reshape(-1)
+    lite_time = timeit.default_timer() - start
+    agreement = float(np.mean(np.round(y_keras) == np.round(y_lite))) if len(y_keras) > 0 else 1.0
+    return {
+        'samples': len(y_keras),
+        'max_abs_diff': float(np.max(np.abs(y_keras - y_lite))) if len(y_keras) > 0 else 0.0,
+        'agreement': agreement,
+        'keras_time': keras_time,
+        'lite_time': lite_time,
+        'passed': agreement >= constants.LITE_MODEL_MIN_AGREEMENT,
+    }
+
+
+def exportModel(model, x_test, result_path, quantization=constants.LITE_MODEL_QUANTIZATION):
+    """
+    Exports the model to TFLite (float32 and the quantized variant), next to model.h5 which must be saved before
+
+    :param model: trained Keras model
+    :param x_test: test samples (scaled), used to check the exported models and to calibrate the int8 variant
+    :param result_path: folder of the results of the training
+    :param quantization: None, 'float16' or 'int8'
+    :return: dictionary variant -> results of the check (see checkParity)
+    """
+    import tensorflow as tf
+
+    x_test = np.asarray(x_test, dtype=np.float32)
+    x_check = x_test[:constants.LITE_MODEL_PARITY_SAMPLES]
+    report = {'keras_model': fileDigest(os.path.join(result_path, 'model.h5')), 'variants': {}}
+    for variant in ['float32'] + ([quantization] if quantization else []):
+        converter = tf.lite.TFLiteConverter.from_keras_model(model)
+        if variant == 'float16':
+            converter.optimizations = [tf.lite.Optimize.DEFAULT]
+            converter.target_spec.supported_types = [tf.float16]
+        elif variant == 'int8':
+            calibration = x_test[:constants.LITE_MODEL_CALIBRATION_SAMPLES]
+            converter.optimizations = [tf.lite.Optimize.DEFAULT]
+            converter.representative_dataset = lambda: ([sample[np.newaxis]] for sample in calibration)
+        lite_path = os.path.join(result_path, liteModelName(variant))
+        with open(lite_path, 'wb') as f:
+            f.write(converter.convert())
+
+        parity = checkParity(model, LiteModel(lite_path, tf.lite.Interpreter), x_check)
+        parity['size'] = os.path.getsize(lite_path)
+        report['variants'][variant] = parity
+        print(f"Exported {lite_path}: agreement {parity['agreement']:.4f}, max difference "
+              f"{parity['max_abs_diff']:.6f}, {parity['keras_time']:.3f}s (Keras) vs {parity['lite_time']:.3f}s")
+        if not parity['passed']:
+            print(f"The {variant} model differs from the Keras model, it is not kept")
+            os.remove(lite_path)
+
+    with open(os.path.join(result_path, 'export.json'), 'w') as f:
+        json.dump(report, f, indent=2)
+    return report['variants']
+
+
+def modelResultPaths(model_path):
+    """
+    :param model_path: path of the Keras model (results/model.h5 of a training, or models/<model id>.h5)
+    :return: folders where the files saved with the model at training time can be (folder of the model, results of
+    the training of the model)
+    """
+    model_dir, model_file = os.path.split(os.path.abspath(model_path))
+    model_name = os.path.splitext(model_file)[0]
+    return [model_dir, os.path.join(TRAININGS_PATH, model_name, 'results')]
+
+
+def liteModelPath(model_path, variant=constants.LITE_MODEL_VARIANT):
+    """
+    :param model_path: path of the Keras model
+    :param variant: 'float32', 'float16', 'int8' or 'auto' (the quantized variant exported with the model if it passed
+    its check, float32 otherwise)
+    :return: path of the exported model, None if the model has not been exported or has changed since the export
+    """
+    for export_dir in modelResultPaths(model_path):
+        export_file = os.path.join(export_dir, 'export.json')
+        if not os.path.isfile(export_file):
+            continue
+        with open(export_file) as f:
+            report = json.load(f)
+        if report.get('keras_model') != fileDigest(model_path):
+            continue
+        if variant == 'auto':
+            variants = [name for name, parity in report.get('variants', {}).items()
+                        if name != 'float32' and parity.get('passed')] + ['float32']
+        else:
+            variants = [variant]
+        for name in variants:
+            lite_path = os.path.join(export_dir, liteModelName(name))
+            if os.path.isfile(lite_path):
+                return lite_path
+    return None
+
+
+def loadModel(model_path, variant=constants.LITE_MODEL_VARIANT):
+    """
+    :param model_path: path of the Keras model
+    :param variant: exported model to use (see liteModelPath)
+    :return: the exported model if the TFLite runtime is installed and the model has been exported, the Keras model
+    otherwise
+    """
+    lite_path = liteModelPath(model_path, variant) if Interpreter is not None else None
+    if lite_path is not None:
+        print(f"Load the TFLite model {lite_path}")
+        return LiteModel(lite_path)
+    from tensorflow.keras.models import load_model
+    return load_model(model_path)
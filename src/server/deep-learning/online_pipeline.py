@@ -0,0 +1,268 @@
+"""
+Online detection pipeline: the capture windows (ndr_*.pcap files rotated by routes/online.js) flow through stages
+connected by bounded queues, so that the windows overlap instead of being processed strictly one after the other:
+
+  mmt-probe (several windows at once) -> report parsing -> flow features -> batched prediction
+
+The flows are carried from one window to the next (see flowFeatures.OnlineFlowFeatures): each window predicts the
+flows which got packets in the window, with their features over all the windows so far.
+
+The latency of each stage (and the total time from the end of the capture window to its predictions) is saved in
+<result_path>/latency.csv. The pipeline runs until it gets SIGINT/SIGTERM, then it processes the remaining windows.
+"""
+import argparse
+import glob
+import os
+import queue
+import signal
+import subprocess
+import sys
+import threading
+import time
+import timeit
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+import constants
+from eventToFeature import mergeIpEvents, readMMTReportFile
+from flowFeatures import OnlineFlowFeatures
+from liteModel import loadModel
+from featureScaler import loadScaler
+from prediction import predictFeatures, savePredictions
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from python_logger import get_logger
+
+logger = get_logger('online_pipeline')
+
+MMT_PROBE_CONFIG_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'mmt',
+                                     'mmt-probe.conf')
+STAGES = ['probe', 'parse', 'features', 'prediction']
+
+
+class Window:
+    """
+    A capture window going through the pipeline
+    """
+
+    def __init__(self, index, pcap_path):
+        self.index = index
+        self.pcap_path = pcap_path
+        self.name = os.path.splitext(os.path.basename(pcap_path))[0]
+        self.captured_at = os.path.getmtime(pcap_path)
+        self.latency = {}  # seconds spent in each stage
+        self.report_path = None
+        self.events = None
+        self.ips = None
+        self.features = None
+
+
+def _timed(stage):
+    """
+    Records the time spent by a window in a stage, and returns the window
+    """
+    def decorator(function):
+        def wrapper(self, window):
+            start = timeit.default_timer()
+            try:
+                function(self, window)
+            except Exception as e:
+                # The window is passed on without result, so that the next windows are not blocked
+                logger.error(f"{stage} of the window {window.name} failed: {e}")
+            window.latency[stage] = timeit.default_timer() - start
+            return window
+        return wrapper
+    return decorator
+
+
+class OnlinePipeline:
+
+    def __init__(self, pcap_dir, model_path, result_path, report_dir=None, mmt_config=MMT_PROBE_CONFIG_PATH,
+                 probe_workers=constants.ONLINE_PROBE_WORKERS, batch_windows=constants.ONLINE_BATCH_WINDOWS):
+        self.pcap_dir = pcap_dir
+        self.result_path = result_path
+        self.report_dir = report_dir or os.path.join(result_path, 'reports')
+        self.mmt_config = mmt_config
+        self.probe_workers = probe_workers
+        self.batch_windows = batch_windows
+        self.model = loadModel(model_path)
+        self.scaler = loadScaler(model_path)
+        # Each window is analysed by its own mmt-probe run, hence its session ids are matched to the previous windows
+        self.flows = OnlineFlowFeatures(remap_sessions=True)
+        self.stopping = threading.Event()
+        self.queues = {stage: queue.Queue(maxsize=constants.ONLINE_QUEUE_SIZE) for stage in STAGES}
+        os.makedirs(self.report_dir, exist_ok=True)
+        os.makedirs(self.result_path, exist_ok=True)
+
+    def stop(self, *args):
+        logger.info("Stop the online pipeline once the captured windows are processed")
+        self.stopping.set()
+
+    def run(self):
+        """
+        Starts the stages and feeds them with the capture windows until the pipeline is stopped
+        """
+        stages = [threading.Thread(target=self._probeStage),
+                  threading.Thread(target=self._orderedStage, args=('parse', 'features', self._parse)),
+                  threading.Thread(target=self._orderedStage, args=('features', 'prediction', self._features)),
+                  threading.Thread(target=self._predictionStage)]
+        for stage in stages:
+            stage.start()
+        self._watch()
+        for stage in stages:
+            stage.join()
+
+    def _watch(self):
+        """
+        Puts the completed capture windows (i.e. followed by a newer one, or all of them once stopping) in the queue
+        of mmt-probe, the queue being bounded this waits while the pipeline is busy
+        """
+        nb_windows = 0
+        while True:
+            stopping = self.stopping.is_set()
+            pcaps = sorted(glob.glob(os.path.join(self.pcap_dir, 'ndr_*.pcap')))
+            completed = pcaps if stopping else pcaps[:-1]
+            for pcap_path in completed[nb_windows:]:
+                self.queues['probe'].put(Window(nb_windows, pcap_path))
+                nb_windows += 1
+            if stopping:
+                break
+            self.stopping.wait(constants.ONLINE_POLL_INTERVAL)
+        self.queues['probe'].put(None)
+
+    def _probeStage(self):
+        """
+        Runs mmt-probe on several windows at the same time, the windows are passed on in any order
+        """
+        slots = threading.Semaphore(self.probe_workers)
+        with ThreadPoolExecutor(max_workers=self.probe_workers) as pool:
+            while True:
+                window = self.queues['probe'].get()
+                if window is None:
+                    break
+                slots.acquire()
+                future = pool.submit(self._probe, window)
+                future.add_done_callback(lambda done: (slots.release(), self.queues['parse'].put(done.result())))
+        self.queues['parse'].put(None)
+
+    def _orderedStage(self, stage, next_stage, function):
+        """
+        Processes the windows of a stage in the order of their capture (the flows of a window depend on the previous
+        windows), and passes them on to the next stage
+        """
+        pending = {}
+        next_index = 0
+        while True:
+            window = self.queues[stage].get()
+            if window is None:
+                break
+            pending[window.index] = window
+            while next_index in pending:
+                window = pending.pop(next_index)
+                function(window)
+                self.queues[next_stage].put(window)
+                next_index += 1
+        for index in sorted(pending):
+            function(pending[index])
+            self.queues[next_stage].put(pending[index])
+        self.queues[next_stage].put(None)
+
+    def _predictionStage(self):
+        """
+        Predicts the windows by batches: all the windows waiting for the prediction (at most batch_windows) are
+        predicted at once
+        """
+        running = True
+        while running:
+            windows = [self.queues['prediction'].get()]
+            while len(windows) < self.batch_windows and windows[-1] is not None:
+                try:
+                    windows.append(self.queues['prediction'].get_nowait())
+                except queue.Empty:
+                    break
+            if windows[-1] is None:
+                running = False
+                windows = windows[:-1]
+            if windows:
+                self._predict(windows)
+
+    @_timed('probe')
+    def _probe(self, window):
+        output_dir = os.path.join(self.report_dir, window.name)
+        os.makedirs(output_dir, exist_ok=True)
+        command = ['mmt-probe', '-c', self.mmt_config, '-t', window.pcap_path,
+                   '-X', f'file-output.output-dir={output_dir}', '-X', f'file-output.output-file={window.name}.csv']
+        result = subprocess.run(command, capture_output=True, text=True)
+        if result.returncode != 0:
+            logger.error(f"mmt-probe failed on {window.pcap_path}: {result.stderr}")
+        reports = [report for report in sorted(glob.glob(os.path.join(output_dir, '*.csv')))
+                   if os.path.basename(report) != 'security-reports.csv']
+        window.report_path = reports[0] if reports else None
+
+    @_timed('parse')
+    def _parse(self, window):
+        if window.report_path is not None:
+            window.events = readMMTReportFile(window.report_path)
+
+    @_timed('features')
+    def _features(self, window):
+        if window.events is None:
+            return
+        events, window.events = window.events, None
+        ip_traffic = mergeIpEvents(events["ipv4-event"], events["ipv6-event"])
+        (ips, features), (finalized_ips, _) = self.flows.update(ip_traffic, events["tcp-event"], events["tls-event"])
+        if len(finalized_ips) > 0:
+            logger.debug(f"Window {window.name}: {len(finalized_ips)} idle flows finalized")
+        if len(features) == 0:
+            return
+        features = features.fillna(0)
+        window.ips = pd.merge(ips, features, how='inner', on=['ip.session_id', 'meta.direction'])[
+            ['ip.session_id', 'meta.direction', 'ip']]
+        window.features = features.drop(columns=['ip.session_id', 'meta.direction'])
+
+    def _predict(self, windows):
+        start = timeit.default_timer()
+        predicted = [window for window in windows if window.features is not None and len(window.features) > 0]
+        if predicted:
+            features, y_pred = predictFeatures(pd.concat([window.features for window in predicted], ignore_index=True),
+                                               self.model, self.scaler)
+            offset = 0
+            for window in predicted:
+                nb_flows = len(window.features)
+                savePredictions(window.ips, features.iloc[offset:offset + nb_flows],
+                                y_pred[offset:offset + nb_flows], os.path.join(self.result_path, window.name))
+                offset += nb_flows
+        elapsed = timeit.default_timer() - start
+        for window in windows:
+            window.latency['prediction'] = elapsed
+            self._saveLatency(window)
+
+    def _saveLatency(self, window):
+        latency_file = os.path.join(self.result_path, 'latency.csv')
+        row = pd.DataFrame([[window.name] + [window.latency.get(stage, 0) for stage in STAGES]
+                            + [time.time() - window.captured_at]],
+                           columns=['window'] + STAGES + ['total'])
+        row.to_csv(latency_file, mode='a', index=False, header=not os.path.isfile(latency_file))
+        logger.info(f"Window {window.name}: " + ", ".join(
+            f"{stage} {window.latency.get(stage, 0):.3f}s" for stage in STAGES))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Online detection pipeline on rotating capture windows")
+    parser.add_argument("pcap_dir", help="Folder where the ndr_*.pcap capture windows are written")
+    parser.add_argument("model_path", help="Model used for the prediction")
+    parser.add_argument("result_path", help="Folder of the predictions (one sub-folder per window)")
+    parser.add_argument("--report-dir", help="Folder of the mmt-probe reports (<result_path>/reports by default)")
+    parser.add_argument("--mmt-config", default=MMT_PROBE_CONFIG_PATH, help="mmt-probe configuration")
+    parser.add_argument("--probe-workers", type=int, default=constants.ONLINE_PROBE_WORKERS,
+                        help="Number of windows analysed by mmt-probe at the same time")
+    parser.add_argument("--batch-windows", type=int, default=constants.ONLINE_BATCH_WINDOWS,
+                        help="Maximal number of windows predicted in one batch")
+    args = parser.parse_args()
+
+    pipeline = OnlinePipeline(args.pcap_dir, args.model_path, args.result_path, args.report_dir, args.mmt_config,
+                              args.probe_workers, args.batch_windows)
+    signal.signal(signal.SIGINT, pipeline.stop)
+    signal.signal(signal.SIGTERM, pipeline.stop)
+    pipeline.run()
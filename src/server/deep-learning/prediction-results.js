@@ -0,0 +1,114 @@
+/**
+ * Readers of the prediction results (see predictionResults.py): the flows are saved once in a columnar file,
+ * the attack and normal flows are indices of rows, the numbers of flows are in stats.json.
+ * The .csv file of a view (all flows, attacks, normals) is written by predictionResults.py on its first request only,
+ * then it is sent as a file. The .csv files of the predictions made by the previous versions are sent as they are.
+ */
+const { spawn } = require('child_process');
+const fs = require('fs');
+const path = require('path');
+const {
+  PREDICTION_PATH,
+  DEEP_LEARNING_PATH,
+  PYTHON_CMD,
+} = require('../constants');
+
+const LEGACY_FILES = {
+  all: 'predictions.csv',
+  attacks: 'attacks.csv',
+  normals: 'normals.csv',
+};
+
+const VIEW_FILES = {
+  all: 'predictions_view.csv',
+  attacks: 'attacks_view.csv',
+  normals: 'normals_view.csv',
+};
+
+const writingViews = new Map(); // path of a view file -> Promise of its writing
+
+/**
+ * Run the reader of the prediction results
+ * @param {String} predictionId id of the prediction
+ * @param {Array} args arguments of predictionResults.py after the result path
+ * @returns {Promise<String>} the output of the reader
+ */
+const runReader = (predictionId, args) => new Promise((resolve, reject) => {
+  const resultPath = path.join(PREDICTION_PATH, predictionId);
+  if (!fs.existsSync(resultPath)) {
+    reject(new Error(`The prediction ${predictionId} does not exist`));
+    return;
+  }
+  const proc = spawn(PYTHON_CMD, [`${DEEP_LEARNING_PATH}/predictionResults.py`, resultPath, ...args]);
+  let stdout = '';
+  let stderr = '';
+  proc.stdout.on('data', (data) => { stdout += data.toString(); });
+  proc.stderr.on('data', (data) => { stderr += data.toString(); });
+  proc.on('error', reject);
+  proc.on('close', (code) => {
+    if (code === 0) {
+      resolve(stdout);
+    } else {
+      reject(new Error(stderr.trim().split('\n').pop() || `Reading the prediction ${predictionId} failed`));
+    }
+  });
+});
+
+/**
+ * Get the .csv file of a view of a prediction, written once (again if the prediction has been made again since)
+ * @param {String} predictionId id of the prediction
+ * @param {String} view 'all', 'attacks' or 'normals'
+ * @returns {Promise<String>} path of the .csv file (header and one row per flow)
+ */
+const predictionViewFile = async (predictionId, view = 'all') => {
+  const resultPath = path.join(PREDICTION_PATH, predictionId);
+  const legacyFile = path.join(resultPath, LEGACY_FILES[view]);
+  if (fs.existsSync(legacyFile)) {
+    return legacyFile;
+  }
+  const viewFile = path.join(resultPath, VIEW_FILES[view]);
+  const indexFile = path.join(resultPath, 'index.json');
+  if (fs.existsSync(viewFile) && fs.existsSync(indexFile)
+    && fs.statSync(viewFile).mtimeMs >= fs.statSync(indexFile).mtimeMs) {
+    return viewFile;
+  }
+  if (!writingViews.has(viewFile)) {
+    const writing = runReader(predictionId, [view, '--write'])
+      .then((output) => output.trim())
+      .finally(() => writingViews.delete(viewFile));
+    writingViews.set(viewFile, writing);
+  }
+  return writingViews.get(viewFile);
+};
+
+/**
+ * Get the numbers of flows of a prediction, in the format of the previous stats.csv
+ * @param {String} predictionId id of the prediction
+ * @returns {Promise<String>} "0,1,2\n<normals>,<attacks>,<total>\n"
+ */
+const readPredictionStats = async (predictionId) => {
+  const resultPath = path.join(PREDICTION_PATH, predictionId);
+  const statsFile = path.join(resultPath, 'stats.json');
+  if (!fs.existsSync(statsFile)) {
+    return fs.promises.readFile(path.join(resultPath, 'stats.csv'), 'utf-8');
+  }
+  const { normals, attacks, total } = JSON.parse(await fs.promises.readFile(statsFile, 'utf-8'));
+  return `0,1,2\n${normals},${attacks},${total}\n`;
+};
+
+/**
+ * Get the features of a flow of a prediction, e.g. to explain its prediction
+ * @param {String} predictionId id of the prediction
+ * @param {String} sessionId session id of the flow (an attack flow of the session is taken first)
+ * @returns {Promise<Object>} { featureMap, featureHeaders }
+ */
+const readPredictionFlow = async (predictionId, sessionId) => {
+  const featureMap = JSON.parse(await runReader(predictionId, ['flow', String(sessionId).trim()]));
+  return { featureMap, featureHeaders: Object.keys(featureMap) };
+};
+
+module.exports = {
+  predictionViewFile,
+  readPredictionStats,
+  readPredictionFlow,
+};
@@ -0,0 +1,190 @@
+/**
+ * Client of the long-lived prediction server (prediction_server.py)
+ * The server is started on the first request and keeps the models loaded between the predictions,
+ * requests and responses are JSON lines exchanged on its stdin/stdout.
+ * A request not answered in time (PREDICTION_SERVER_TIMEOUT ms, PREDICTION_SERVER_BATCH_TIMEOUT ms for several
+ * reports) means that the server hangs or is busy for too long: it is killed, all its pending requests are rejected
+ * (their callers fall back to prediction.py) and the next request starts a new server. The server is killed when the
+ * Node process exits.
+ */
+const { spawn } = require('child_process');
+const fs = require('fs');
+const readline = require('readline');
+const {
+  LOG_PATH,
+  DEEP_LEARNING_PATH,
+  PYTHON_CMD,
+} = require('../constants');
+
+const REQUEST_TIMEOUT = parseInt(process.env.PREDICTION_SERVER_TIMEOUT, 10) || 5 * 60 * 1000;
+const BATCH_TIMEOUT = parseInt(process.env.PREDICTION_SERVER_BATCH_TIMEOUT, 10) || 30 * 60 * 1000;
+
+let serverProcess = null;
+let nextRequestId = 1;
+const pendingRequests = new Map(); // request id -> { resolve, reject, proc, timer }
+
+/**
+ * Start the prediction server if it is not running
+ * @returns {ChildProcess} the process of the server
+ */
+const startPredictionServer = () => {
+  if (serverProcess) {
+    return serverProcess;
+  }
+  const proc = spawn(PYTHON_CMD, [`${DEEP_LEARNING_PATH}/prediction_server.py`], {
+    stdio: ['pipe', 'pipe', 'pipe'],
+  });
+  const logFile = fs.createWriteStream(`${LOG_PATH}prediction_server.log`, { flags: 'a' });
+  proc.stderr.pipe(logFile);
+  // writing to a killed server fails, its pending requests are rejected when it stops
+  proc.stdin.on('error', (err) => console.error('[prediction-server] Cannot write to the server:', err.message));
+
+  readline.createInterface({ input: proc.stdout }).on('line', (line) => {
+    let response;
+    try {
+      response = JSON.parse(line);
+    } catch (e) {
+      console.error('[prediction-server] Invalid response:', line);
+      return;
+    }
+    const pending = pendingRequests.get(response.id);
+    if (!pending) {
+      return;
+    }
+    clearTimeout(pending.timer);
+    pendingRequests.delete(response.id);
+    if (response.ok) {
+      pending.resolve(response);
+    } else {
+      pending.reject(new Error(response.error));
+    }
+  });
+
+  const onExit = (err) => {
+    if (serverProcess === proc) {
+      serverProcess = null;
+    }
+    pendingRequests.forEach((pending, id) => {
+      if (pending.proc === proc) {
+        clearTimeout(pending.timer);
+        pending.reject(err || new Error('Prediction server has stopped'));
+        pendingRequests.delete(id);
+      }
+    });
+  };
+  proc.on('error', onExit);
+  proc.on('close', () => onExit(null));
+
+  serverProcess = proc;
+  return proc;
+};
+
+/**
+ * Kill a prediction server which does not answer, its pending requests are rejected once it has stopped
+ * @param {ChildProcess} proc the process of the server
+ */
+const killPredictionServer = (proc) => {
+  if (serverProcess === proc) {
+    // the next requests go to a new server
+    serverProcess = null;
+  }
+  proc.kill('SIGKILL');
+};
+
+/**
+ * Send a request to the prediction server
+ * @param {Object} request the request (see prediction_server.py)
+ * @param {Number} timeout time (in ms) after which the request is rejected and the server is killed
+ * @returns {Promise<Object>} the response of the server
+ */
+const sendRequest = (request, timeout = REQUEST_TIMEOUT) => new Promise((resolve, reject) => {
+  const proc = startPredictionServer();
+  const id = nextRequestId++;
+  const timer = setTimeout(() => {
+    const pending = pendingRequests.get(id);
+    if (!pending) {
+      return;
+    }
+    pendingRequests.delete(id);
+    console.error(`[prediction-server] No response to the request ${id} after ${timeout} ms, kill the server`);
+    pending.reject(new Error(`The prediction server did not answer in ${timeout} ms`));
+    killPredictionServer(proc);
+  }, timeout);
+  pendingRequests.set(id, {
+    resolve, reject, proc, timer,
+  });
+  proc.stdin.write(`${JSON.stringify({ ...request, id })}\n`);
+});
+
+/**
+ * Predict the flows of a report, the predictions are saved in resultPath (as prediction.py)
+ * @param {String} csvPath path of the mmt-probe report
+ * @param {String} modelPath path of the model
+ * @param {String} resultPath path where the predictions are saved
+ * @param {String} stream id of the stream of consecutive reports the report belongs to (optional): the flows are
+ * carried from one report of the stream to the next, only the flows updated by the report are predicted
+ * @returns {Promise<Object>} { flows, attacks, time_ms }
+ */
+const predictReport = (csvPath, modelPath, resultPath, stream = null) => sendRequest({
+  model: modelPath,
+  report: csvPath,
+  output: resultPath,
+  ...(stream ? { stream } : {}),
+});
+
+/**
+ * Predict several reports together, the predictions of each report are saved in resultPath/<report file name>/
+ * (resultPath/<report path relative to the common folder of the reports>/ if several reports have the same file name)
+ * @param {Array} reports paths of the reports, folders of reports or glob patterns
+ * @param {String} modelPath path of the model
+ * @param {String} resultPath path where the predictions are saved
+ * @returns {Promise<Object>} { reports: { <report path>: { flows, attacks, output } }, time_ms }
+ */
+const predictReports = (reports, modelPath, resultPath) => sendRequest({
+  model: modelPath,
+  reports,
+  output: resultPath,
+}, BATCH_TIMEOUT);
+
+/**
+ * Predict a batch of features
+ * @param {String} modelPath path of the model
+ * @param {Array} features rows of features (arrays or objects by feature name)
+ * @returns {Promise<Object>} { predictions, time_ms }
+ */
+const predictFeatures = (modelPath, features) => sendRequest({
+  model: modelPath,
+  features,
+});
+
+/**
+ * Release the flows carried by the server for a stream of reports (see predictReport), the next report of the stream
+ * starts a new stream
+ * @param {String} stream id of the stream
+ * @returns {Promise<Object>} the response of the server (nothing to release if the server is not running)
+ */
+const closeStream = (stream) => {
+  if (!serverProcess) {
+    return Promise.resolve({ ok: true });
+  }
+  return sendRequest({ command: 'close', stream });
+};
+
+/**
+ * Stop the prediction server when the Node process exits (the server would otherwise outlive it while busy)
+ */
+const stopPredictionServer = () => {
+  if (serverProcess) {
+    serverProcess.kill();
+    serverProcess = null;
+  }
+};
+process.on('exit', stopPredictionServer);
+
+module.exports = {
+  startPredictionServer,
+  predictReport,
+  predictReports,
+  predictFeatures,
+  closeStream,
+};
@@ -1,35 +1,27 @@
+import glob
 import os
 import sys
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 import pandas as pd
 import constants
-from tensorflow.keras.models import load_model
-from eventToFeature import eventsToFeatures
+from liteModel import loadModel
+from featureScaler import loadScaler
+from featureCache import cachedEventsToFeatures
+from predictionResults import writePredictions
 
 sys.path.append(sys.path[0] + '/..')
 
-def predict(csv_path, model_path, result_path):
-    ips, features = eventsToFeatures(csv_path)
-    if len(ips) == 0:
-        print('There is no ip traffic to predict')
-        return
-    # if there are more ips then grouped samples from features (i.e. there is an ip but no features for the ip) -> we delete the ip from ip list
-    print("Going to merge features if there are more ips")
-    ips = pd.merge(ips, features, how='inner', on=['ip.session_id', 'meta.direction'])
-    ips = ips[['ip.session_id', 'meta.direction', 'ip']]
-    features.drop(columns=['ip.session_id', 'meta.direction'], inplace=True)
-
-    print("Going to test the prediction")
-    model = load_model(model_path)
-    print("Model has been loaded from")
-    
-    # Check if feature dimensions match the model's expected input
+def matchModelInput(features, model):
+    """
+    Checks that the features have the dimension expected by the model, and selects or pads them otherwise
+    """
     expected_features = model.input_shape[1]
     current_features = features.shape[1]
-    
+
     if current_features != expected_features:
         print(f"Warning: Feature mismatch - Model expects {expected_features} features, but got {current_features}")
-        
+
         if current_features > expected_features:
             # Too many features - select the first N features
             print(f"Selecting first {expected_features} features to match model input")
@@ -39,41 +31,194 @@ def predict(csv_path, model_path, result_path):
             print(f"Padding with {expected_features - current_features} zero columns")
             padding = pd.DataFrame(np.zeros((features.shape[0], expected_features - current_features)))
             features = pd.concat([features, padding], axis=1)
-    
-    y_pred = model.predict(features)
+    return features
+
+
+def scaleFeatures(features, scaler):
+    """
+    :param features: features matching the model input
+    :param scaler: scaler saved with the model at training time (see featureScaler.loadScaler), or None
+    :return: features as given to the model
+    """
+    if scaler is None:
+        return features
+    return scaler.transform(features)
+
+
+def predictFeatures(features, model, scaler=None):
+    """
+    :param features: dataframe of features (without the session id and direction)
+    :param model: loaded model
+    :param scaler: scaler saved with the model (the features are not scaled if None)
+    :return: features matching the model input and the predicted class (0: normal, 1: attack) of each flow
+    :raise ValueError: if features the model was trained on are missing
+    """
+    if scaler is not None:
+        # the features the model was trained on, by name (the scaler saved their names)
+        features = scaler.select(features)
+    features = matchModelInput(features, model)
+    y_pred = model.predict(scaleFeatures(features, scaler))
     y_pred = np.transpose(np.round(y_pred)).reshape(y_pred.shape[0], )
-    preds = np.array([y_pred]).T
-    nb_attacks = np.count_nonzero(preds != 0)
-    res = np.append(features, preds, axis=1)
-    res = np.append(ips, res, axis=1)
-
-    if not os.path.exists(result_path):
-        os.makedirs(result_path)
-    dataFrame = pd.DataFrame(res)
-    print("Total flows: "+ str(len(dataFrame.index)))
-    
-    # Use only the header values that match the actual DataFrame columns
-    num_cols = len(dataFrame.columns)
-    header = constants.AD_FEATURES_OUTPUT[:num_cols] if num_cols <= len(constants.AD_FEATURES_OUTPUT) else None
-    last_column_index = num_cols - 1
-    
-    dataFrame.to_csv(f"{result_path}/predictions.csv", index=False, header=header)
-
-    attackDF = dataFrame[dataFrame[last_column_index] > 0]
-    print("Number of attacks: " + str(len(attackDF.index)))
-    attackDF.to_csv(f"{result_path}/attacks.csv", index=False, header=header)
-
-    normalDF = dataFrame[dataFrame[last_column_index] == 0]
-    print("Number of normals: " + str(len(normalDF.index)))
-    normalDF.to_csv(f"{result_path}/normals.csv", index=False, header=header)
-
-    statsArray =np.array([[len(normalDF.index), len(attackDF.index), len(dataFrame.index)]])
-    pd.DataFrame(statsArray).to_csv(f"{result_path}/stats.csv", index=False)
+    return features, y_pred
+
+
+def savePredictions(ips, features, y_pred, result_path):
+    """
+    Saves the predictions (all flows, indices of the attacks and normals, and stats) in result_path
+
+    :return: number of flows, number of attacks
+    """
+    nb_flows, nb_attacks = writePredictions(ips, features, y_pred, result_path)
+    print("Total flows: " + str(nb_flows))
+    print("Number of attacks: " + str(nb_attacks))
+    print("Number of normals: " + str(nb_flows - nb_attacks))
+    return nb_flows, nb_attacks
+
+
+def predict(csv_path, model_path, result_path, model=None, scaler=None):
+    """
+    Predicts the flows of a mmt-probe report and saves the predictions in result_path
+
+    :param model: model already loaded (e.g. by the prediction server), loaded from model_path otherwise
+    :param scaler: scaler of the model already loaded, loaded with the model otherwise
+    :return: number of flows, number of attacks
+    """
+    ips, features = cachedEventsToFeatures(csv_path)
+    if len(ips) == 0:
+        print('There is no ip traffic to predict')
+        return 0, 0
+    if model is None:
+        model = loadModel(model_path)
+        scaler = loadScaler(model_path)
+        print("Model has been loaded from")
+    return predictFlows(ips, features, model, result_path, scaler)
+
+
+def flowInputs(ips, features):
+    """
+    :param ips: ips of the flows
+    :param features: features of the flows (with the session id and direction)
+    :return: ips of the flows which have features, features without the session id and direction
+    """
+    # if there are more ips then grouped samples from features (i.e. there is an ip but no features for the ip) -> we delete the ip from ip list
+    ips = pd.merge(ips, features, how='inner', on=['ip.session_id', 'meta.direction'])
+    ips = ips[['ip.session_id', 'meta.direction', 'ip']]
+    return ips, features.drop(columns=['ip.session_id', 'meta.direction'])
+
+
+def predictFlows(ips, features, model, result_path, scaler=None):
+    """
+    Predicts flows and saves the predictions in result_path
+
+    :param ips: ips of the flows
+    :param features: features of the flows (with the session id and direction)
+    :param scaler: scaler saved with the model
+    :return: number of flows, number of attacks
+    """
+    print("Going to merge features if there are more ips")
+    ips, features = flowInputs(ips, features)
+
+    print("Going to test the prediction")
+    features, y_pred = predictFeatures(features, model, scaler)
+    return savePredictions(ips, features, y_pred, result_path)
+
+
+def reportPaths(inputs):
+    """
+    :param inputs: reports, folders of reports or glob patterns
+    :return: paths of the .csv reports, in order and without duplicates
+    """
+    paths = []
+    for report_input in inputs:
+        if os.path.isdir(report_input):
+            matches = glob.glob(os.path.join(report_input, '*.csv'))
+        else:
+            matches = glob.glob(report_input)
+        paths.extend(path for path in sorted(matches) if os.path.basename(path) != 'security-reports.csv')
+    return list(dict.fromkeys(paths))
+
+
+def reportResultFolders(csv_paths):
+    """
+    Names the folder of the predictions of each report: its file name, or its path relative to the common folder of
+    the reports if several of them have the same file name (e.g. the data.csv of each mmt-probe output folder)
+
+    :param csv_paths: paths of the reports, without duplicates
+    :return: dictionary report path -> folder of its predictions, relative to the result path
+    """
+    names = [os.path.basename(csv_path) for csv_path in csv_paths]
+    if len(set(names)) == len(names):
+        return dict(zip(csv_paths, names))
+    abs_paths = [os.path.abspath(csv_path) for csv_path in csv_paths]
+    common_path = os.path.commonpath([os.path.dirname(abs_path) for abs_path in abs_paths])
+    return {csv_path: os.path.relpath(abs_path, common_path) for csv_path, abs_path in zip(csv_paths, abs_paths)}
+
+
+def predictReports(inputs, model_path, result_path, model=None, scaler=None,
+                   workers=constants.PREDICTION_BATCH_WORKERS, max_flows=constants.PREDICTION_BATCH_MAX_FLOWS):
+    """
+    Predicts several reports with one model: the features of the reports are calculated in parallel and predicted
+    together (by batches of at most max_flows flows), the predictions of each report are saved in
+    result_path/<report file name>/, or result_path/<report path relative to the common folder of the reports>/ if
+    several reports have the same file name (see reportResultFolders)
+
+    :param inputs: reports, folders of reports or glob patterns
+    :param model: model already loaded (e.g. by the prediction server), loaded from model_path otherwise
+    :param scaler: scaler of the model already loaded, loaded with the model otherwise
+    :param workers: number of processes calculating the features
+    :return: dictionary report path -> (number of flows, number of attacks)
+    """
+    csv_paths = reportPaths(inputs)
+    results = {csv_path: (0, 0) for csv_path in csv_paths}
+    result_folders = reportResultFolders(csv_paths)
+    if not csv_paths:
+        print('There is no report to predict')
+        return results
+    if model is None:
+        model = loadModel(model_path)
+        scaler = loadScaler(model_path)
+        print("Model has been loaded from")
+
+    batch = []  # (report, ips, features) waiting for the prediction
+
+    def predictBatch():
+        features, y_pred = predictFeatures(pd.concat([report_features for _, _, report_features in batch],
+                                                     ignore_index=True), model, scaler)
+        offset = 0
+        for csv_path, report_ips, report_features in batch:
+            nb_flows = len(report_features)
+            results[csv_path] = savePredictions(report_ips, features.iloc[offset:offset + nb_flows],
+                                                y_pred[offset:offset + nb_flows],
+                                                os.path.join(result_path, result_folders[csv_path]))
+            offset += nb_flows
+        batch.clear()
+
+    workers = min(workers, len(csv_paths))
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    extracted = executor.map(cachedEventsToFeatures, csv_paths) if executor else map(cachedEventsToFeatures, csv_paths)
+    try:
+        for csv_path, (ips, features) in zip(csv_paths, extracted):
+            if len(ips) == 0 or len(features) == 0:
+                print(f'There is no ip traffic to predict in {csv_path}')
+                continue
+            batch.append((csv_path, *flowInputs(ips, features)))
+            if sum(len(report_features) for _, _, report_features in batch) >= max_flows:
+                predictBatch()
+        if batch:
+            predictBatch()
+    finally:
+        if executor:
+            executor.shutdown()
+    return results
+
 
 if __name__ == "__main__":
-    import sys
-    if len(sys.argv) != 4:
+    if len(sys.argv) >= 5 and sys.argv[1] == '--batch':
+        predictReports(sys.argv[4:], sys.argv[2], sys.argv[3])
+    elif len(sys.argv) != 4:
         print('Invalid inputs')
+        print('python prediction.py <csv_path> <model_path> <result_path>')
+        print('python prediction.py --batch <model_path> <result_path> <report|folder|glob>...')
     else:
         csv_path = sys.argv[1]
         model_path = sys.argv[2]
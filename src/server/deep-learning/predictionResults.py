@@ -0,0 +1,158 @@
+"""
+Results of a prediction, written once: the flows (ips, features and predicted class) in one columnar file, the
+attack and normal flows as lists of row indices (index.json), and the numbers of flows (stats.json).
+The readers give the views served by the routes (all flows, attacks, normals, stats); the .csv file of a view is
+written on its first request (see writeView) and then served as it is. The results written by the previous versions
+(predictions.csv, attacks.csv, normals.csv, stats.csv) are still read.
+"""
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+from featureStore import FEATURE_FILE_EXTENSION, readFeatures, writeFeatures
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from python_logger import print_error
+
+VIEWS = ['all', 'attacks', 'normals']
+LEGACY_FILES = {'all': 'predictions.csv', 'attacks': 'attacks.csv', 'normals': 'normals.csv'}
+VIEW_FILES = {'all': 'predictions_view.csv', 'attacks': 'attacks_view.csv', 'normals': 'normals_view.csv'}
+
+
+def predictionsFile(result_path):
+    """
+    :return: path of the columnar file of the predictions in result_path
+    """
+    for extension in (FEATURE_FILE_EXTENSION, '.parquet', '.pkl'):
+        path = os.path.join(result_path, f"predictions{extension}")
+        if os.path.isfile(path):
+            return path
+    return os.path.join(result_path, f"predictions{FEATURE_FILE_EXTENSION}")
+
+
+def writePredictions(ips, features, y_pred, result_path):
+    """
+    :param ips: ips of the flows (session id, direction, ip)
+    :param features: features of the flows (as given to the model)
+    :param y_pred: predicted class of the flows (0: normal, 1: attack)
+    :param result_path: folder of the results
+    :return: number of flows, number of attacks
+    """
+    os.makedirs(result_path, exist_ok=True)
+    predictions = pd.concat([ips.reset_index(drop=True), features.reset_index(drop=True)], axis=1)
+    predictions.columns = [str(col) for col in predictions.columns]
+    predictions['malware'] = np.asarray(y_pred).astype(int)
+    writeFeatures(predictions, os.path.join(result_path, f"predictions{FEATURE_FILE_EXTENSION}"))
+
+    attacks = np.flatnonzero(predictions['malware'].to_numpy() > 0)
+    normals = np.flatnonzero(predictions['malware'].to_numpy() == 0)
+    with open(os.path.join(result_path, 'index.json'), 'w') as index_file:
+        json.dump({'attacks': attacks.tolist(), 'normals': normals.tolist()}, index_file)
+    stats = {'normals': len(normals), 'attacks': len(attacks), 'total': len(predictions)}
+    with open(os.path.join(result_path, 'stats.json'), 'w') as stats_file:
+        json.dump(stats, stats_file)
+    return stats['total'], stats['attacks']
+
+
+def legacyFile(result_path, view):
+    """
+    :return: path of the .csv file of the view written by the previous versions, or None if there is none
+    """
+    path = os.path.join(result_path, LEGACY_FILES[view])
+    return path if os.path.isfile(path) and not os.path.isfile(predictionsFile(result_path)) else None
+
+
+def readPredictions(result_path, view='all', columns=None):
+    """
+    :param result_path: folder of the results
+    :param view: 'all', 'attacks' or 'normals'
+    :param columns: columns to read (all by default)
+    :return: dataframe of the predicted flows of the view
+    """
+    legacy_file = legacyFile(result_path, view)
+    if legacy_file is not None:
+        return pd.read_csv(legacy_file, header=None, usecols=columns)
+    path = predictionsFile(result_path)
+    predictions = readFeatures(path, columns=columns)
+    if 'ip' in predictions.columns:
+        predictions['ip'] = predictions['ip'].map(list)
+    if view == 'all':
+        return predictions
+    with open(os.path.join(result_path, 'index.json')) as index_file:
+        rows = json.load(index_file)[view]
+    return predictions.iloc[rows]
+
+
+def writeView(result_path, view):
+    """
+    Writes the .csv file of a view (the file written by the previous versions if there is one)
+
+    :return: path of the .csv file of the view
+    """
+    legacy_file = legacyFile(result_path, view)
+    if legacy_file is not None:
+        return legacy_file
+    path = os.path.join(result_path, VIEW_FILES[view])
+    # written under another name first: a view being written is never served
+    readPredictions(result_path, view).to_csv(f"{path}.tmp", index=False)
+    os.replace(f"{path}.tmp", path)
+    return path
+
+
+def readStats(result_path):
+    """
+    :return: dictionary with the number of normals, attacks and total flows
+    """
+    stats_file = os.path.join(result_path, 'stats.json')
+    if os.path.isfile(stats_file):
+        with open(stats_file) as f:
+            return json.load(f)
+    stats = pd.read_csv(os.path.join(result_path, 'stats.csv')).iloc[0].tolist()
+    return dict(zip(['normals', 'attacks', 'total'], stats))
+
+
+def readFlow(result_path, session_id):
+    """
+    :param result_path: folder of the results
+    :param session_id: session id of the flow
+    :return: dictionary of the features (by name) of the flow, an attack flow of the session is taken first
+    """
+    for view in ('attacks', 'all'):
+        legacy_file = legacyFile(result_path, view)
+        if legacy_file is not None:
+            flows = pd.read_csv(legacy_file)
+        elif os.path.isfile(predictionsFile(result_path)):
+            flows = readPredictions(result_path, view)
+        else:
+            continue
+        flows = flows[flows.iloc[:, 0].astype(str) == str(session_id)]
+        if len(flows) > 0:
+            # features are between the ips (session id, direction, ip) and the predicted class
+            features = pd.to_numeric(flows.iloc[0, 3:-1], errors='coerce').fillna(0)
+            return {str(name): float(value) for name, value in features.items()}
+    raise KeyError(f"Session {session_id} not found in {result_path}")
+
+
+if __name__ == "__main__":
+    nb_args = 4 if len(sys.argv) > 2 and (sys.argv[2] == 'flow' or sys.argv[-1] == '--write') else 3
+    if len(sys.argv) != nb_args or sys.argv[2] not in VIEWS + ['stats', 'flow'] or \
+            (sys.argv[-1] == '--write' and sys.argv[2] not in VIEWS):
+        print_error('Invalid inputs')
+        print_error(f"python predictionResults.py <result_path> <{'|'.join(VIEWS + ['stats'])}>")
+        print_error(f"python predictionResults.py <result_path> <{'|'.join(VIEWS)}> --write")
+        print_error("python predictionResults.py <result_path> flow <session_id>")
+        sys.exit(1)
+    if sys.argv[-1] == '--write':
+        print(writeView(sys.argv[1], sys.argv[2]))
+    elif sys.argv[2] == 'stats':
+        print(json.dumps(readStats(sys.argv[1])))
+    elif sys.argv[2] == 'flow':
+        print(json.dumps(readFlow(sys.argv[1], sys.argv[3])))
+    elif legacyFile(sys.argv[1], sys.argv[2]) is not None:
+        with open(legacyFile(sys.argv[1], sys.argv[2])) as f:
+            sys.stdout.write(f.read())
+    else:
+        readPredictions(sys.argv[1], sys.argv[2]).to_csv(sys.stdout, index=False)
@@ -0,0 +1,196 @@
+"""
+Long-lived prediction service: keeps the models loaded (least recently used ones are unloaded) and predicts reports or
+batches of features, so that each prediction does not pay the import of TensorFlow and the loading of the model.
+
+Requests and responses are JSON objects, one per line, read from stdin and written to stdout (default) or exchanged
+on a local unix socket (--socket <path>):
+  {"id": 1, "model": "<model id or path>", "report": "<report .csv>", "output": "<result path>"}
+    -> {"id": 1, "ok": true, "flows": <nb flows>, "attacks": <nb attacks>, "time_ms": <time>}
+  {"id": 2, "model": "<model id or path>", "features": [[...], ...] or [{"<feature>": ...}, ...]}
+    -> {"id": 2, "ok": true, "predictions": [0, 1, ...], "time_ms": <time>}
+  {"id": 5, "model": "<model id or path>", "report": "<report .csv>", "output": "<result path>", "stream": "<id>"}
+    -> same as a report, the flows are carried from one report of the stream to the next (e.g. the consecutive
+       reports of an online mmt-probe), only the flows which got packets in the report are predicted
+  {"id": 7, "model": "<model id or path>", "reports": ["<report .csv, folder or glob>", ...], "output": "<result path>"}
+    -> {"id": 7, "ok": true, "reports": {"<report .csv>": {"flows": <nb flows>, "attacks": <nb attacks>,
+                                                            "output": "<result path of the report>"}, ...}}
+       the reports are predicted together, the predictions of each report are in <result path>/<report file name>/
+       (or <result path>/<report path relative to the common folder of the reports>/ if file names are repeated)
+  {"id": 6, "command": "close", "stream": "<id>"}
+  {"id": 3, "command": "stats"} -> {"id": 3, "ok": true, "models": [...], "requests": <nb requests>}
+  {"id": 4, "command": "stop"}
+A failed request gets {"id": ..., "ok": false, "error": "<message>"}
+"""
+import sys
+
+# Responses are written to the original stdout, all the other outputs (prints, logs, progress bars) go to stderr
+PROTOCOL_OUT = sys.stdout
+sys.stdout = sys.stderr
+
+import argparse
+import json
+import os
+import socketserver
+import timeit
+from collections import OrderedDict
+
+import pandas as pd
+import constants
+from liteModel import loadModel
+from featureScaler import loadScaler
+from eventToFeature import mergeIpEvents, readMMTReportFile
+from flowFeatures import OnlineFlowFeatures
+from prediction import predict, predictFeatures, predictFlows, predictReports, reportResultFolders
+
+MODELS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models')
+
+
+class ModelCache:
+    """
+    Loaded models (and their scalers) by model id (or path), at most max_models are kept
+    """
+
+    def __init__(self, max_models=constants.PREDICTION_MODELS_CACHE_SIZE):
+        self.max_models = max_models
+        self.models = OrderedDict()
+
+    def get(self, model_id):
+        """
+        :param model_id: model file name (in the models folder) or path
+        :return: loaded model and its scaler, reloaded if the model file has been modified since it was loaded
+        """
+        model_path = model_id if os.path.isfile(model_id) else os.path.join(MODELS_PATH, model_id)
+        if not os.path.isfile(model_path):
+            raise FileNotFoundError(f"Model {model_id} does not exist")
+        modified_at = os.path.getmtime(model_path)
+        if model_id in self.models and self.models[model_id][0] == modified_at:
+            self.models.move_to_end(model_id)
+            return self.models[model_id][1:]
+        print(f"Load the model {model_path}")
+        self.models[model_id] = (modified_at, loadModel(model_path), loadScaler(model_path))
+        self.models.move_to_end(model_id)
+        if len(self.models) > self.max_models:
+            unloaded_id, _ = self.models.popitem(last=False)
+            print(f"Unload the model {unloaded_id}")
+        return self.models[model_id][1:]
+
+
+class PredictionServer:
+
+    def __init__(self, max_models=constants.PREDICTION_MODELS_CACHE_SIZE):
+        self.models = ModelCache(max_models)
+        self.streams = {}  # stream id -> OnlineFlowFeatures
+        self.nb_requests = 0
+        self.running = True
+
+    def handle(self, line):
+        """
+        :param line: JSON request
+        :return: JSON response
+        """
+        request_id = None
+        start = timeit.default_timer()
+        try:
+            request = json.loads(line)
+            request_id = request.get('id')
+            response = self._handle(request)
+        except Exception as e:
+            print(f"Request {request_id} failed: {e}")
+            response = {'ok': False, 'error': str(e)}
+        self.nb_requests += 1
+        response['id'] = request_id
+        response['time_ms'] = round((timeit.default_timer() - start) * 1000, 3)
+        return json.dumps(response)
+
+    def _handle(self, request):
+        command = request.get('command')
+        if command == 'stats':
+            return {'ok': True, 'models': list(self.models.models), 'streams': list(self.streams),
+                    'requests': self.nb_requests}
+        if command == 'close':
+            self.streams.pop(request['stream'], None)
+            return {'ok': True}
+        if command == 'stop':
+            self.running = False
+            return {'ok': True}
+        if command is not None:
+            raise ValueError(f"Unknown command {command}")
+
+        model, scaler = self.models.get(request['model'])
+        if 'stream' in request:
+            nb_flows, nb_attacks = self._predictStream(request, model, scaler)
+            return {'ok': True, 'flows': nb_flows, 'attacks': nb_attacks}
+        if 'reports' in request:
+            results = predictReports(request['reports'], request['model'], request['output'], model=model,
+                                     scaler=scaler)
+            result_folders = reportResultFolders(list(results))
+            return {'ok': True, 'reports': {csv_path: {'flows': nb_flows, 'attacks': nb_attacks,
+                                                       'output': os.path.join(request['output'], folder)}
+                                            for (csv_path, (nb_flows, nb_attacks)), folder
+                                            in zip(results.items(), result_folders.values())}}
+        if 'report' in request:
+            nb_flows, nb_attacks = predict(request['report'], request['model'], request['output'], model=model,
+                                           scaler=scaler)
+            return {'ok': True, 'flows': nb_flows, 'attacks': nb_attacks}
+        rows = request['features']
+        if scaler is not None and rows and not isinstance(rows[0], dict):
+            # features given by position: in the order of the features of the model
+            features = pd.DataFrame(rows, columns=scaler.features)
+        else:
+            features = pd.DataFrame(rows)
+        features = features.drop(columns=['ip.session_id', 'meta.direction'], errors='ignore')
+        _, y_pred = predictFeatures(features, model, scaler)
+        return {'ok': True, 'predictions': y_pred.astype(int).tolist()}
+
+    def _predictStream(self, request, model, scaler):
+        flows = self.streams.setdefault(request['stream'], OnlineFlowFeatures())
+        events = readMMTReportFile(request['report'])
+        ip_traffic = mergeIpEvents(events["ipv4-event"], events["ipv6-event"])
+        (ips, features), _ = flows.update(ip_traffic, events["tcp-event"], events["tls-event"])
+        if len(features) == 0:
+            print('There is no ip traffic to predict')
+            return 0, 0
+        return predictFlows(ips, features.fillna(0), model, request['output'], scaler)
+
+    def serveStdin(self):
+        for line in sys.stdin:
+            if not line.strip():
+                continue
+            PROTOCOL_OUT.write(self.handle(line) + '\n')
+            PROTOCOL_OUT.flush()
+            if not self.running:
+                break
+
+    def serveSocket(self, socket_path):
+        server = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                for line in self.rfile:
+                    if not line.strip():
+                        continue
+                    self.wfile.write((server.handle(line) + '\n').encode())
+                    if not server.running:
+                        break
+
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        with socketserver.UnixStreamServer(socket_path, Handler) as unix_server:
+            print(f"Prediction server listening on {socket_path}")
+            while self.running:
+                unix_server.handle_request()
+        os.remove(socket_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Prediction server keeping the models loaded")
+    parser.add_argument("--socket", help="Path of the unix socket to listen on (stdin/stdout by default)")
+    parser.add_argument("--max-models", type=int, default=constants.PREDICTION_MODELS_CACHE_SIZE,
+                        help="Maximal number of models kept loaded")
+    args = parser.parse_args()
+
+    prediction_server = PredictionServer(args.max_models)
+    if args.socket:
+        prediction_server.serveSocket(args.socket)
+    else:
+        prediction_server.serveStdin()
@@ -4,28 +4,50 @@ from sklearn.metrics import classification_report
 import numpy as np
 import pandas as pd
 import sys
-from tools import saveConfMatrix, saveScores, dataScale_cnn
-from sae_cnn import trainSAE_CNN
+from tools import saveConfMatrix, saveScores, dataScale_cnn, dataScale_model
+from featureStore import readFeatures
+from featureScaler import loadScaler, scalerPath
+from featureDataset import fitScaler
+from liteModel import modelResultPaths
+from liteModel import exportModel
+from cpuProfile import profileSettings, applyProfile
+import constants
+import json
+import shutil
 import timeit
 import os
 
 
-def retrain_model(train_data_path, test_data_path, result_path, nb_epoch_cnn, nb_epoch_sae, batch_size_cnn, batch_size_sae):
-    train_data = pd.read_csv(train_data_path, delimiter=",")
-    train_data.drop(columns=['ip.session_id', 'meta.direction'], inplace=True)
+def retrain_model(train_data_path, test_data_path, result_path, nb_epoch_cnn, nb_epoch_sae, batch_size_cnn, batch_size_sae,
+                  pretrain_sae=constants.SAE_PRETRAINING, freeze_encoders=constants.SAE_FREEZE_ENCODERS,
+                  cpu_profile=constants.CPU_PROFILE):
+    # applied before any operation of TensorFlow
+    profile = applyProfile(profileSettings(cpu_profile))
+    # imports TensorFlow: only once the profile is applied (TF_ENABLE_ONEDNN_OPTS is read by the import)
+    from sae_cnn import trainSAE_CNN
+    train_data = readFeatures(train_data_path, exclude=['ip.session_id', 'meta.direction'])
 
-    test_data = pd.read_csv(test_data_path, delimiter=",")
-    test_data.drop(columns=['ip.session_id', 'meta.direction'], inplace=True)
+    test_data = readFeatures(test_data_path, exclude=['ip.session_id', 'meta.direction'])
 
     d = datetime.now()
-    x_train_norm, x_train_mal, x_test_norm, x_test_mal, x_train, y_train, x_test, y_test, scaler = dataScale_cnn(result_path,
+    # the samples of each class are selected by trainSAE_CNN, only if the autoencoders are pre-trained
+    _, _, _, _, x_train, y_train, x_test, y_test, scaler = dataScale_cnn(result_path,
         train_data,
-        test_data, datetime=d)
+        test_data, datetime=d, split_classes=False)
 
-    cnn = trainSAE_CNN(result_path=result_path, x_train_norm=x_train_norm, x_train_mal=x_train_mal,
-                       x_train=x_train, y_train=y_train,
+    cnn = trainSAE_CNN(result_path=result_path, x_train=x_train, y_train=y_train,
                        nb_epoch_cnn=nb_epoch_cnn, nb_epoch_sae=nb_epoch_sae,
-                       batch_size_cnn=batch_size_cnn, batch_size_sae=batch_size_sae, datenow=d)
+                       batch_size_cnn=batch_size_cnn, batch_size_sae=batch_size_sae, datenow=d,
+                       pretrain_sae=pretrain_sae, freeze_encoders=freeze_encoders, profile=profile)
+    saveResults(cnn, x_test, y_test, test_data, result_path, profile)
+
+
+def saveResults(cnn, x_test, y_test, test_data, result_path, profile=None):
+    """
+    Evaluates the retrained model on the test set and saves it with its predictions, scores and prediction time
+
+    :param profile: CPU profile applied to the training (see cpuProfile.applyProfile), None if there is none
+    """
     print("Prediction - test")
     y_pred = cnn.predict(x_test)
     print(y_pred)
@@ -50,6 +72,14 @@ def retrain_model(train_data_path, test_data_path, result_path, nb_epoch_cnn, nb
     #                         header=test_data.columns)
     print('Going to save model')
     cnn.save(f'{result_path}/model.h5')
+    if profile is not None and profile['mixed_precision']:
+        # the bfloat16 operations are not always supported by the TFLite converter, model.h5 is saved anyway
+        try:
+            exportModel(cnn, x_test, result_path)
+        except Exception as e:
+            print(f"The mixed precision model could not be exported to TFLite: {e}")
+    else:
+        exportModel(cnn, x_test, result_path)
 
     # Compute time for predictions and save it to file
     generation_iters = 1
@@ -61,11 +91,130 @@ def retrain_model(train_data_path, test_data_path, result_path, nb_epoch_cnn, nb
       f.write(str(time_taken))
       f.close()
 
+
+def reservoirSample(data_path, size, seed=0):
+    """
+    Uniform sample of the rows of a dataset, read by chunks (reservoir sampling), so that the old training set is
+    never loaded at once
+
+    :param data_path: .csv dataset
+    :param size: number of rows of the sample
+    :return: dataframe of at most size rows
+    """
+    rng = np.random.default_rng(seed)
+    reservoir = None
+    seen = 0
+    for chunk in pd.read_csv(data_path, chunksize=constants.REPORT_CHUNK_SIZE):
+        chunk = chunk.drop(columns=['ip.session_id', 'meta.direction'], errors='ignore')
+        if reservoir is None:
+            reservoir = chunk.iloc[:0].copy()
+        free = max(0, size - len(reservoir))
+        if free > 0:
+            reservoir = pd.concat([reservoir, chunk.iloc[:free]], ignore_index=True)
+        rest = chunk.iloc[free:]
+        # row i (0-based over the whole dataset) replaces a random row of the reservoir with probability size / (i + 1)
+        positions = rng.integers(0, seen + free + np.arange(len(rest)) + 1)
+        rows = np.flatnonzero(positions < size)
+        if len(rows) > 0:
+            # the last row drawing a position wins over the earlier ones, as in the sequential algorithm
+            last_positions, last_rows = np.unique(positions[rows][::-1], return_index=True)
+            reservoir.iloc[last_positions] = rest.iloc[rows[::-1][last_rows]].to_numpy()
+        seen += len(chunk)
+    return reservoir if reservoir is not None else pd.DataFrame()
+
+
+def trainingSetPath(model_path):
+    """
+    :return: path of the training set the model was trained on (datasets/Train_samples.csv of its training)
+    """
+    return os.path.join(os.path.dirname(modelResultPaths(model_path)[-1]), 'datasets', 'Train_samples.csv')
+
+
+def ensureModelScaler(model_path, replay_data_path=None):
+    """
+    Fits and saves the scaler of a deployed model trained before the scalers were saved, on its own training set:
+    never on the new samples of a fine-tuning, the predictions and explanations of the model use the saved scaler
+
+    :param replay_data_path: old training set of the model, if given
+    """
+    if loadScaler(model_path) is not None:
+        return
+    training_set = replay_data_path if replay_data_path and os.path.isfile(replay_data_path) else \
+        trainingSetPath(model_path)
+    if not os.path.isfile(training_set):
+        raise ValueError(f"The model {model_path} has no saved scaler and its training set {training_set} does not "
+                         f"exist: it cannot be fine-tuned")
+    print(f"Fit the scaler of the model on its training set {training_set}")
+    fitScaler(training_set, modelResultPaths(model_path)[-1])
+
+
+def finetune_model(model_path, train_data_path, test_data_path, result_path, nb_epoch, batch_size,
+                   replay_data_path=None, replay_size=constants.FINETUNE_REPLAY_SIZE):
+    """
+    Continues the training of a deployed model on new samples, instead of training a new model on all the samples:
+    the weights of the model are the starting point, the samples are scaled with the scaler of the model, a reservoir
+    sample of the old training set can be replayed with the new samples (against forgetting) and the training stops
+    when the loss on a validation split does not improve anymore
+
+    :param model_path: path of the deployed model (.h5)
+    :param train_data_path: new training samples
+    :param replay_data_path: old training set of the model (Train_samples.csv), None for no replay
+    """
+    from tensorflow.keras.callbacks import EarlyStopping
+    from tensorflow.keras.metrics import Precision, Recall
+    from tensorflow.keras.models import load_model
+    from tensorflow.keras.optimizers import Adam
+
+    start = timeit.default_timer()
+    ensureModelScaler(model_path, replay_data_path)
+    train_data = readFeatures(train_data_path, exclude=['ip.session_id', 'meta.direction'])
+    test_data = readFeatures(test_data_path, exclude=['ip.session_id', 'meta.direction'])
+    nb_new = len(train_data)
+    if replay_data_path and replay_size > 0 and os.path.isfile(replay_data_path):
+        replay = reservoirSample(replay_data_path, replay_size)
+        print(f"Replay {len(replay)} samples of {replay_data_path}")
+        train_data = pd.concat([train_data, replay[train_data.columns]], ignore_index=True)
+
+    _, _, _, _, x_train, y_train, x_test, y_test, _ = dataScale_model(model_path, train_data, test_data,
+                                                                      fit_missing=False)
+    # Keras takes the validation split at the end of the samples: shuffle them first
+    order = np.random.default_rng(0).permutation(len(x_train))
+    x_train, y_train = x_train[order], y_train[order]
+
+    cnn = load_model(model_path)
+    cnn.compile(metrics=['accuracy', Precision(), Recall()],
+                optimizer=Adam(learning_rate=constants.FINETUNE_LEARNING_RATE), loss='binary_crossentropy')
+    print("CNN fine-tuning")
+    history = cnn.fit(x=x_train, y=y_train, epochs=nb_epoch, shuffle=True, batch_size=batch_size,
+                      validation_split=constants.FINETUNE_VALIDATION_SPLIT,
+                      callbacks=[EarlyStopping(monitor="val_loss", patience=constants.FINETUNE_PATIENCE, mode="min",
+                                               restore_best_weights=True)])
+    training_time = timeit.default_timer() - start
+
+    # the fine-tuned model scales the features as the deployed model
+    for scaler_file in ('scaler.json', 'scaler.pkl'):
+        scaler_path = os.path.join(os.path.dirname(scalerPath(model_path)), scaler_file)
+        if os.path.isfile(scaler_path):
+            shutil.copy(scaler_path, os.path.join(result_path, scaler_file))
+    saveResults(cnn, x_test, y_test, test_data, result_path)
+
+    with open(os.path.join(result_path, 'finetune_stats.json'), 'w') as f:
+        json.dump({'model': os.path.basename(model_path), 'new_samples': nb_new,
+                   'replayed_samples': len(train_data) - nb_new, 'epochs': len(history.history['loss']),
+                   'training_time': training_time}, f)
+    print(f"Fine-tuned in {training_time:.1f}s ({len(history.history['loss'])} epochs)")
+
+
 if __name__ == "__main__":
     import sys
-    if len(sys.argv) != 8:
+    if len(sys.argv) in (8, 9) and sys.argv[1] == '--finetune':
+        finetune_model(sys.argv[2], sys.argv[3], sys.argv[4], sys.argv[5], int(sys.argv[6]), int(sys.argv[7]),
+                       sys.argv[8] if len(sys.argv) == 9 else None)
+    elif len(sys.argv) not in (8, 9):
         print('Invalid inputs')
-        print('python retrain.py train_data_path test_data_path result_path nb_epoch_cnn nb_epoch_sae batch_size_cnn batch_size_sae')
+        print('python retrain.py train_data_path test_data_path result_path nb_epoch_cnn nb_epoch_sae batch_size_cnn batch_size_sae [training_parameters]')
+        print('  training_parameters: JSON object with the optional pretrain_sae, freeze_encoders and cpu_profile')
+        print('python retrain.py --finetune model_path train_data_path test_data_path result_path nb_epoch batch_size [replay_data_path]')
     else:
         train_data_path = sys.argv[1]
         test_data_path = sys.argv[2]
@@ -74,4 +223,8 @@ if __name__ == "__main__":
         nb_epoch_sae = int(sys.argv[5])
         batch_size_cnn = int(sys.argv[6])
         batch_size_sae = int(sys.argv[7])
-        retrain_model(train_data_path, test_data_path, result_path, nb_epoch_cnn, nb_epoch_sae, batch_size_cnn, batch_size_sae)
\ No newline at end of file
+        training_parameters = json.loads(sys.argv[8]) if len(sys.argv) == 9 else {}
+        retrain_model(train_data_path, test_data_path, result_path, nb_epoch_cnn, nb_epoch_sae, batch_size_cnn, batch_size_sae,
+                      pretrain_sae=training_parameters.get('pretrain_sae', constants.SAE_PRETRAINING),
+                      freeze_encoders=training_parameters.get('freeze_encoders', constants.SAE_FREEZE_ENCODERS),
+                      cpu_profile=training_parameters.get('cpu_profile', constants.CPU_PROFILE))
\ No newline at end of file
@@ -1,3 +1,4 @@
+import tensorflow as tf
 from tensorflow import reshape
 from tensorflow.python.keras import Input
 from tensorflow.python.keras.callbacks import EarlyStopping
@@ -9,18 +10,83 @@ from tensorflow.python.keras.regularizers import L1L2, L2
 from tensorflow.keras.layers import BatchNormalization
 from tensorflow.keras.utils import plot_model
 
+import constants
+from cpuProfile import epochTimer, epochStats, saveEpochTimes, selectBatchSize
+
 """
     Creates models consisting of two autoencoders and a CNN
 """
 
-def trainSAE_CNN(result_path, x_train_norm, x_train_mal, x_train, y_train, nb_epoch_cnn, nb_epoch_sae, batch_size_cnn, batch_size_sae, datenow):
-    print(x_train.shape[1])
-    input_dim = x_train.shape[1]
+def classSamples(x_train, y_train, label, batch_size):
+    """
+    :return: samples of a class as inputs and targets of an autoencoder: dataset of batches if x_train is a dataset
+    (filtered while streamed), array otherwise
+    """
+    if isinstance(x_train, tf.data.Dataset):
+        return (x_train.unbatch()
+                .filter(lambda x, y: tf.equal(y, label))
+                .map(lambda x, y: (x, x))
+                .batch(batch_size)
+                .prefetch(tf.data.AUTOTUNE))
+    return x_train[y_train == label, :]
+
+
+def pretrainAutoencoder(autoencoder, x_train, y_train, label, nb_epoch_sae, batch_size_sae):
+    """
+    Trains an autoencoder to reconstruct the training samples of its class (0: normal, 1: malicious)
+
+    :return: statistics of the epochs of the training (see cpuProfile.epochStats)
+    """
+    print(f"Pre-training of {autoencoder.name}")
+    samples = classSamples(x_train, y_train, label, batch_size_sae)
+    timer = epochTimer()
+    callbacks = [EarlyStopping(monitor="loss", patience=max(1, int(nb_epoch_sae / 2)), mode="min"), timer]
+    if isinstance(samples, tf.data.Dataset):
+        autoencoder.fit(samples, epochs=nb_epoch_sae, callbacks=callbacks)
+        return epochStats(timer.times, batch_size=batch_size_sae)
+    autoencoder.fit(samples, samples, epochs=nb_epoch_sae, batch_size=batch_size_sae, shuffle=True,
+                    callbacks=callbacks)
+    return epochStats(timer.times, len(samples), batch_size_sae)
+
+
+def profileBatchSize(cnn, compile_cnn, x_train, y_train, profile):
+    """
+    Selects the batch size of the CNN with the best training throughput (see cpuProfile.selectBatchSize), measured on
+    the first samples of the training set
+
+    :return: batch size (None if the training set is smaller than all the batch sizes), throughput of each batch size
+    """
+    nb_samples = max(profile['batch_sizes']) * profile['batch_steps']
+    if isinstance(x_train, tf.data.Dataset):
+        x_sample, y_sample = next(iter(x_train.unbatch().batch(nb_samples)))
+        x_sample, y_sample = x_sample.numpy(), y_sample.numpy()
+    else:
+        x_sample, y_sample = x_train[:nb_samples], y_train[:nb_samples]
+    batch_size, throughputs = selectBatchSize(cnn, x_sample, y_sample, profile['batch_sizes'], profile['batch_steps'])
+    # the optimizer of the CNN is reset after the measures
+    compile_cnn()
+    return batch_size, throughputs
+
+
+def trainSAE_CNN(result_path, x_train, y_train, nb_epoch_cnn, nb_epoch_sae, batch_size_cnn, batch_size_sae, datenow,
+                 pretrain_sae=constants.SAE_PRETRAINING, freeze_encoders=constants.SAE_FREEZE_ENCODERS, profile=None):
+    """
+    :param x_train: scaled training samples (with their labels y_train), or tf.data.Dataset of batches (samples,
+    labels), see featureDataset.streamDataset
+    :param pretrain_sae: pre-train the autoencoders on the samples of their class (nb_epoch_sae epochs) before the
+    CNN, otherwise they are trained with the CNN only
+    :param freeze_encoders: keep the pre-trained autoencoders as they are during the training of the CNN, otherwise
+    they are fine-tuned with it
+    :param profile: CPU profile applied to TensorFlow (see cpuProfile.applyProfile), None if there is none; with
+    auto_batch_size, batch_size_cnn is replaced by the batch size with the best throughput
+    """
+    streamed = isinstance(x_train, tf.data.Dataset)
+    input_dim = x_train.element_spec[0].shape[-1] if streamed else x_train.shape[1]
+    print(input_dim)
     act_reg = L1L2()
     act = LeakyReLU()
     hidden_dim_1 = input_dim
     hidden_dim_2 = input_dim
-    optimizer = Adam()  # learning_rate=0.001)
 
     filter1 = 32
     filter2 = 64
@@ -42,7 +108,8 @@ def trainSAE_CNN(result_path, x_train_norm, x_train_mal, x_train, y_train, nb_ep
     decoder_norm = BatchNormalization()(decoder_norm)
     decoder_norm = Dropout(0.5)(decoder_norm)
 
-    decoder_norm = Dense(input_dim, activation='sigmoid')(decoder_norm)  # or softmax
+    # outputs kept in float32 with bfloat16 mixed precision (see cpuProfile.py)
+    decoder_norm = Dense(input_dim, activation='sigmoid', dtype='float32')(decoder_norm)  # or softmax
 
     autoencoder_norm = Model(inputs=input_layer_aen, outputs=decoder_norm, name="ae_norm")
 
@@ -62,28 +129,22 @@ def trainSAE_CNN(result_path, x_train_norm, x_train_mal, x_train, y_train, nb_ep
     decoder_mal = BatchNormalization()(decoder_mal)
     decoder_mal = Dropout(0.5)(decoder_mal)
 
-    decoder_mal = Dense(input_dim, activation='sigmoid')(decoder_mal)  # or softmax
+    decoder_mal = Dense(input_dim, activation='sigmoid', dtype='float32')(decoder_mal)  # or softmax
 
     autoencoder_mal = Model(inputs=input_layer_aem, outputs=decoder_mal, name="ae_mal")
 
-    # compilation of AE_normal + AE_mal
-    autoencoder_norm.compile(metrics=['accuracy', Precision(), Recall()], loss='mse', optimizer=optimizer)
-    autoencoder_norm.summary()
-
-    autoencoder_mal.compile(metrics=['accuracy', Precision(), Recall()], loss='mse', optimizer=optimizer)
-    autoencoder_mal.summary()
-
-    # history_norm = autoencoder_norm.fit(x_train_norm, x_train_norm, epochs=nb_epoch_sae, batch_size=batch_size_sae,
-    #                                     # validation_data=(x_test_norm, x_test_norm),
-    #                                     # callbacks=[EarlyStopping(monitor="val_loss", patience=25, mode="min")]
-    #                                     callbacks=[EarlyStopping(monitor="accuracy", patience=25, mode="max")]
-    #                                     )
-
-    # history_mal = autoencoder_mal.fit(x_train_mal, x_train_mal, epochs=nb_epoch_sae, batch_size=batch_size_sae,
-    #                                   # validation_data=(x_test_mal, x_test_mal),
-    #                                   # callbacks=[EarlyStopping(monitor="val_loss", patience=25, mode="min")]
-    #                                   callbacks=[EarlyStopping(monitor="accuracy", patience=25, mode="max")]
-    #                                   )
+    epoch_times = {'profile': profile}
+    if pretrain_sae:
+        # AE_normal and AE_mal are pre-trained on the normal and malicious samples (each with its own optimizer)
+        autoencoder_norm.compile(loss='mse', optimizer=Adam())
+        epoch_times[autoencoder_norm.name] = pretrainAutoencoder(autoencoder_norm, x_train, y_train, 0, nb_epoch_sae,
+                                                                 batch_size_sae)
+        autoencoder_mal.compile(loss='mse', optimizer=Adam())
+        epoch_times[autoencoder_mal.name] = pretrainAutoencoder(autoencoder_mal, x_train, y_train, 1, nb_epoch_sae,
+                                                                batch_size_sae)
+        if freeze_encoders:
+            autoencoder_norm.trainable = False
+            autoencoder_mal.trainable = False
 
     inp = Input(shape=(input_dim,))
 
@@ -120,19 +181,41 @@ def trainSAE_CNN(result_path, x_train_norm, x_train_mal, x_train, y_train, nb_ep
 
     y = Flatten()(y)
     y = Dense(512)(y)
-    outputs = Dense(1, activation='sigmoid')(y)
+    outputs = Dense(1, activation='sigmoid', dtype='float32')(y)
 
     # cnn = Model(inputs=[input_layer_aen, input_layer_aem], outputs=outputs)
     cnn = Model(inputs=inp, outputs=outputs)
 
-    cnn.compile(metrics=['accuracy', Precision(), Recall()], optimizer=optimizer, loss='binary_crossentropy')
+    def compile_cnn():
+        cnn.compile(metrics=['accuracy', Precision(), Recall()], optimizer=Adam(), loss='binary_crossentropy')
+
+    compile_cnn()
     cnn.summary()
 
+    if profile is not None and profile['auto_batch_size']:
+        batch_size, epoch_times['batch_sizes'] = profileBatchSize(cnn, compile_cnn, x_train, y_train, profile)
+        if batch_size is not None and batch_size != batch_size_cnn:
+            print(f"Batch size of the CNN: {batch_size} instead of {batch_size_cnn}")
+            batch_size_cnn = batch_size
+            if streamed:
+                x_train = x_train.unbatch().batch(batch_size_cnn).prefetch(tf.data.AUTOTUNE)
+
     print("CNN training")
-    history_cnn = cnn.fit(x=x_train, y=y_train, epochs=nb_epoch_cnn, shuffle=True, batch_size=batch_size_cnn,
-                          # validation_data=(x_test, y_test),
-                          # callbacks=[EarlyStopping(monitor="val_loss", patience=25, mode="min")])
-                          callbacks=[EarlyStopping(monitor="accuracy", patience=int(nb_epoch_cnn / 2), mode="max")])
+    timer = epochTimer()
+    if streamed:
+        # the dataset is already batched and shuffled
+        history_cnn = cnn.fit(x_train, epochs=nb_epoch_cnn,
+                              callbacks=[EarlyStopping(monitor="accuracy", patience=int(nb_epoch_cnn / 2), mode="max"),
+                                         timer])
+        epoch_times['cnn'] = epochStats(timer.times, batch_size=batch_size_cnn)
+    else:
+        history_cnn = cnn.fit(x=x_train, y=y_train, epochs=nb_epoch_cnn, shuffle=True, batch_size=batch_size_cnn,
+                              # validation_data=(x_test, y_test),
+                              # callbacks=[EarlyStopping(monitor="val_loss", patience=25, mode="min")])
+                              callbacks=[EarlyStopping(monitor="accuracy", patience=int(nb_epoch_cnn / 2), mode="max"),
+                                         timer])
+        epoch_times['cnn'] = epochStats(timer.times, len(x_train), batch_size_cnn)
+    saveEpochTimes(result_path, epoch_times)
 
     print("Saving")
 
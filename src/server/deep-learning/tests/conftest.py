@@ -0,0 +1,8 @@
+import os
+import sys
+
+# the modules of the deep-learning server import each other by their name (they are run as scripts from this folder),
+# and python_logger from the server folder
+DEEP_LEARNING_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(DEEP_LEARNING_PATH))
+sys.path.insert(0, DEEP_LEARNING_PATH)
@@ -0,0 +1,18 @@
+import numpy as np
+import pandas as pd
+
+from featureCache import FeatureCache
+
+
+def testCacheKeepsFeatureTypes(tmp_path):
+    cache = FeatureCache(path=str(tmp_path))
+    features = pd.DataFrame({'ip.session_id': [1, 2], 'meta.direction': [0, 1],
+                             'duration': [0.1 + 1e-12, 1 / 3], 'ip.pkts_per_flow': [3, 5]})
+    ips = pd.DataFrame({'ip.session_id': [1, 2], 'meta.direction': [0, 1], 'ip': [['10.0.0.1'], ['10.0.0.2']]})
+    cache.put('report', ips, features)
+
+    cached_ips, cached_features = cache.get('report')
+    pd.testing.assert_frame_equal(cached_features, features)
+    assert cached_features['duration'].dtype == np.float64
+    assert list(cached_ips['ip']) == [['10.0.0.1'], ['10.0.0.2']]
+    assert cache.stats()['hits'] == 1
@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from featureScaler import FeatureScaler
+from prediction import predictFeatures
+
+FEATURES = ['duration', 'ip.pkts_per_flow', 'ip.header_len']
+
+
+def scaler():
+    return FeatureScaler(FEATURES, data_min=[0.0, 1.0, 20.0], data_max=[10.0, 101.0, 20.0])
+
+
+def testTransformByName():
+    features = pd.DataFrame({'duration': [5.0, 10.0], 'ip.pkts_per_flow': [1.0, 51.0], 'ip.header_len': [20.0, 20.0]})
+    expected = np.array([[0.5, 0.0, 0.0], [1.0, 0.5, 0.0]], dtype=np.float32)
+    np.testing.assert_array_equal(scaler().transform(features), expected)
+    # reordered columns (and extra ones) are scaled with the min/max of their feature
+    reordered = features[['ip.header_len', 'duration', 'ip.pkts_per_flow']].assign(malware=1)
+    np.testing.assert_array_equal(scaler().transform(reordered), expected)
+    # arrays are in the order of the features
+    np.testing.assert_array_equal(scaler().transform(features.to_numpy()), expected)
+
+
+def testTransformMissingFeature():
+    renamed = pd.DataFrame({'duration': [5.0], 'ip.pkts_per_flow': [1.0], 'ip.tot_len': [20.0]})
+    with pytest.raises(ValueError, match='ip.header_len'):
+        scaler().transform(renamed)
+
+
+class StubModel:
+    input_shape = (None, len(FEATURES))
+
+    def predict(self, x):
+        # attack if the scaled duration is above 0.5
+        return (np.asarray(x)[:, :1] > 0.5).astype(np.float32)
+
+
+def testPredictFeaturesReordered():
+    features = pd.DataFrame({'ip.header_len': [20.0, 20.0], 'ip.pkts_per_flow': [1.0, 1.0], 'duration': [2.0, 8.0]})
+    selected, y_pred = predictFeatures(features, StubModel(), scaler())
+    assert list(selected.columns) == FEATURES
+    assert list(y_pred) == [0, 1]
@@ -0,0 +1,30 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from featureStore import FEATURE_FILE_EXTENSION, columnarPath, featuresPath, readFeatures, writeFeatures
+
+
+def testCsvReadWithAndWithoutCopy(tmp_path):
+    pytest.importorskip('pyarrow')
+    features = pd.DataFrame({'ip.session_id': [1, 2, 3], 'duration': [0.5, 1 / 3, 2.25],
+                             'ip.pkts_per_flow': [3, 5, 8], 'malware': [0, 1, 0]})
+    csv_path = str(tmp_path / 'Train_samples.csv')
+    writeFeatures(features, csv_path)
+    assert os.path.isfile(columnarPath(csv_path))
+    from_copy = readFeatures(csv_path, exclude=['ip.session_id'])
+
+    os.remove(columnarPath(csv_path))
+    from_csv = readFeatures(csv_path, exclude=['ip.session_id'])
+
+    # the training does not depend on whether the copy exists
+    pd.testing.assert_frame_equal(from_copy, from_csv)
+    assert from_copy['duration'].dtype == np.float64
+
+
+def testFeaturesPath():
+    assert featuresPath('report.parquet') == f'report{FEATURE_FILE_EXTENSION}'
+    assert featuresPath('report.pkl') == f'report{FEATURE_FILE_EXTENSION}'
+    assert featuresPath('report.csv') == 'report.csv'
@@ -0,0 +1,144 @@
+"""
+Regression tests of the port features of FlowFeatureAccumulator (entropy_tcp_pkts, sport_g, sport_le, dport_g,
+dport_le) against the per-flow lambda aggregations they replaced.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from flowFeatures import FLAG_FEATURES, FLOW_KEYS, FlowFeatureAccumulator, OnlineFlowFeatures, packetDeltas
+
+entropy = pytest.importorskip('scipy.stats').entropy
+
+PORT_FEATURES = ['sport_g', 'sport_le', 'dport_g', 'dport_le']
+
+
+def scanTraffic(seed=0, nb_packets=20000, nb_sessions=60):
+    """
+    :return: ip, tcp and tls traffic of a scan: flows with many source/destination ports (around 1024 included),
+    flows with a single port, tcp-only flows and flows with TLS packets
+    """
+    rng = np.random.default_rng(seed)
+    sessions = rng.integers(0, nb_sessions, nb_packets)
+    directions = rng.integers(0, 2, nb_packets)
+    src_ports = rng.integers(1, 65536, nb_packets)
+    # a third of the sessions use one source port only, some ports are exactly on the 1024 boundary
+    single_port = sessions % 3 == 0
+    src_ports[single_port] = 1024 + sessions[single_port] % 2
+    dest_ports = rng.integers(1000, 1050, nb_packets)
+    times = np.sort(rng.uniform(0, 100, nb_packets))
+
+    tcp = pd.DataFrame({'ip.session_id': sessions, 'meta.direction': directions, 'time': times,
+                        'tcp.src_port': src_ports, 'tcp.dest_port': dest_ports,
+                        'tcp.payload_len': rng.integers(0, 1500, nb_packets),
+                        'tcp.tcp_session_payload_up_len': rng.integers(0, 1500, nb_packets),
+                        'tcp.tcp_session_payload_down_len': rng.integers(0, 1500, nb_packets),
+                        **{flag: rng.integers(0, 2, nb_packets) for flag in FLAG_FEATURES}})
+    ip = pd.DataFrame({'ip.session_id': sessions, 'meta.direction': directions, 'time': times,
+                       'ip.first_packet_time': times, 'ip.last_packet_time': times,
+                       'ip.header_len': 20, 'ip.tot_len': rng.integers(40, 1540, nb_packets),
+                       'ip.src': '10.0.0.' + pd.Series(sessions).astype(str), 'ip.dst': '10.0.1.1'})
+    ip['delta'] = packetDeltas(ip['time'])
+    # TLS packets only in the sessions with an even id
+    tls = tcp.loc[sessions % 2 == 0, FLOW_KEYS + ['time']].assign(**{'ssl.tls_version': 771})
+    return ip, tcp, tls
+
+
+def referencePortFeatures(tcp):
+    """
+    Port features as calculated before the vectorization (lambda aggregations and scipy entropy per flow)
+    """
+    grouped = tcp.groupby(FLOW_KEYS)
+    sports = grouped[['tcp.src_port']].apply(lambda x: (x > 1024).sum()).rename(
+        columns={'tcp.src_port': 'sport_g'}).join(
+        grouped[['tcp.src_port']].agg(lambda x: (x <= 1024).sum()).rename(columns={'tcp.src_port': 'sport_le'}))
+    dports = grouped[['tcp.dest_port']].apply(lambda x: (x > 1024).sum()).rename(
+        columns={'tcp.dest_port': 'dport_g'}).join(
+        grouped[['tcp.dest_port']].agg(lambda x: (x <= 1024).sum()).rename(columns={'tcp.dest_port': 'dport_le'}))
+    features = sports.join(dports)
+    features['entropy_tcp_pkts'] = grouped['tcp.src_port'].apply(lambda x: entropy(x.value_counts(), base=2))
+    return features
+
+
+def accumulatedFeatures(ip, tcp, tls, nb_chunks):
+    accumulator = FlowFeatureAccumulator()
+    # packets dealt to the chunks in turn: every flow spans all the chunks
+    for chunk in range(nb_chunks):
+        accumulator.update(ip.iloc[chunk::nb_chunks], tcp.iloc[chunk::nb_chunks], tls.iloc[chunk::nb_chunks])
+    _, features = accumulator.features()
+    return features.set_index(FLOW_KEYS)
+
+
+@pytest.mark.parametrize('nb_chunks', [1, 3])
+def testPortFeaturesMatchReference(nb_chunks):
+    ip, tcp, tls = scanTraffic()
+    reference = referencePortFeatures(tcp)
+    features = accumulatedFeatures(ip, tcp, tls, nb_chunks).loc[reference.index]
+
+    for column in PORT_FEATURES:
+        assert (features[column].to_numpy() == reference[column].to_numpy()).all(), column
+    # single port flows: both entropies are exactly 0
+    single_port = reference.index.get_level_values(0) % 3 == 0
+    assert (features['entropy_tcp_pkts'].to_numpy()[single_port] == 0).all()
+    assert (reference['entropy_tcp_pkts'].to_numpy()[single_port] == 0).all()
+    # the sums of p*log(p) are not made in the same order (scipy sums the ports sorted by count): the entropies can
+    # differ by the rounding of the last bits, not more
+    np.testing.assert_array_max_ulp(features['entropy_tcp_pkts'].to_numpy(),
+                                    reference['entropy_tcp_pkts'].to_numpy().astype(np.float64), maxulp=8)
+
+
+def testTlsAndTcpOnlyFlows():
+    ip, tcp, tls = scanTraffic(seed=1)
+    features = accumulatedFeatures(ip, tcp, tls, 1)
+    tls_counts = tls.groupby(FLOW_KEYS).size()
+    assert (features.loc[tls_counts.index, 'ssl.tls_version'].to_numpy() == tls_counts.to_numpy()).all()
+    tcp_only = features.index.get_level_values(0) % 2 == 1
+    assert (features.loc[tcp_only, 'ssl.tls_version'].fillna(0) == 0).all()
+    reference = referencePortFeatures(tcp)
+    for column in PORT_FEATURES:
+        assert (features.loc[reference.index, column].to_numpy() == reference[column].to_numpy()).all(), column
+
+
+def sessionTraffic(packets, session_id):
+    """
+    :param packets: (time, forward, direction) of the packets of a tcp session between 10.0.0.1:40000 (forward) and
+    10.0.1.1:443
+    :return: ip, tcp and tls traffic of the session, as reported by mmt-probe with the given directions
+    """
+    times = [time for time, _, _ in packets]
+    forward = np.array([is_forward for _, is_forward, _ in packets])
+    directions = [direction for _, _, direction in packets]
+    ip = pd.DataFrame({'ip.session_id': session_id, 'meta.direction': directions, 'time': times,
+                       'ip.first_packet_time': times, 'ip.last_packet_time': times, 'ip.header_len': 20,
+                       'ip.tot_len': np.where(forward, 100, 1400),
+                       'ip.src': np.where(forward, '10.0.0.1', '10.0.1.1'),
+                       'ip.dst': np.where(forward, '10.0.1.1', '10.0.0.1')})
+    tcp = pd.DataFrame({'ip.session_id': session_id, 'meta.direction': directions, 'time': times,
+                        'tcp.src_port': np.where(forward, 40000, 443), 'tcp.dest_port': np.where(forward, 443, 40000),
+                        'tcp.payload_len': np.where(forward, 60, 1360), 'tcp.tcp_session_payload_up_len': 0,
+                        'tcp.tcp_session_payload_down_len': 0, **{flag: 0 for flag in FLAG_FEATURES}})
+    tls = tcp.loc[:, FLOW_KEYS + ['time']].assign(**{'ssl.tls_version': 771}).iloc[:0]
+    return ip, tcp, tls
+
+
+def testOnlineFlowsReversedWindow():
+    # the session starts with a forward packet (direction 0), the second window starts with a backward packet: the
+    # separate mmt-probe run of the window gives the backward packets direction 0
+    window_1 = sessionTraffic([(0.0, True, 0), (0.1, False, 1), (0.3, True, 0)], session_id=5)
+    window_2 = sessionTraffic([(1.0, False, 0), (1.2, True, 1), (1.5, False, 0), (1.6, False, 0)], session_id=1)
+
+    flows = OnlineFlowFeatures(remap_sessions=True)
+    flows.update(*window_1)
+    (_, features), _ = flows.update(*window_2)
+
+    # same session analysed at once, with the directions of the first window
+    ip, tcp, tls = sessionTraffic([(0.0, True, 0), (0.1, False, 1), (0.3, True, 0), (1.0, False, 1), (1.2, True, 0),
+                                   (1.5, False, 1), (1.6, False, 1)], session_id=0)
+    accumulator = FlowFeatureAccumulator()
+    accumulator.update(ip.assign(delta=packetDeltas(ip['time'])), tcp, tls)
+    _, reference = accumulator.features()
+
+    features = features.set_index(FLOW_KEYS).sort_index()
+    reference = reference.set_index(FLOW_KEYS).sort_index()
+    assert list(features.index) == [(0, 0), (0, 1)]
+    pd.testing.assert_frame_equal(features, reference)
@@ -0,0 +1,125 @@
+import json
+
+import numpy as np
+import pytest
+
+import constants
+from liteModel import LiteModel, checkParity, fileDigest, liteModelName, liteModelPath
+
+WEIGHTS = np.array([0.5, -1.0, 2.0, 0.25], dtype=np.float32)
+
+
+def stubOutputs(x):
+    return (1 / (1 + np.exp(-(x.reshape(len(x), -1) @ WEIGHTS)))).reshape(-1, 1).astype(np.float32)
+
+
+class StubInterpreter:
+    """
+    Interpreter with the interface of tflite_runtime's, computing a logistic regression on its input
+    """
+
+    def __init__(self, model_path, num_threads=None):
+        self.model_path = model_path
+        self.input_shape = [1, len(WEIGHTS), 1]
+        self.allocations = 0
+        self.invocations = []
+        self.input = None
+        self.output = None
+
+    def get_input_details(self):
+        return [{'index': 0, 'shape': np.array(self.input_shape)}]
+
+    def get_output_details(self):
+        return [{'index': 1, 'shape': np.array([1, 1])}]
+
+    def resize_tensor_input(self, index, shape):
+        self.input_shape = list(shape)
+        self.input = None
+
+    def allocate_tensors(self):
+        self.allocations += 1
+
+    def set_tensor(self, index, value):
+        assert self.allocations > 0 and list(value.shape) == self.input_shape and value.dtype == np.float32
+        self.input = value
+
+    def invoke(self):
+        self.invocations.append(len(self.input))
+        self.output = stubOutputs(self.input)
+
+    def get_tensor(self, index):
+        return self.output
+
+
+class StubKerasModel:
+    def __init__(self, offset=0.0):
+        self.offset = offset
+
+    def predict(self, x, verbose=0):
+        return stubOutputs(np.asarray(x, dtype=np.float32)) + self.offset
+
+
+def samples(nb_samples):
+    return np.random.default_rng(0).normal(size=(nb_samples, len(WEIGHTS))).astype(np.float32)
+
+
+def testPredictBatches():
+    lite_model = LiteModel('model.tflite', StubInterpreter)
+    assert lite_model.input_shape == (None, len(WEIGHTS), 1)
+
+    x = samples(10)
+    y = lite_model.predict(x, batch_size=4)
+    np.testing.assert_allclose(y, stubOutputs(x), rtol=1e-6)
+    assert lite_model.interpreter.invocations == [4, 4, 2]
+    # the tensors are allocated again only when the size of the batch changes
+    assert lite_model.interpreter.allocations == 2
+
+    lite_model.predict(x[:2], batch_size=4)
+    assert lite_model.interpreter.allocations == 2
+
+
+def testPredictNoSample():
+    lite_model = LiteModel('model.tflite', StubInterpreter)
+    y = lite_model.predict(np.empty((0, len(WEIGHTS))))
+    assert y.shape == (0, 1)
+    assert lite_model.interpreter.invocations == []
+
+
+def testCheckParity():
+    x = samples(200)
+    parity = checkParity(StubKerasModel(), LiteModel('model.tflite', StubInterpreter), x)
+    assert parity['samples'] == 200
+    assert parity['max_abs_diff'] < 1e-6
+    assert parity['agreement'] == 1.0
+    assert parity['passed']
+
+
+def testCheckParityDifferentModel():
+    x = samples(200)
+    # the classes of the samples whose output is in [0.3, 0.5[ differ
+    parity = checkParity(StubKerasModel(offset=0.2), LiteModel('model.tflite', StubInterpreter), x)
+    assert parity['max_abs_diff'] == pytest.approx(0.2, abs=1e-6)
+    assert parity['agreement'] < constants.LITE_MODEL_MIN_AGREEMENT
+    assert not parity['passed']
+
+
+@pytest.mark.parametrize('variants, expected', [
+    ({'float32': True, 'float16': True}, 'float16'),
+    ({'float32': True, 'float16': False}, 'float32'),
+    ({'float32': True}, 'float32'),
+])
+def testLiteModelPathAuto(tmp_path, variants, expected):
+    model_path = tmp_path / 'model.h5'
+    model_path.write_bytes(b'keras model')
+    report = {'keras_model': fileDigest(model_path), 'variants': {}}
+    for variant, passed in variants.items():
+        report['variants'][variant] = {'passed': passed}
+        if passed:
+            (tmp_path / liteModelName(variant)).write_bytes(b'lite model')
+    (tmp_path / 'export.json').write_text(json.dumps(report))
+
+    assert liteModelPath(str(model_path), 'auto') == str(tmp_path / liteModelName(expected))
+    assert liteModelPath(str(model_path), 'float32') == str(tmp_path / 'model.tflite')
+
+    model_path.write_bytes(b'retrained keras model')
+    assert liteModelPath(str(model_path), 'auto') is None
@@ -0,0 +1,17 @@
+import os
+
+from prediction import reportResultFolders
+
+
+def testReportResultFoldersUniqueNames(tmp_path):
+    csv_paths = [str(tmp_path / 'a' / 'report-1.csv'), str(tmp_path / 'b' / 'report-2.csv')]
+    assert reportResultFolders(csv_paths) == {csv_paths[0]: 'report-1.csv', csv_paths[1]: 'report-2.csv'}
+
+
+def testReportResultFoldersRepeatedNames(tmp_path):
+    csv_paths = [str(tmp_path / 'probe' / 'a' / 'data.csv'), str(tmp_path / 'probe' / 'b' / 'data.csv'),
+                 str(tmp_path / 'probe' / 'b' / 'other.csv')]
+    folders = reportResultFolders(csv_paths)
+    assert folders == {csv_paths[0]: os.path.join('a', 'data.csv'), csv_paths[1]: os.path.join('b', 'data.csv'),
+                       csv_paths[2]: os.path.join('b', 'other.csv')}
+    assert len(set(folders.values())) == len(csv_paths)
@@ -6,7 +6,8 @@ from sklearn.preprocessing import MinMaxScaler
 import numpy as np
 import pandas as pd
 import seaborn as sn
-import os
+from featureScaler import loadScaler, saveScaler
+from liteModel import modelResultPaths
 
 """
 Help functions including functions for saving the confusion matrix/scores, data scaling etc.
@@ -83,10 +84,11 @@ def dataScale(train_data, validation_data, test_data, datetime):
     return x_train, y_train, x_test, y_test, x_val, y_val
 
 
-def dataScale_cnn(result_path, train_data, test_data, datetime, validation_data = None):
+def dataScale_cnn(result_path, train_data, test_data, datetime, validation_data = None, split_classes=True):
     """
     Scales the training and test data (validation is optional) and divides it into x (inputs) and y (labels)
     for SAE+CNN model - returns separate set of normal and malicious data for training SAE and joined one for CNN.
+    The normal/malicious sets are copies of the samples: with split_classes=False they are not created (None).
 
     :param train_data: dataframe with training set (inputs, labels)
     :param test_data: dataframe with test set (inputs, labels)
@@ -105,24 +107,19 @@ def dataScale_cnn(result_path, train_data, test_data, datetime, validation_data
     scaler.fit(x_train)
     x_train = scaler.transform(x_train)
 
-    # create the result path if it does not exists
-    if not os.path.exists(result_path):
-        os.makedirs(result_path)
-    scaler_file = os.path.join(result_path, "scaler_" + str(format(datetime.strftime("%Y-%m-%d_%H-%M-%S"))) + ".pkl")
-    if not os.path.isfile(scaler_file):
-        open(scaler_file, 'w').close()
-    pickle.dump(scaler, open(scaler_file, 'wb'))
+    # saved once with the model, the predictions and the explanations reuse it (see dataScale_model)
+    saveScaler(scaler, train_data.columns[:-1], result_path)
 
-    x_train_norm = x_train[y_train[:] == 0, :]
-    x_train_mal = x_train[y_train[:] == 1, :]
+    x_train_norm = x_train[y_train[:] == 0, :] if split_classes else None
+    x_train_mal = x_train[y_train[:] == 1, :] if split_classes else None
 
     x_test = test_data.iloc[:, :-1]
     y_test = test_data.iloc[:, -1]
     x_test = np.asarray(x_test, np.float32)
     y_test = np.asarray(y_test, np.float32)
     x_test = scaler.transform(x_test)
-    x_test_norm = x_test[y_test[:] == 0, :]
-    x_test_mal = x_test[y_test[:] == 1, :]
+    x_test_norm = x_test[y_test[:] == 0, :] if split_classes else None
+    x_test_mal = x_test[y_test[:] == 1, :] if split_classes else None
 
     if validation_data is not None:
         x_val = validation_data.iloc[:, :-1]
@@ -133,4 +130,32 @@ def dataScale_cnn(result_path, train_data, test_data, datetime, validation_data
 
         return x_train_norm, x_train_mal, x_test_norm, x_test_mal, x_train, y_train, x_test, y_test, x_val, y_val, scaler
 
-    return x_train_norm, x_train_mal, x_test_norm, x_test_mal, x_train, y_train, x_test, y_test, scaler
\ No newline at end of file
+    return x_train_norm, x_train_mal, x_test_norm, x_test_mal, x_train, y_train, x_test, y_test, scaler
+
+
+def dataScale_model(model_path, train_data, test_data, fit_missing=True):
+    """
+    Same as dataScale_cnn for a trained model: the data is scaled with the scaler saved with the model, which is not
+    fitted again (the models trained before the scalers were saved get theirs fitted and saved once).
+
+    :param model_path: path of the model
+    :param train_data: dataframe with training set (inputs, labels)
+    :param test_data: dataframe with test set (inputs, labels)
+    :param fit_missing: fit (on train_data) and save the scaler of a model without one, only if train_data is the
+    training set of the model
+    :return: same as dataScale_cnn without the divided sets (None), scaler - FeatureScaler saved with the model
+    """
+    scaler = loadScaler(model_path)
+    if scaler is None and not fit_missing:
+        raise ValueError(f"The model {model_path} has no saved scaler")
+    if scaler is None:
+        scaler = MinMaxScaler()
+        scaler.fit(np.asarray(train_data.iloc[:, :-1], np.float32))
+        saveScaler(scaler, train_data.columns[:-1], modelResultPaths(model_path)[-1])
+        scaler = loadScaler(model_path)
+
+    x_train = scaler.transform(train_data.iloc[:, :-1])
+    y_train = np.asarray(train_data.iloc[:, -1], np.float32)
+    x_test = scaler.transform(test_data.iloc[:, :-1])
+    y_test = np.asarray(test_data.iloc[:, -1], np.float32)
+    return None, None, None, None, x_train, y_train, x_test, y_test, scaler
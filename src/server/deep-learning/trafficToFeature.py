@@ -12,43 +12,43 @@ except ImportError:
     def print_error(msg):
         print(f"ERROR: {msg}")
 
-from eventToFeature import eventsToFeatures
+from featureCache import cachedEventsToFeatures
+from featureStore import featuresPath, writeFeatures
 
 def trafficToFeatures(in_csv, out_pkl, is_malware=False):
     """
     Reads .csv, extracts set of mmt-probe attributes for each of the event and based on them calculates ML feaures
-    (to one dataframe), adds additional column with label at the end of feature dataframe, and returns it in pkl form
+    (to one dataframe), adds additional column with label at the end of feature dataframe, and saves it (in Parquet
+    format for .parquet path, see featureStore.writeFeatures)
 
     :param in_csv: mmt-probe report path
-    :param out_pkl: path of pickle with dataframe consisting of calculated ML features
+    :param out_pkl: path of file (.parquet, .pkl or .csv) with dataframe consisting of calculated ML features
     :param is_malware: label to be added as last column to final dataframe determining if the traffic was normal (value 0)
     or malicious (value 1)
-    :return: pickle with dataframe consisting of calculated ML features
     """
-    if not os.path.isfile(out_pkl):
-        # Extract features directly without debug prints
-        _, p1_features = eventsToFeatures(in_csv)
-        if is_malware:
-            p1_features['malware'] = 1
-        else:
-            p1_features['malware'] = 0
+    # Features of a report already processed (by any build, extraction or prediction) are read from the cache
+    _, p1_features = cachedEventsToFeatures(in_csv)
+    if is_malware:
+        p1_features['malware'] = 1
+    else:
+        p1_features['malware'] = 0
 
-        # Save to pickle file (removed debug prints)
-        p1_features.to_pickle(out_pkl)
-        if logger:
-            logger.info(f"Extracted {p1_features.shape[0]} features from {in_csv}")
-        else:
-            print(f"Extracted {p1_features.shape[0]} features from {in_csv}")
-    # Removed unnecessary print statement for existing file
+    # Save to features file (removed debug prints)
+    writeFeatures(p1_features, out_pkl)
+    if logger:
+        logger.info(f"Extracted {p1_features.shape[0]} features from {in_csv}")
+    else:
+        print(f"Extracted {p1_features.shape[0]} features from {in_csv}")
 
 if __name__ == "__main__":
     if len(sys.argv) != 4:
         print_error('Invalid inputs')
-        print_error('python trafficToFeature.py <in_csv> <out_pkl> <is_malware>')
+        print_error('python trafficToFeature.py <in_csv> <out_features> <is_malware>')
+        print_error('  a .parquet or .pkl <out_features> is written as .pkl if pyarrow is not installed')
         sys.exit(1)
     else:
         input_csv_file = sys.argv[1]
-        pickle_file = sys.argv[2]
+        pickle_file = featuresPath(sys.argv[2])
         is_malware = False
         if sys.argv[3] == 'true' or sys.argv[3] == 'True':
             is_malware = True
@@ -5,30 +5,43 @@ import numpy as np
 import pandas as pd
 import sys
 from tools import saveConfMatrix, saveScores, dataScale_cnn
-from sae_cnn import trainSAE_CNN
+import constants
+from featureStore import readFeatures
+from featureDataset import isStreamed, streamTrainingData
+from liteModel import exportModel
+from cpuProfile import profileSettings, applyProfile
 import timeit
 import os
 from sklearn.inspection import permutation_importance
 
-def train_model(train_data_path, test_data_path, result_path, nb_epoch_cnn, nb_epoch_sae,batch_size_cnn, batch_size_sae):
-    train_data = pd.read_csv(train_data_path, delimiter=",")
-
-    train_data.drop(columns=['ip.session_id', 'meta.direction'], inplace=True)
-
-    test_data = pd.read_csv(test_data_path, delimiter=",")
-    test_data.drop(columns=['ip.session_id', 'meta.direction'], inplace=True)
+def train_model(train_data_path, test_data_path, result_path, nb_epoch_cnn, nb_epoch_sae,batch_size_cnn, batch_size_sae,
+                pretrain_sae=constants.SAE_PRETRAINING, freeze_encoders=constants.SAE_FREEZE_ENCODERS,
+                cpu_profile=constants.CPU_PROFILE):
+    # applied before any operation of TensorFlow (the streaming of the training set creates some)
+    profile = applyProfile(profileSettings(cpu_profile))
+    # imports TensorFlow: only once the profile is applied (TF_ENABLE_ONEDNN_OPTS is read by the import)
+    from sae_cnn import trainSAE_CNN
+    test_data = readFeatures(test_data_path, exclude=['ip.session_id', 'meta.direction'])
 
     d = datetime.now()
-    x_train_norm, x_train_mal, x_test_norm, x_test_mal, x_train, y_train, x_test, y_test, scaler = dataScale_cnn(result_path,
-        train_data,
-        test_data, datetime=d)
+    if isStreamed(train_data_path):
+        # the training set is read from the disk, scaled and shuffled batch by batch at each epoch
+        print(f"Stream the training set {train_data_path}")
+        x_train, x_test, y_test, scaler = streamTrainingData(train_data_path, test_data, result_path, batch_size_cnn)
+        y_train = None
+    else:
+        train_data = readFeatures(train_data_path, exclude=['ip.session_id', 'meta.direction'])
+        # the samples of each class are selected by trainSAE_CNN, only if the autoencoders are pre-trained
+        _, _, _, _, x_train, y_train, x_test, y_test, scaler = dataScale_cnn(result_path,
+            train_data,
+            test_data, datetime=d, split_classes=False)
 
     # input_dim = x_train.shape[1]
 
-    cnn = trainSAE_CNN(result_path=result_path, x_train_norm=x_train_norm, x_train_mal=x_train_mal,
-                       x_train=x_train, y_train=y_train,
+    cnn = trainSAE_CNN(result_path=result_path, x_train=x_train, y_train=y_train,
                        nb_epoch_cnn=nb_epoch_cnn, nb_epoch_sae=nb_epoch_sae,
-                       batch_size_cnn=batch_size_cnn, batch_size_sae=batch_size_sae, datenow=d)
+                       batch_size_cnn=batch_size_cnn, batch_size_sae=batch_size_sae, datenow=d,
+                       pretrain_sae=pretrain_sae, freeze_encoders=freeze_encoders, profile=profile)
     # cnn.save(f'{result_path}/model.h5')
     print("Prediction - test")
     y_pred = cnn.predict(x_test)
@@ -70,6 +83,14 @@ def train_model(train_data_path, test_data_path, result_path, nb_epoch_cnn, nb_e
     """
     print('Going to save model')
     cnn.save(f'{result_path}/model.h5')
+    if profile is not None and profile['mixed_precision']:
+        # the bfloat16 operations are not always supported by the TFLite converter, model.h5 is saved anyway
+        try:
+            exportModel(cnn, x_test, result_path)
+        except Exception as e:
+            print(f"The mixed precision model could not be exported to TFLite: {e}")
+    else:
+        exportModel(cnn, x_test, result_path)
 
     # Compute time for predictions and save it to file
     generation_iters = 1
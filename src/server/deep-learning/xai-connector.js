@@ -3,16 +3,16 @@ const {
   LOG_PATH, MODEL_PATH, TRAINING_PATH,
   DEEP_LEARNING_PATH, AC_PATH,
   PREDICTION_PATH,
-  PYTHON_CMD,
 } = require('../constants');
 const {
   readTextFile,
 } = require('../utils/file-utils');
 const {
-  spawnCommand,
   spawnCommandAsync,
 } = require('../utils/utils');
 
+const { readPredictionFlow } = require('./prediction-results');
+const { explainWithServer } = require('./xai-server');
 const fs = require('fs');
 const fsPromises = require('fs').promises;
 const path = require('path');
@@ -28,45 +28,10 @@ const path = require('path');
 
 /**
  * Extract a single instance feature vector for LIME from prediction outputs
- * The CSVs (attacks.csv or predictions.csv) use the header order of AD_FEATURES_OUTPUT,
- * where the first 3 columns are ['ip.session_id', 'meta.direction', 'ip'] and the last is 'malware'.
- * We therefore slice columns [3, len-1) to construct the feature vector.
+ * The features of the flow are read from the prediction results (see prediction-results.js),
+ * the flow is taken from the attacks first, then from all the flows.
  */
-const buildInstanceVectorFromPrediction = async (predictionId, sessionId) => {
-  const attackFile = path.join(PREDICTION_PATH, predictionId, 'attacks.csv');
-  const allFile = path.join(PREDICTION_PATH, predictionId, 'predictions.csv');
-  let csvPath = null;
-  if (fs.existsSync(attackFile)) {
-    csvPath = attackFile;
-  } else if (fs.existsSync(allFile)) {
-    csvPath = allFile;
-  } else {
-    throw new Error(`No prediction CSV found for ${predictionId}`);
-  }
-
-  const content = await fsPromises.readFile(csvPath, 'utf-8');
-  const lines = content.split('\n').filter(l => l.trim().length > 0);
-  if (lines.length < 2) throw new Error('Empty prediction CSV');
-  const header = lines[0].split(',');
-  const featureHeaders = header.slice(3, header.length - 1); // between ip and malware
-  // iterate rows
-  for (let i = 1; i < lines.length; i++) {
-    const cols = lines[i].split(',');
-    if (cols.length < 5) continue; // too short
-    if (String(cols[0]).trim() === String(sessionId).trim()) {
-      // build name->value map for features, based on header
-      const featureVals = cols.slice(3, cols.length - 1);
-      const featureMap = {};
-      for (let j = 0; j < featureHeaders.length; j++) {
-        const key = featureHeaders[j];
-        const num = Number(featureVals[j]);
-        featureMap[key] = Number.isNaN(num) ? 0 : num;
-      }
-      return { featureMap, featureHeaders };
-    }
-  }
-  throw new Error(`Session ${sessionId} not found in prediction ${predictionId}`);
-}
+const buildInstanceVectorFromPrediction = (predictionId, sessionId) => readPredictionFlow(predictionId, sessionId);
 
 /**
  * Run LIME for a specific flow instance based on prediction outputs
@@ -93,7 +58,8 @@ const runLIMEForFlow = async (limeFlowConfig, callback) => {
 
     const logFile = `${LOG_PATH}xai_${modelId}.log`;
     const scriptPath = `${DEEP_LEARNING_PATH}/xai-lime-instance.py`;
-    spawnCommand(PYTHON_CMD, [scriptPath, modelId, instanceJsonPath, numberFeature], logFile, () => {
+    const params = { instance: instanceJsonPath, numberFeatures: numberFeature };
+    explainWithServer('lime-flow', modelId, params, [scriptPath, modelId, instanceJsonPath, numberFeature], logFile, () => {
       xaiStatus.isRunning = false;
       console.log('Finish producing LIME explanations for a specific flow instance');
     });
@@ -128,7 +94,8 @@ const runSHAPForFlow = async (shapFlowConfig, callback) => {
 
     const logFile = `${LOG_PATH}xai_${modelId}.log`;
     const scriptPath = `${DEEP_LEARNING_PATH}/xai-shap-instance.py`;
-    spawnCommand(PYTHON_CMD, [scriptPath, modelId, instanceJsonPath, numberFeature], logFile, () => {
+    const params = { instance: instanceJsonPath, numberFeatures: numberFeature };
+    explainWithServer('shap-flow', modelId, params, [scriptPath, modelId, instanceJsonPath, numberFeature], logFile, () => {
       xaiStatus.isRunning = false;
       console.log('Finish producing SHAP explanations for a specific flow instance');
     });
@@ -295,12 +262,14 @@ const runSHAP = async (shapConfig, callback) => {
   const modelType = await getModelType(modelId);
   if (modelId.startsWith("ac-")) {
     scriptPath = `${AC_PATH}/ac_xai_shap.py`;
-    spawnCommand(PYTHON_CMD, [scriptPath, modelId, numberBackgroundSamples, numberExplainedSamples, maxDisplay, modelType], logFile, () => {
+    const params = { numberBackgroundSamples, numberExplainedSamples, maxDisplay, modelType };
+    explainWithServer('shap', modelId, params, [scriptPath, modelId, numberBackgroundSamples, numberExplainedSamples, maxDisplay, modelType], logFile, () => {
       xaiStatus.isRunning = false;
       console.log('Finish producing SHAP feature importance explanations');
     });
   } else {
-    spawnCommand(PYTHON_CMD, [scriptPath, modelId, numberBackgroundSamples, numberExplainedSamples, maxDisplay], logFile, () => {
+    const params = { numberBackgroundSamples, numberExplainedSamples, maxDisplay };
+    explainWithServer('shap', modelId, params, [scriptPath, modelId, numberBackgroundSamples, numberExplainedSamples, maxDisplay], logFile, () => {
       xaiStatus.isRunning = false;
       console.log('Finish producing SHAP feature importance explanations');
     });
@@ -333,12 +302,14 @@ const runLIME = async (limeConfig, callback) => {
 
   if (modelId.startsWith("ac-")) {
     scriptPath = `${AC_PATH}/ac_xai_lime.py`;
-    spawnCommand(PYTHON_CMD, [scriptPath, modelId, sampleId, numberFeature, modelType], logFile, () => {
+    const params = { sampleId, numberFeatures: numberFeature, modelType };
+    explainWithServer('lime', modelId, params, [scriptPath, modelId, sampleId, numberFeature, modelType], logFile, () => {
       xaiStatus.isRunning = false;
       console.log('Finish producing LIME explanations for a particular instance');
     });
   } else {
-    spawnCommand(PYTHON_CMD, [scriptPath, modelId, sampleId, numberFeature], logFile, () => {
+    const params = { sampleId, numberFeatures: numberFeature };
+    explainWithServer('lime', modelId, params, [scriptPath, modelId, sampleId, numberFeature], logFile, () => {
       xaiStatus.isRunning = false;
       console.log('Finish producing LIME explanations for a particular instance');
     });
@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+# Fix sys.path BEFORE any imports to prevent TensorFlow errors
+import sys
+sys.path = [str(p) if not isinstance(p, str) else p for p in sys.path]
+
+import constants
+from xaiExplanations import ModelArtifacts, explainLimeBatch, readBatchSamples
+
+if __name__ == "__main__":
+  if len(sys.argv) not in (4, 5):
+    print('Invalid inputs')
+    print('python xai-lime-batch.py modelId samples_json_path numberFeatures [workers]')
+    sys.exit(1)
+
+  try:
+    modelId = sys.argv[1]
+    samples = readBatchSamples(sys.argv[2])
+    numberFeatures = sys.argv[3]
+    workers = int(sys.argv[4]) if len(sys.argv) == 5 else constants.XAI_LIME_BATCH_WORKERS
+
+    # Produce explanations of all the samples (see xaiExplanations.explainLimeBatch), saved in lime_batch.json
+    explainLimeBatch(ModelArtifacts(modelId), samples, numberFeatures, workers)
+    print("LIME explanations generated successfully")
+    sys.exit(0)
+
+  except Exception as e:
+    print(f"Error generating LIME explanations: {str(e)}")
+    import traceback
+    traceback.print_exc()
+    sys.exit(1)
@@ -0,0 +1,175 @@
+/**
+ * Client of the pool of long-lived XAI servers (xai_server.py, and ac_xai_server.py for the activity classification
+ * models whose ids start with "ac-")
+ * The servers are started on the first request and keep the artifacts of the models (model, scaled data, explainers)
+ * between the explanations. The explanations of a model always go to the same server, so that its artifacts are
+ * built once; requests and responses are JSON lines exchanged on the stdin/stdout of the servers.
+ * An explanation not done in time (XAI_SERVER_TIMEOUT ms) means that the server hangs or is busy for too long: it is
+ * killed, all its pending requests are rejected (their callers fall back to the scripts) and the next request of the
+ * slot starts a new server. The servers are killed when the Node process exits.
+ */
+const { spawn } = require('child_process');
+const fs = require('fs');
+const readline = require('readline');
+const {
+  LOG_PATH,
+  DEEP_LEARNING_PATH,
+  AC_PATH,
+  PYTHON_CMD,
+} = require('../constants');
+const { spawnCommand } = require('../utils/utils');
+
+const POOL_SIZE = parseInt(process.env.XAI_WORKERS, 10) || 1;
+const REQUEST_TIMEOUT = parseInt(process.env.XAI_SERVER_TIMEOUT, 10) || 30 * 60 * 1000;
+
+const servers = new Map(); // slot -> ChildProcess
+let nextRequestId = 1;
+const pendingRequests = new Map(); // request id -> { resolve, reject, proc, timer }
+
+/**
+ * Slot of the server explaining a model
+ * @param {String} modelId id of the model
+ * @returns {String} slot of the server in the pool: 'ac-<index>' for the activity classification models,
+ * '<index>' otherwise
+ */
+const serverSlot = (modelId) => {
+  let hash = 0;
+  for (let i = 0; i < modelId.length; i += 1) {
+    hash = (hash * 31 + modelId.charCodeAt(i)) % 1000003;
+  }
+  return `${modelId.startsWith('ac-') ? 'ac-' : ''}${hash % POOL_SIZE}`;
+};
+
+/**
+ * Start the XAI server of a slot if it is not running
+ * @param {String} slot slot of the server in the pool (see serverSlot)
+ * @returns {ChildProcess} the process of the server
+ */
+const startXAIServer = (slot) => {
+  if (servers.has(slot)) {
+    return servers.get(slot);
+  }
+  const script = slot.startsWith('ac-') ? `${AC_PATH}/ac_xai_server.py` : `${DEEP_LEARNING_PATH}/xai_server.py`;
+  const proc = spawn(PYTHON_CMD, [script], {
+    stdio: ['pipe', 'pipe', 'pipe'],
+  });
+  const logFile = fs.createWriteStream(`${LOG_PATH}xai_server_${slot}.log`, { flags: 'a' });
+  proc.stderr.pipe(logFile);
+  // writing to a killed server fails, its pending requests are rejected when it stops
+  proc.stdin.on('error', (err) => console.error('[xai-server] Cannot write to the server:', err.message));
+
+  readline.createInterface({ input: proc.stdout }).on('line', (line) => {
+    let response;
+    try {
+      response = JSON.parse(line);
+    } catch (e) {
+      console.error('[xai-server] Invalid response:', line);
+      return;
+    }
+    const pending = pendingRequests.get(response.id);
+    if (!pending) {
+      return;
+    }
+    clearTimeout(pending.timer);
+    pendingRequests.delete(response.id);
+    if (response.ok) {
+      pending.resolve(response);
+    } else {
+      pending.reject(new Error(response.error));
+    }
+  });
+
+  const onExit = (err) => {
+    if (servers.get(slot) === proc) {
+      servers.delete(slot);
+    }
+    pendingRequests.forEach((pending, id) => {
+      if (pending.proc === proc) {
+        clearTimeout(pending.timer);
+        pending.reject(err || new Error('XAI server has stopped'));
+        pendingRequests.delete(id);
+      }
+    });
+  };
+  proc.on('error', onExit);
+  proc.on('close', () => onExit(null));
+
+  servers.set(slot, proc);
+  return proc;
+};
+
+/**
+ * Kill an XAI server which does not answer, its pending requests are rejected once it has stopped
+ * @param {String} slot slot of the server in the pool
+ * @param {ChildProcess} proc the process of the server
+ */
+const killXAIServer = (slot, proc) => {
+  if (servers.get(slot) === proc) {
+    // the next requests of the slot go to a new server
+    servers.delete(slot);
+  }
+  proc.kill('SIGKILL');
+};
+
+/**
+ * Explain a model with the XAI server of the model, the explanations are saved in xai/<model name>/
+ * (as by the xai-*.py scripts)
+ * @param {String} xaiType 'shap', 'lime', 'shap-flow', 'lime-flow' or 'lime-batch' ('shap' or 'lime' for the
+ * activity classification models)
+ * @param {String} modelId id of the model
+ * @param {Object} params parameters of the explanation (see xai_server.py and ac_xai_server.py)
+ * @returns {Promise<Object>} { explanation_time, time_ms }
+ */
+const explain = (xaiType, modelId, params) => new Promise((resolve, reject) => {
+  const slot = serverSlot(modelId);
+  const proc = startXAIServer(slot);
+  const id = nextRequestId++;
+  const timer = setTimeout(() => {
+    const pending = pendingRequests.get(id);
+    if (!pending) {
+      return;
+    }
+    pendingRequests.delete(id);
+    console.error(`[xai-server] No response to the request ${id} after ${REQUEST_TIMEOUT} ms, kill the server ${slot}`);
+    pending.reject(new Error(`The XAI server did not answer in ${REQUEST_TIMEOUT} ms`));
+    killXAIServer(slot, proc);
+  }, REQUEST_TIMEOUT);
+  pendingRequests.set(id, {
+    resolve, reject, proc, timer,
+  });
+  proc.stdin.write(`${JSON.stringify({ ...params, type: xaiType, model: modelId, id })}\n`);
+});
+
+/**
+ * Explain a model with its XAI server, fall back to a process of the xai-*.py script if the server fails
+ * @param {String} xaiType 'shap', 'lime', 'shap-flow' or 'lime-flow'
+ * @param {String} modelId id of the model
+ * @param {Object} params parameters of the explanation (see xai_server.py)
+ * @param {Array} args arguments of the script (path of the script first)
+ * @param {String} logFile path of the log of the explanation
+ * @param {Function} callback called once the explanation is done, with the error if it failed
+ */
+const explainWithServer = (xaiType, modelId, params, args, logFile, callback) => {
+  explain(xaiType, modelId, params)
+    .then((result) => {
+      fs.appendFile(logFile, `${xaiType} explanation of ${modelId} in ${result.time_ms} ms\n`, () => callback(null));
+    })
+    .catch((err) => {
+      console.error('[xai-server] Explanation failed, run the script instead:', err.message || err);
+      spawnCommand(PYTHON_CMD, args, logFile, callback);
+    });
+};
+
+/**
+ * Stop the XAI servers when the Node process exits (the servers would otherwise outlive it while busy)
+ */
+const stopXAIServers = () => {
+  servers.forEach((proc) => proc.kill());
+  servers.clear();
+};
+process.on('exit', stopXAIServers);
+
+module.exports = {
+  explain,
+  explainWithServer,
+};
@@ -15,6 +15,7 @@ from tensorflow.keras.models import load_model
 from pydoc import classname
 from datetime import datetime
 from tools import dataScale_cnn
+from featureStore import readFeatures
 
 from sklearn.inspection import permutation_importance
 import constants
@@ -119,10 +120,8 @@ if __name__ == "__main__":
     train_data_path = os.path.join(output_datasets_path,'Train_samples.csv')
     test_data_path = os.path.join(output_datasets_path,'Test_samples.csv')
     
-    train_data = pd.read_csv(train_data_path, delimiter=",")
-    train_data.drop(columns=['ip.session_id', 'meta.direction'], inplace=True)
-    test_data = pd.read_csv(test_data_path, delimiter=",")
-    test_data.drop(columns=['ip.session_id', 'meta.direction'], inplace=True)
+    train_data = readFeatures(train_data_path, exclude=['ip.session_id', 'meta.direction'])
+    test_data = readFeatures(test_data_path, exclude=['ip.session_id', 'meta.direction'])
 
     d = datetime.now()
     x_train_norm, x_train_mal, x_test_norm, x_test_mal, x_train, y_train, x_test, y_test, scaler = dataScale_cnn(output_path,
@@ -0,0 +1,415 @@
+"""
+SHAP and LIME explanations of the anomaly detection models, shared by the xai-*.py scripts (one explanation per
+process) and by the XAI server (xai_server.py, which keeps the artifacts of the models between explanations).
+
+The artifacts of a model (loaded model, scaled training/test data, explainers) are built once per ModelArtifacts,
+the explanations are saved in xai/<model name>/ as the scripts always did.
+"""
+import json
+import multiprocessing
+import os
+import timeit
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import constants
+from backgroundSummary import loadBackground, loadLimeStats
+from featureStore import FEATURE_FILE_EXTENSION, readFeatures, writeFeatures
+from kernelShap import BatchKernelExplainer
+from liteModel import LiteModel, loadModel
+from predictionResults import readPredictions
+from tools import dataScale_model
+
+DEEP_LEARNING_PATH = os.path.dirname(os.path.abspath(__file__))
+CLASSES = ['Normal', 'Malware']
+# the current model only returns the probability for the positive class (Malware)
+# thus, we only obtain explanations for this class
+LABEL = CLASSES[1]
+
+
+def explanationsPath(model_name):
+    path = os.path.join(DEEP_LEARNING_PATH, 'xai', model_name)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def saveTime(model_name, method, time_taken, explainer=None, **stats):
+    """
+    Saves the time taken by an explanation in xai/<model name>/time_stats_<method>.txt, and the explainer which took
+    this time (with the other stats of the explanation) in time_stats_<method>.json
+    """
+    statsfile = os.path.join(explanationsPath(model_name), f'time_stats_{method}.txt')
+    print(statsfile)
+    with open(statsfile, "w") as f:
+        f.write(str(time_taken))
+    if explainer is not None:
+        with open(os.path.join(explanationsPath(model_name), f'time_stats_{method}.json'), "w") as f:
+            json.dump({'explainer': explainer, 'time': time_taken, **stats}, f)
+
+
+def shapValues(explainer, x):
+    """
+    :param explainer: SHAP explainer of the model
+    :param x: samples to explain
+    :return: SHAP values of the Malware output, (samples, features) array whatever the explainer and the version of
+    shap (list of arrays per output, or array with the outputs as last dimension)
+    """
+    x = np.asarray(x, dtype=np.float32)
+    with warnings.catch_warnings():
+        warnings.filterwarnings("ignore")
+        values = explainer.shap_values(x)
+    if isinstance(values, list):
+        values = values[-1]
+    values = np.asarray(values)
+    if values.ndim == 3:
+        values = values[..., -1]
+    return values.reshape(len(x), -1)
+
+
+class ModelArtifacts:
+    """
+    Model, scaled training/test data and explainers of a model, the explainers are built on their first use
+    """
+
+    def __init__(self, model_id):
+        self.model_id = model_id
+        self.model_name = os.path.splitext(model_id)[0]
+        self.model_path = os.path.join(DEEP_LEARNING_PATH, 'models', model_id)
+        self.model = loadModel(self.model_path)
+        print("Model has been loaded ...")
+
+        datasets_path = os.path.join(DEEP_LEARNING_PATH, 'trainings', self.model_name, 'datasets')
+        train_data = readFeatures(os.path.join(datasets_path, 'Train_samples.csv'),
+                                  exclude=['ip.session_id', 'meta.direction'])
+        test_data = readFeatures(os.path.join(datasets_path, 'Test_samples.csv'),
+                                 exclude=['ip.session_id', 'meta.direction'])
+
+        # Get actual feature names from the training data (excluding the label column)
+        self.features = [col for col in train_data.columns if col != 'malware']
+        print(f"Number of features: {len(self.features)}")
+        _, _, _, _, self.x_train, self.y_train, self.x_test, self.y_test, self.scaler = dataScale_model(
+            self.model_path, train_data, test_data)
+
+        # Verify feature count matches data shape
+        if self.x_train.shape[1] != len(self.features):
+            print(f"Warning: Data has {self.x_train.shape[1]} features but feature list has {len(self.features)} names")
+            print(f"Using only the first {self.x_train.shape[1]} feature names")
+            self.features = self.features[:self.x_train.shape[1]]
+        self.shap_explainers = {}  # number of background samples -> SHAP explainer
+        self.lime_explainers = {}  # feature names -> LimeTabularExplainer
+
+    def shapExplainer(self, nb_background):
+        """
+        :param nb_background: number of samples of the summary of the training set in the background of the explainer
+        (see backgroundSummary.loadBackground)
+        :return: explainer of the model, using the gradients of the Keras models (see
+        constants.XAI_SHAP_KERAS_EXPLAINER), batched KernelSHAP for the TFLite models
+        """
+        import shap
+
+        nb_background = min(int(nb_background), self.x_train.shape[0])
+        if nb_background not in self.shap_explainers:
+            background, weights = loadBackground(self.model_path, self.x_train, nb_background)
+            explainer = None
+            if not isinstance(self.model, LiteModel) and constants.XAI_SHAP_KERAS_EXPLAINER != 'kernel':
+                explainer_class = (shap.DeepExplainer if constants.XAI_SHAP_KERAS_EXPLAINER == 'deep'
+                                   else shap.GradientExplainer)
+                try:
+                    explainer = explainer_class(self.model, background)
+                except Exception as e:
+                    print(f"{explainer_class.__name__} cannot explain the model ({e}), use KernelSHAP")
+            if explainer is None:
+                explainer = BatchKernelExplainer(self.model.predict, background, background_weights=weights)
+            self.shap_explainers[nb_background] = explainer
+        return self.shap_explainers[nb_background]
+
+    def limeExplainer(self, features):
+        """
+        :param features: names of the features shown in the explanations
+        :return: LimeTabularExplainer built on a summary of the training data, with the statistics of the
+        discretization calculated once over the whole training data (see backgroundSummary)
+        """
+        from lime.lime_tabular import LimeTabularExplainer
+
+        key = tuple(features)
+        if key not in self.lime_explainers:
+            background, _ = loadBackground(self.model_path, self.x_train, constants.XAI_LIME_BACKGROUND_SIZE)
+            self.lime_explainers[key] = LimeTabularExplainer(background,
+                                                             training_data_stats=loadLimeStats(self.model_path,
+                                                                                               self.x_train),
+                                                             mode="classification",
+                                                             feature_selection='auto',
+                                                             class_names=CLASSES,
+                                                             feature_names=list(features),
+                                                             kernel_width=None,
+                                                             discretize_continuous=True)
+        return self.lime_explainers[key]
+
+    def scaleInstance(self, instance):
+        """
+        :param instance: raw values of the features of a flow, either a list ordered as constants.AD_FEATURES[3:]
+        (trimmed or padded with zeros) or a dictionary feature name -> value (missing features are 0)
+        :return: scaled instance (1 row)
+        """
+        features_names = constants.AD_FEATURES[3:]
+        if isinstance(instance, list):
+            values = (instance + [0] * len(features_names))[:len(features_names)]
+            ordered_values = [float(v) for v in values]
+        elif isinstance(instance, dict):
+            ordered_values = [float(instance.get(name, 0)) for name in features_names]
+        else:
+            raise ValueError('instance_json must be either an array (ordered values) or an object '
+                             '(featureName->value)')
+        return self.scaler.transform(np.array(ordered_values, dtype=float).reshape(1, -1))
+
+    def saveInstanceProbs(self, instance_scaled):
+        """
+        Saves the predicted probabilities of an instance (Normal vs Malware) for the pie chart of the UI
+        """
+        flat = np.asarray(self.model.predict(instance_scaled.reshape(1, -1))).reshape(-1)
+        if flat.shape[0] == 1:
+            probs = [float(1.0 - flat[0]), float(flat[0])]
+        else:
+            # assume [Normal, Malware]
+            probs = [float(flat[0]), float(flat[1])]
+        with open(os.path.join(explanationsPath(self.model_name), 'instance_probs.json'), 'w') as pf:
+            json.dump({"normal": probs[0], "malware": probs[1]}, pf)
+
+
+def explainShap(artifacts, numberBackgroundSamples, numberExplainedSamples, maxDisplay):
+    """
+    Produce explanations of feature importance
+
+    :param numberBackgroundSamples: number of background samples used for explanations
+    :param numberExplainedSamples: number of samples to be explained
+    :param maxDisplay: maximum number of features in explanations
+    :return: time taken by the explanation (in seconds)
+    """
+    import shap
+
+    start = timeit.default_timer()
+    features = artifacts.features
+    explainer = artifacts.shapExplainer(numberBackgroundSamples)
+    x_test_df = pd.DataFrame(artifacts.x_test, columns=features)
+    x_samples = shap.sample(x_test_df, int(numberExplainedSamples))
+    explain_start = timeit.default_timer()
+    shap_values = shapValues(explainer, x_samples)
+    throughput = len(x_samples) / max(timeit.default_timer() - explain_start, 1e-9)
+
+    columns = ['feature', 'importance_value']
+    vals = np.abs(shap_values).mean(0)
+    sorted_feature_vals = sorted(list(zip(features, vals.tolist())), key=lambda x: x[1], reverse=True)
+    features_to_display = [dict(zip(columns, row)) for row in sorted_feature_vals]
+
+    jsonfile = os.path.join(explanationsPath(artifacts.model_name), f'{LABEL}_importance_values.json')
+    with open(jsonfile, "w") as outfile:
+        json.dump(features_to_display, outfile)
+
+    time_taken = timeit.default_timer() - start
+    print(f"Time taken for SHAP ({type(explainer).__name__}) in seconds: ", time_taken)
+    print(f"Explained samples per second: {throughput:.2f}")
+    saveTime(artifacts.model_name, 'shap', time_taken, type(explainer).__name__,
+             explained_samples=len(x_samples), samples_per_second=throughput)
+    return time_taken
+
+
+def limeExplanation(artifacts, explainer, instance, features, numberFeatures):
+    """
+    Explains an instance with LIME once, with all the features: the top numberFeatures features are the features of
+    the full explanation with the largest weights, so the perturbations are drawn and predicted only once
+
+    :return: dictionary with the explanations of all the features ('explanations', as the LIME conditions of the
+    features), their weights by feature name ('values') and the numberFeatures first explanations ('top')
+    """
+    explanation = explainer.explain_instance(instance, artifacts.model.predict, labels=(0,),
+                                             num_features=len(features))
+    columns = ['feature', 'value']
+    exps_to_display = [dict(zip(columns, row)) for row in explanation.as_list(label=0)]
+    return {
+        'explanations': exps_to_display,
+        'values': [{"feature": features[x], "value": y} for x, y in explanation.as_map()[0]],
+        'top': exps_to_display[:int(numberFeatures)],
+    }
+
+
+def saveLime(artifacts, explainer, instance, features, numberFeatures):
+    """
+    Explains an instance with LIME and saves the explanations (all the features) and their values
+    """
+    explanation = limeExplanation(artifacts, explainer, instance, features, numberFeatures)
+    explanations_path = explanationsPath(artifacts.model_name)
+    with open(os.path.join(explanations_path, f'{LABEL}_lime_explanations.json'), "w") as outfile:
+        json.dump(explanation['explanations'], outfile)
+    with open(os.path.join(explanations_path, f'{LABEL}_lime_values.json'), "w") as outfile:
+        json.dump(explanation['values'], outfile)
+
+
+def explainLime(artifacts, sampleId, numberFeatures):
+    """
+    Produce explanations of a particular sample
+
+    :param sampleId: a sample of testing dataset being explained
+    :param numberFeatures: maximum number of features in explanation
+    :return: time taken by the explanation (in seconds)
+    """
+    start = timeit.default_timer()
+    idx = int(sampleId)
+    print("Prediction : ", artifacts.model.predict(artifacts.x_test[idx].reshape(1, -1)))
+    print("Actual :     ", artifacts.y_test[idx])
+    explainer = artifacts.limeExplainer(artifacts.features)
+    saveLime(artifacts, explainer, artifacts.x_test[idx], artifacts.features, numberFeatures)
+
+    time_taken = timeit.default_timer() - start
+    print("Time taken for LIME in seconds: ", time_taken)
+    saveTime(artifacts.model_name, 'lime', time_taken)
+    return time_taken
+
+
+def explainLimeInstance(artifacts, instance, numberFeatures):
+    """
+    Produce LIME explanations of a flow (e.g. of a prediction)
+
+    :param instance: raw values of the features of the flow (see ModelArtifacts.scaleInstance)
+    :param numberFeatures: maximum number of features in explanation
+    :return: time taken by the explanation (in seconds)
+    """
+    start = timeit.default_timer()
+    features_names = constants.AD_FEATURES[3:]
+    instance_scaled = artifacts.scaleInstance(instance)
+    saveLime(artifacts, artifacts.limeExplainer(features_names), instance_scaled.reshape(-1), features_names,
+             numberFeatures)
+
+    with open(os.path.join(explanationsPath(artifacts.model_name), 'time_stats_lime.txt'), 'w') as f:
+        f.write('flow-instance')
+    try:
+        artifacts.saveInstanceProbs(instance_scaled)
+    except Exception:
+        # Do not fail the entire run if probs writing fails
+        pass
+    return timeit.default_timer() - start
+
+
+def explainShapInstance(artifacts, instance, numberFeatures):
+    """
+    Produce SHAP explanations of a flow (e.g. of a prediction)
+
+    :param instance: raw values of the features of the flow (see ModelArtifacts.scaleInstance)
+    :param numberFeatures: maximum number of features in explanation
+    :return: time taken by the explanation (in seconds)
+    """
+    start = timeit.default_timer()
+    features_names = constants.AD_FEATURES[3:]
+    instance_scaled = artifacts.scaleInstance(instance)
+    # Explainer with a background subset from x_train
+    explainer = artifacts.shapExplainer(100)
+    shap_arr = shapValues(explainer, instance_scaled)
+
+    # Convert to feature/value pairs, limited by numberFeatures (sorted by absolute value)
+    pairs = list(zip(features_names, shap_arr.reshape(-1)))
+    pairs_sorted = sorted(pairs, key=lambda x: abs(x[1]), reverse=True)[:int(numberFeatures)]
+    shap_values_to_display = [{"feature": f, "importance_value": float(v)} for f, v in pairs_sorted]
+    with open(os.path.join(explanationsPath(artifacts.model_name), f'{LABEL}_importance_values.json'), 'w') as f:
+        json.dump(shap_values_to_display, f)
+
+    try:
+        artifacts.saveInstanceProbs(instance_scaled)
+    except Exception:
+        pass
+    return timeit.default_timer() - start
+
+
+def explainLimeSample(artifacts, sample, numberFeatures):
+    """
+    :param sample: id of a sample of the testing dataset, or raw values of the features of a flow (see
+    ModelArtifacts.scaleInstance)
+    :return: LIME explanation of the sample (see limeExplanation) with its predicted Malware probability
+    """
+    if isinstance(sample, (list, dict)):
+        features = constants.AD_FEATURES[3:]
+        instance = artifacts.scaleInstance(sample).reshape(-1)
+    else:
+        features = artifacts.features
+        instance = artifacts.x_test[int(sample)]
+    result = limeExplanation(artifacts, artifacts.limeExplainer(features), instance, features, numberFeatures)
+    result['sample'] = sample if isinstance(sample, (list, dict)) else int(sample)
+    result['malware'] = float(np.asarray(artifacts.model.predict(instance.reshape(1, -1))).reshape(-1)[-1])
+    return result
+
+
+# Artifacts of the model explained by a process of the pool of explainLimeBatch
+_worker_artifacts = None
+
+
+def initLimeWorker(model_id):
+    global _worker_artifacts
+    _worker_artifacts = ModelArtifacts(model_id)
+
+
+def explainLimeWorker(task):
+    sample, numberFeatures = task
+    return explainLimeSample(_worker_artifacts, sample, numberFeatures)
+
+
+def explainLimeBatch(artifacts, samples, numberFeatures, workers=constants.XAI_LIME_BATCH_WORKERS):
+    """
+    Produce LIME explanations of many samples or flows (e.g. the flows of an attack), saved together in
+    xai/<model name>/lime_batch.json and, one row per sample and one column per feature weight, in
+    xai/<model name>/lime_batch<FEATURE_FILE_EXTENSION>
+
+    :param artifacts: artifacts of the model (used when there is a single process)
+    :param samples: ids of samples of the testing dataset and/or flows (see explainLimeSample)
+    :param numberFeatures: number of features in the top explanations
+    :param workers: number of processes explaining the samples, each process loads the artifacts of the model once
+    :return: time taken by the explanations (in seconds)
+    """
+    start = timeit.default_timer()
+    workers = max(1, min(int(workers), len(samples)))
+    if workers > 1:
+        # the processes are spawned: TensorFlow does not support being forked
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=initLimeWorker, initargs=(artifacts.model_id,)) as pool:
+            results = list(pool.map(explainLimeWorker, [(sample, numberFeatures) for sample in samples],
+                                    chunksize=max(1, len(samples) // (4 * workers))))
+    else:
+        results = [explainLimeSample(artifacts, sample, numberFeatures) for sample in samples]
+
+    explanations_path = explanationsPath(artifacts.model_name)
+    time_taken = timeit.default_timer() - start
+    with open(os.path.join(explanations_path, 'lime_batch.json'), 'w') as f:
+        json.dump({'model': artifacts.model_id, 'numberFeatures': int(numberFeatures), 'time': time_taken,
+                   'explanations': results}, f)
+    weights = pd.DataFrame([{value['feature']: value['value'] for value in result['values']} for result in results])
+    weights.insert(0, 'malware', [result['malware'] for result in results])
+    weights.insert(0, 'sample', [json.dumps(result['sample']) for result in results])
+    writeFeatures(weights, os.path.join(explanations_path, f'lime_batch{FEATURE_FILE_EXTENSION}'))
+
+    print(f"Time taken for LIME of {len(samples)} samples in seconds: ", time_taken)
+    saveTime(artifacts.model_name, 'lime', time_taken / max(1, len(samples)), 'LimeTabularExplainer',
+             explained_samples=len(samples), samples_per_second=len(samples) / max(time_taken, 1e-9))
+    return time_taken
+
+
+def readInstance(instance_json_path):
+    with open(instance_json_path, 'r') as f:
+        return json.load(f)
+
+
+def readBatchSamples(samples_json_path):
+    """
+    :param samples_json_path: JSON file with either a list of ids of samples of the testing dataset and/or flows
+    (see explainLimeSample), or an object {"predictions": <folder of the results of a prediction>, "view": "attacks"
+    (default) or "all", "limit": <maximal number of flows>} to explain the predicted flows
+    :return: samples of explainLimeBatch
+    """
+    samples = readInstance(samples_json_path)
+    if isinstance(samples, list):
+        return samples
+    flows = readPredictions(samples['predictions'], samples.get('view', 'attacks'))
+    if samples.get('limit') is not None:
+        flows = flows.iloc[:int(samples['limit'])]
+    # features are between the ips (session id, direction, ip) and the predicted class
+    features = flows.iloc[:, 3:-1].apply(pd.to_numeric, errors='coerce').fillna(0)
+    return [{str(name): float(value) for name, value in row.items()} for _, row in features.iterrows()]
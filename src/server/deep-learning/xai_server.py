@@ -0,0 +1,139 @@
+"""
+Long-lived XAI service: keeps the artifacts of the models (loaded model, scaled training/test data, SHAP and LIME
+explainers) between the explanations, so that explaining the same model again only costs the explanation. The
+artifacts of the least recently used models are released.
+
+Requests and responses are JSON objects, one per line, read from stdin and written to stdout:
+  {"id": 1, "type": "shap", "model": "<model id>", "numberBackgroundSamples": 100, "numberExplainedSamples": 10,
+   "maxDisplay": 15}
+  {"id": 2, "type": "lime", "model": "<model id>", "sampleId": 5, "numberFeatures": 10}
+  {"id": 3, "type": "shap-flow" or "lime-flow", "model": "<model id>", "instance": "<instance .json>",
+   "numberFeatures": 10}
+  {"id": 6, "type": "lime-batch", "model": "<model id>", "samples": "<samples .json>", "numberFeatures": 10,
+   "workers": 4}
+    -> {"id": ..., "ok": true, "explanation_time": <time of the explanation>, "time_ms": <time of the request>}
+       the explanations are saved in xai/<model name>/ as by the xai-*.py scripts
+  {"id": 4, "command": "stats"} -> {"id": 4, "ok": true, "models": [...], "requests": <nb requests>}
+  {"id": 5, "command": "stop"}
+A failed request gets {"id": ..., "ok": false, "error": "<message>"}
+"""
+import sys
+
+# Responses are written to the original stdout, all the other outputs (prints, logs, progress bars) go to stderr
+PROTOCOL_OUT = sys.stdout
+sys.stdout = sys.stderr
+
+import argparse
+import json
+import os
+import timeit
+from collections import OrderedDict
+
+import constants
+from xaiExplanations import (ModelArtifacts, explainLime, explainLimeBatch, explainLimeInstance, explainShap,
+                             explainShapInstance, readBatchSamples, readInstance)
+
+
+class ArtifactCache:
+    """
+    Artifacts of the models by model id, at most max_models are kept
+    """
+
+    def __init__(self, max_models=constants.XAI_MODELS_CACHE_SIZE):
+        self.max_models = max_models
+        self.models = OrderedDict()
+
+    def get(self, model_id):
+        """
+        :param model_id: model file name (in the models folder)
+        :return: artifacts of the model, built again if the model file has been modified since they were built
+        """
+        artifacts = self.models.get(model_id)
+        if artifacts is not None and os.path.getmtime(artifacts.model_path) == artifacts.modified_at:
+            self.models.move_to_end(model_id)
+            return artifacts
+        print(f"Load the artifacts of the model {model_id}")
+        artifacts = ModelArtifacts(model_id)
+        artifacts.modified_at = os.path.getmtime(artifacts.model_path)
+        self.models[model_id] = artifacts
+        self.models.move_to_end(model_id)
+        if len(self.models) > self.max_models:
+            released_id, _ = self.models.popitem(last=False)
+            print(f"Release the artifacts of the model {released_id}")
+        return artifacts
+
+
+class XAIServer:
+
+    def __init__(self, max_models=constants.XAI_MODELS_CACHE_SIZE):
+        self.artifacts = ArtifactCache(max_models)
+        self.nb_requests = 0
+        self.running = True
+
+    def handle(self, line):
+        """
+        :param line: JSON request
+        :return: JSON response
+        """
+        request_id = None
+        start = timeit.default_timer()
+        try:
+            request = json.loads(line)
+            request_id = request.get('id')
+            response = self._handle(request)
+        except Exception as e:
+            print(f"Request {request_id} failed: {e}")
+            response = {'ok': False, 'error': str(e)}
+        self.nb_requests += 1
+        response['id'] = request_id
+        response['time_ms'] = round((timeit.default_timer() - start) * 1000, 3)
+        return json.dumps(response)
+
+    def _handle(self, request):
+        command = request.get('command')
+        if command == 'stats':
+            return {'ok': True, 'models': list(self.artifacts.models), 'requests': self.nb_requests}
+        if command == 'stop':
+            self.running = False
+            return {'ok': True}
+        if command is not None:
+            raise ValueError(f"Unknown command {command}")
+
+        model_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models', request['model'])
+        if not os.path.isfile(model_path):
+            raise FileNotFoundError(f"Model {request['model']} does not exist")
+        artifacts = self.artifacts.get(request['model'])
+        xai_type = request['type']
+        if xai_type == 'shap':
+            time_taken = explainShap(artifacts, request['numberBackgroundSamples'], request['numberExplainedSamples'],
+                                     request['maxDisplay'])
+        elif xai_type == 'lime':
+            time_taken = explainLime(artifacts, request['sampleId'], request['numberFeatures'])
+        elif xai_type == 'shap-flow':
+            time_taken = explainShapInstance(artifacts, readInstance(request['instance']), request['numberFeatures'])
+        elif xai_type == 'lime-flow':
+            time_taken = explainLimeInstance(artifacts, readInstance(request['instance']), request['numberFeatures'])
+        elif xai_type == 'lime-batch':
+            time_taken = explainLimeBatch(artifacts, readBatchSamples(request['samples']), request['numberFeatures'],
+                                          request.get('workers', constants.XAI_LIME_BATCH_WORKERS))
+        else:
+            raise ValueError(f"Unknown XAI type {xai_type}")
+        return {'ok': True, 'explanation_time': time_taken}
+
+    def serveStdin(self):
+        for line in sys.stdin:
+            if not line.strip():
+                continue
+            PROTOCOL_OUT.write(self.handle(line) + '\n')
+            PROTOCOL_OUT.flush()
+            if not self.running:
+                break
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="XAI server keeping the models and their explainers loaded")
+    parser.add_argument("--max-models", type=int, default=constants.XAI_MODELS_CACHE_SIZE,
+                        help="Maximal number of models whose artifacts are kept")
+    args = parser.parse_args()
+
+    XAIServer(args.max_models).serveStdin()
@@ -31,6 +31,8 @@ const {
   performPoisoningRSL,
   performPoisoningTLF,
 } = require('../deep-learning/attacks-connector');
+const { readPredictionFlow } = require('../deep-learning/prediction-results');
+const { explainWithServer } = require('../deep-learning/xai-server');
 
 // Configuration
 const CONCURRENCY = {
@@ -193,7 +195,7 @@ featureQueue.process('extract', CONCURRENCY.featureExtraction, async (job) => {
               
               const finalReportCsv = path.join(outputDir, picked);
               const baseName = path.parse(picked).name;
-              const outPkl = path.join(outputDir, `${baseName}.pkl`);
+              const outFeatures = path.join(outputDir, `${baseName}.parquet`);
               const outCsv = path.join(outputDir, `${baseName}.features.csv`);
 
               await job.progress(70);
@@ -203,7 +205,7 @@ featureQueue.process('extract', CONCURRENCY.featureExtraction, async (job) => {
               const featParams = [
                 path.join(DEEP_LEARNING_PATH, 'trafficToFeature.py'),
                 finalReportCsv,
-                outPkl,
+                outFeatures,
                 String(Boolean(isMalicious)),
               ];
               
@@ -214,13 +216,14 @@ featureQueue.process('extract', CONCURRENCY.featureExtraction, async (job) => {
 
                 await job.progress(85);
                 
-                // Convert PKL to CSV
+                // Convert features to CSV
                 const pyInline = [
                   '-c',
                   [
-                    'import pandas as pd, numpy as np, sys; ',
+                    'import numpy as np, sys; sys.path.insert(0, sys.argv[4]); ',
+                    'from featureStore import featuresPath, readFeatures; ',
                     'inp=sys.argv[1]; out=sys.argv[2]; drop=(len(sys.argv)>3 and sys.argv[3]=="1"); ',
-                    'df=pd.read_pickle(inp); ',
+                    'df=readFeatures(featuresPath(inp)); ',
                     'df=df[df.notnull().all(axis=1)]; ',
                     'df=df.replace([np.inf, -np.inf], 0)\n',
                     'if drop:\n',
@@ -230,14 +233,15 @@ featureQueue.process('extract', CONCURRENCY.featureExtraction, async (job) => {
                     '    if to_drop: df=df.drop(columns=to_drop)\n',
                     'df.to_csv(out, index=False)'
                   ].join(''),
-                  outPkl,
+                  outFeatures,
                   outCsv,
                   hasLabel ? '0' : '1',
+                  DEEP_LEARNING_PATH,
                 ];
                 
                 spawnCommand(PYTHON_CMD, pyInline, logFile, async (err3) => {
                   if (err3) {
-                    return reject(new Error(`PKL->CSV conversion failed: ${err3.message}`));
+                    return reject(new Error(`Features->CSV conversion failed: ${err3.message}`));
                   }
                   
                   try {
@@ -465,8 +469,10 @@ predictionQueue.process('predict', CONCURRENCY.prediction, async (job) => {
       predictionId,
       modelId,
       predictionPath,
-      resultsFile: path.join(predictionPath, 'predictions.csv'),
-      statsFile: path.join(predictionPath, 'stats.csv'),
+      // predictions.pkl when pyarrow is not installed (see predictionResults.predictionsFile)
+      resultsFile: ['predictions.parquet', 'predictions.pkl'].map((file) => path.join(predictionPath, file))
+        .find((file) => fs.existsSync(file)) || path.join(predictionPath, 'predictions.parquet'),
+      statsFile: path.join(predictionPath, 'stats.json'),
       message: 'Prediction completed successfully'
     };
     
@@ -645,58 +651,24 @@ xaiQueue.process('*', CONCURRENCY.xaiExplanations, async (job) => {
     await job.progress(10);
     
     const logFile = path.join(LOG_PATH, `xai_${xaiType}_${modelId}.log`);
-    let scriptPath, args;
+    let scriptPath, args, params;
     
     // Determine script and arguments based on XAI type
     if (xaiType === 'shap') {
       const { numberBackgroundSamples, numberExplainedSamples, maxDisplay } = config;
       scriptPath = path.join(DEEP_LEARNING_PATH, 'xai-shap.py');
       args = [scriptPath, modelId, numberBackgroundSamples, numberExplainedSamples, maxDisplay];
+      params = { numberBackgroundSamples, numberExplainedSamples, maxDisplay };
       
     } else if (xaiType === 'lime') {
       const { sampleId, numberFeature } = config;
       scriptPath = path.join(DEEP_LEARNING_PATH, 'xai-lime.py');
       args = [scriptPath, modelId, sampleId, numberFeature];
+      params = { sampleId, numberFeatures: numberFeature };
       
     } else if (xaiType === 'shap-flow') {
       const { predictionId, sessionId, numberFeature } = config;
-      const fsPromises = require('fs').promises;
-      
-      // Build instance vector from prediction
-      const buildInstanceVector = async () => {
-        const attackFile = path.join(PREDICTION_PATH, predictionId, 'attacks.csv');
-        const allFile = path.join(PREDICTION_PATH, predictionId, 'predictions.csv');
-        let csvPath = fs.existsSync(attackFile) ? attackFile : allFile;
-        
-        if (!fs.existsSync(csvPath)) {
-          throw new Error(`No prediction CSV found for ${predictionId}`);
-        }
-        
-        const content = await fsPromises.readFile(csvPath, 'utf-8');
-        const lines = content.split('\n').filter(l => l.trim().length > 0);
-        if (lines.length < 2) throw new Error('Empty prediction CSV');
-        
-        const header = lines[0].split(',');
-        const featureHeaders = header.slice(3, header.length - 1);
-        
-        for (let i = 1; i < lines.length; i++) {
-          const cols = lines[i].split(',');
-          if (cols.length < 5) continue;
-          if (String(cols[0]).trim() === String(sessionId).trim()) {
-            const featureVals = cols.slice(3, cols.length - 1);
-            const featureMap = {};
-            for (let j = 0; j < featureHeaders.length; j++) {
-              const key = featureHeaders[j];
-              const num = Number(featureVals[j]);
-              featureMap[key] = Number.isNaN(num) ? 0 : num;
-            }
-            return featureMap;
-          }
-        }
-        throw new Error(`Session ${sessionId} not found in prediction ${predictionId}`);
-      };
-      
-      const featureMap = await buildInstanceVector();
+      const { featureMap } = await readPredictionFlow(predictionId, sessionId);
       const tmpDir = path.join(DEEP_LEARNING_PATH, 'xai', 'tmp');
       fs.mkdirSync(tmpDir, { recursive: true });
       const instanceJsonPath = path.join(tmpDir, `${predictionId}_${sessionId}_shap.json`);
@@ -704,46 +676,11 @@ xaiQueue.process('*', CONCURRENCY.xaiExplanations, async (job) => {
       
       scriptPath = path.join(DEEP_LEARNING_PATH, 'xai-shap-instance.py');
       args = [scriptPath, modelId, instanceJsonPath, numberFeature];
+      params = { instance: instanceJsonPath, numberFeatures: numberFeature };
       
     } else if (xaiType === 'lime-flow') {
       const { predictionId, sessionId, numberFeature } = config;
-      const fsPromises = require('fs').promises;
-      
-      // Build instance vector (same logic as shap-flow)
-      const buildInstanceVector = async () => {
-        const attackFile = path.join(PREDICTION_PATH, predictionId, 'attacks.csv');
-        const allFile = path.join(PREDICTION_PATH, predictionId, 'predictions.csv');
-        let csvPath = fs.existsSync(attackFile) ? attackFile : allFile;
-        
-        if (!fs.existsSync(csvPath)) {
-          throw new Error(`No prediction CSV found for ${predictionId}`);
-        }
-        
-        const content = await fsPromises.readFile(csvPath, 'utf-8');
-        const lines = content.split('\n').filter(l => l.trim().length > 0);
-        if (lines.length < 2) throw new Error('Empty prediction CSV');
-        
-        const header = lines[0].split(',');
-        const featureHeaders = header.slice(3, header.length - 1);
-        
-        for (let i = 1; i < lines.length; i++) {
-          const cols = lines[i].split(',');
-          if (cols.length < 5) continue;
-          if (String(cols[0]).trim() === String(sessionId).trim()) {
-            const featureVals = cols.slice(3, cols.length - 1);
-            const featureMap = {};
-            for (let j = 0; j < featureHeaders.length; j++) {
-              const key = featureHeaders[j];
-              const num = Number(featureVals[j]);
-              featureMap[key] = Number.isNaN(num) ? 0 : num;
-            }
-            return featureMap;
-          }
-        }
-        throw new Error(`Session ${sessionId} not found in prediction ${predictionId}`);
-      };
-      
-      const featureMap = await buildInstanceVector();
+      const { featureMap } = await readPredictionFlow(predictionId, sessionId);
       const tmpDir = path.join(DEEP_LEARNING_PATH, 'xai', 'tmp');
       fs.mkdirSync(tmpDir, { recursive: true });
       const instanceJsonPath = path.join(tmpDir, `${predictionId}_${sessionId}.json`);
@@ -751,6 +688,7 @@ xaiQueue.process('*', CONCURRENCY.xaiExplanations, async (job) => {
       
       scriptPath = path.join(DEEP_LEARNING_PATH, 'xai-lime-instance.py');
       args = [scriptPath, modelId, instanceJsonPath, numberFeature];
+      params = { instance: instanceJsonPath, numberFeatures: numberFeature };
       
     } else {
       throw new Error(`Unknown XAI type: ${xaiType}`);
@@ -758,9 +696,9 @@ xaiQueue.process('*', CONCURRENCY.xaiExplanations, async (job) => {
     
     await job.progress(30);
     
-    // Execute Python script
+    // Explain with the XAI server of the model (the script is run if the server fails)
     return new Promise((resolve, reject) => {
-      spawnCommand(PYTHON_CMD, args, logFile, async (error) => {
+      explainWithServer(xaiType, modelId, params, args, logFile, async (error) => {
         if (error) {
           return reject(new Error(`${xaiType.toUpperCase()} script failed: ${error.message}`));
         }
@@ -12,6 +12,8 @@ const {
   PYTHON_CMD
 } = require('../../constants');
 const { spawnCommand } = require('../../utils/utils');
+const { readPredictionFlow } = require('../../deep-learning/prediction-results');
+const { explainWithServer } = require('../../deep-learning/xai-server');
 const fs = require('fs');
 const fsPromises = require('fs').promises;
 const path = require('path');
@@ -40,19 +42,21 @@ const processXAIJob = async (job) => {
     job.progress(20);
     
     // Execute the appropriate XAI script based on type
-    let scriptPath, args;
+    let scriptPath, args, params;
     
     if (xaiType === 'shap') {
       // SHAP explanation
       const { numberBackgroundSamples, numberExplainedSamples, maxDisplay } = config;
       scriptPath = `${DEEP_LEARNING_PATH}/xai-shap.py`;
       args = [scriptPath, modelId, numberBackgroundSamples, numberExplainedSamples, maxDisplay];
+      params = { numberBackgroundSamples, numberExplainedSamples, maxDisplay };
       
     } else if (xaiType === 'lime') {
       // LIME explanation
       const { sampleId, numberFeatures } = config;
       scriptPath = `${DEEP_LEARNING_PATH}/xai-lime.py`;
       args = [scriptPath, modelId, sampleId, numberFeatures];
+      params = { sampleId, numberFeatures };
       
     } else if (xaiType === 'shap-flow') {
       // SHAP for flow instance
@@ -65,6 +69,7 @@ const processXAIJob = async (job) => {
       
       scriptPath = `${DEEP_LEARNING_PATH}/xai-shap-instance.py`;
       args = [scriptPath, modelId, instanceJsonPath, numberFeature];
+      params = { instance: instanceJsonPath, numberFeatures: numberFeature };
       
     } else if (xaiType === 'lime-flow') {
       // LIME for flow instance
@@ -77,6 +82,7 @@ const processXAIJob = async (job) => {
       
       scriptPath = `${DEEP_LEARNING_PATH}/xai-lime-instance.py`;
       args = [scriptPath, modelId, instanceJsonPath, numberFeature];
+      params = { instance: instanceJsonPath, numberFeatures: numberFeature };
       
     } else {
       throw new Error(`Unknown XAI type: ${xaiType}`);
@@ -88,7 +94,7 @@ const processXAIJob = async (job) => {
     const logFile = `${LOG_PATH}xai_${xaiType}_${modelId}.log`;
     
     await new Promise((resolve, reject) => {
-      spawnCommand(PYTHON_CMD, args, logFile, (error) => {
+      explainWithServer(xaiType, modelId, params, args, logFile, (error) => {
         if (error) {
           reject(new Error(`XAI script failed: ${error}`));
         } else {
@@ -129,43 +135,7 @@ const processXAIJob = async (job) => {
 /**
  * Helper function to build instance vector from prediction outputs
  */
-const buildInstanceVectorFromPrediction = async (predictionId, sessionId) => {
-  const PREDICTION_PATH = require('../../constants').PREDICTION_PATH;
-  const attackFile = path.join(PREDICTION_PATH, predictionId, 'attacks.csv');
-  const allFile = path.join(PREDICTION_PATH, predictionId, 'predictions.csv');
-  let csvPath = null;
-  
-  if (fs.existsSync(attackFile)) {
-    csvPath = attackFile;
-  } else if (fs.existsSync(allFile)) {
-    csvPath = allFile;
-  } else {
-    throw new Error(`No prediction CSV found for ${predictionId}`);
-  }
-
-  const content = await fsPromises.readFile(csvPath, 'utf-8');
-  const lines = content.split('\n').filter(l => l.trim().length > 0);
-  if (lines.length < 2) throw new Error('Empty prediction CSV');
-  
-  const header = lines[0].split(',');
-  const featureHeaders = header.slice(3, header.length - 1);
-  
-  for (let i = 1; i < lines.length; i++) {
-    const cols = lines[i].split(',');
-    if (cols.length < 5) continue;
-    if (String(cols[0]).trim() === String(sessionId).trim()) {
-      const featureVals = cols.slice(3, cols.length - 1);
-      const featureMap = {};
-      for (let j = 0; j < featureHeaders.length; j++) {
-        const key = featureHeaders[j];
-        const num = Number(featureVals[j]);
-        featureMap[key] = Number.isNaN(num) ? 0 : num;
-      }
-      return { featureMap, featureHeaders };
-    }
-  }
-  throw new Error(`Session ${sessionId} not found in prediction ${predictionId}`);
-};
+const buildInstanceVectorFromPrediction = (predictionId, sessionId) => readPredictionFlow(predictionId, sessionId);
 
 // Process jobs from the queue
 xaiQueue.process('*', MAX_CONCURRENT, processXAIJob);
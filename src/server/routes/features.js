@@ -141,7 +141,7 @@ router.post('/extract', async (req, res) => {
             }
             const finalReportCsv = path.join(outputDir, picked);
             const baseName = path.parse(picked).name;
-            const outPkl = path.join(outputDir, `${baseName}.pkl`);
+            const outFeatures = path.join(outputDir, `${baseName}.parquet`);
             const outCsv = path.join(outputDir, `${baseName}.features.csv`);
 
             // Determine label choice
@@ -149,7 +149,7 @@ router.post('/extract', async (req, res) => {
             const featParams = [
               path.join(DEEP_LEARNING_PATH, 'trafficToFeature.py'),
               finalReportCsv,
-              outPkl,
+              outFeatures,
               String(Boolean(isMalicious)),
             ];
             spawnCommand(PYTHON_CMD, featParams, logFile, (err2) => {
@@ -161,9 +161,10 @@ router.post('/extract', async (req, res) => {
               const pyInline = [
                 '-c',
                 [
-                  'import pandas as pd, numpy as np, sys; ',
+                  'import numpy as np, sys; sys.path.insert(0, sys.argv[4]); ',
+                  'from featureStore import featuresPath, readFeatures; ',
                   'inp=sys.argv[1]; out=sys.argv[2]; drop=(len(sys.argv)>3 and sys.argv[3]=="1"); ',
-                  'df=pd.read_pickle(inp); ',
+                  'df=readFeatures(featuresPath(inp)); ',
                   'df=df[df.notnull().all(axis=1)]; ',
                   'df=df.replace([np.inf, -np.inf], 0)\n',
                   'if drop:\n',
@@ -173,13 +174,14 @@ router.post('/extract', async (req, res) => {
                   '    if to_drop: df=df.drop(columns=to_drop)\n',
                   'df.to_csv(out, index=False)'
                 ].join(''),
-                outPkl,
+                outFeatures,
                 outCsv,
                 hasLabel ? '0' : '1',
+                DEEP_LEARNING_PATH,
               ];
               spawnCommand(PYTHON_CMD, pyInline, logFile, (err3) => {
                 if (err3) {
-                  console.error('[features] PKL->CSV conversion failed:', err3.message || err3);
+                  console.error('[features] Features->CSV conversion failed:', err3.message || err3);
                   return res.status(500).send('Failed to convert features to CSV');
                 }
                 try {
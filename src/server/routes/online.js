@@ -3,7 +3,14 @@ const router = express.Router();
 const { spawn, exec } = require('child_process');
 const fs = require('fs');
 const path = require('path');
-const { PCAP_PATH } = require('../constants');
+const {
+  PCAP_PATH,
+  LOG_PATH,
+  MODEL_PATH,
+  PREDICTION_PATH,
+  DEEP_LEARNING_PATH,
+  PYTHON_CMD,
+} = require('../constants');
 
 const { USE_SUDO } = process.env;
 const SUDO = USE_SUDO === 'false' ? '' : 'sudo ';
@@ -18,6 +25,8 @@ let captureState = {
   stopTimer: null,
   sessionDir: null,
   outputSessionId: null,
+  pipelinePid: null,
+  predictionDir: null,
 };
 
 const FILE_PREFIX = 'ndr_';
@@ -44,6 +53,40 @@ function listNdrFiles() {
   }
 }
 
+/**
+ * Start the online detection pipeline (online_pipeline.py) on the capture windows of the session:
+ * the windows are analysed, their features calculated and predicted as soon as they are captured
+ */
+function startPipeline(sessionDir, modelId, predictionDir) {
+  fs.mkdirSync(predictionDir, { recursive: true });
+  const logFile = fs.createWriteStream(path.join(LOG_PATH, `online_pipeline_${path.basename(predictionDir)}.log`), { flags: 'a' });
+  const pipeline = spawn(PYTHON_CMD, [
+    path.join(DEEP_LEARNING_PATH, 'online_pipeline.py'),
+    sessionDir,
+    path.join(MODEL_PATH, modelId),
+    predictionDir,
+  ], { stdio: ['ignore', 'pipe', 'pipe'] });
+  pipeline.stdout.pipe(logFile);
+  pipeline.stderr.pipe(logFile);
+  pipeline.on('exit', (code, signal) => {
+    console.log(`[ONLINE] pipeline exited code=${code} signal=${signal}`);
+    if (captureState.pipelinePid === pipeline.pid) {
+      captureState.pipelinePid = null;
+    }
+  });
+  return pipeline;
+}
+
+function stopPipeline() {
+  if (captureState.pipelinePid === null) return;
+  try {
+    // The pipeline processes the remaining windows before exiting
+    process.kill(captureState.pipelinePid, 'SIGTERM');
+  } catch (e) {
+    console.warn('[ONLINE] Failed to stop the pipeline:', e.message);
+  }
+}
+
 function getLatestNdrFileDetail() {
   const entries = listNdrFiles();
   if (entries.length === 0) return null;
@@ -64,6 +107,8 @@ router.get('/status', (req, res) => {
     totalDurationSec: captureState.totalDurationSec,
     sessionDir: captureState.sessionDir,
     outputSessionId: captureState.outputSessionId,
+    pipelineRunning: captureState.pipelinePid !== null,
+    predictionDir: captureState.predictionDir,
     lastFile: last ? last.file : null,
     lastFileMtimeMs: last ? last.mtimeMs : null,
     lastFileAgeMs: last ? last.ageMs : null,
@@ -88,8 +133,25 @@ router.get('/files', (req, res) => {
   }
 });
 
+/**
+ * Latency of each stage of the online pipeline, per capture window
+ */
+router.get('/latency', (req, res) => {
+  const latencyFile = captureState.predictionDir && path.join(captureState.predictionDir, 'latency.csv');
+  if (!latencyFile || !fs.existsSync(latencyFile)) {
+    return res.send({ windows: [] });
+  }
+  const [header, ...lines] = fs.readFileSync(latencyFile, 'utf8').split('\n').filter(l => l.trim());
+  const columns = header.split(',');
+  const windows = lines.map((line) => {
+    const values = line.split(',');
+    return columns.reduce((w, col, i) => ({ ...w, [col]: i === 0 ? values[i] : Number(values[i]) }), {});
+  });
+  return res.send({ windows });
+});
+
 router.post('/start', (req, res) => {
-  const { iface, windowSec = 10, totalDurationSec = null, filter } = req.body || {};
+  const { iface, windowSec = 10, totalDurationSec = null, filter, modelId } = req.body || {};
   if (!iface) return res.status(400).send('Missing iface');
   if (isRunning()) return res.status(409).send('Capture already running');
 
@@ -132,14 +194,25 @@ router.post('/start', (req, res) => {
       stopTimer: null,
       sessionDir,
       outputSessionId: `session_${sessionIdTs}`,
+      pipelinePid: null,
+      predictionDir: null,
   };
 
+  // Predict the windows while they are captured if a model is given
+  if (modelId) {
+      const predictionDir = path.join(PREDICTION_PATH, `session_${sessionIdTs}`);
+      const pipeline = startPipeline(sessionDir, modelId, predictionDir);
+      captureState.pipelinePid = pipeline.pid;
+      captureState.predictionDir = predictionDir;
+  }
+
   child.stdout.on('data', d => console.log('[ONLINE][stdout]', d.toString().trim()));
   child.stderr.on('data', d => console.log('[ONLINE][stderr]', d.toString().trim()));
 
   child.on('exit', (code, signal) => {
       console.log(`[ONLINE] tcpdump exited code=${code} signal=${signal}`);
       if (captureState.pid === child.pid) {
+          stopPipeline();
           if (captureState.stopTimer) {
               clearTimeout(captureState.stopTimer);
               captureState.stopTimer = null;
@@ -171,6 +244,7 @@ router.post('/start', (req, res) => {
       totalDurationSec: captureState.totalDurationSec,
       sessionDir,
       outputSessionId: captureState.outputSessionId,
+      predictionDir: captureState.predictionDir,
       cmd: tcpdumpCmd
   });
 });
@@ -205,6 +279,7 @@ router.post('/stop', (req, res) => {
 
   const last = getLatestNdrFileDetail();
   captureState.pid = null;
+  stopPipeline();
 
   res.send({
     ok: true,
@@ -8,18 +8,20 @@ const {
 const {
   listFiles, readTextFile, isFileExist,
 } = require('../utils/file-utils');
+const {
+  predictionViewFile,
+  readPredictionStats,
+} = require('../deep-learning/prediction-results');
 
 /** Download a prediction .csv file */
 router.get('/:predictionId/download', (req, res, next) => {
   const { predictionId } = req.params;
-  const predictionFilePath = `${PREDICTION_PATH}${predictionId}/predictions.csv`;
-  isFileExist(predictionFilePath, (ret) => {
-    if (!ret) {
-      res.status(401).send(`The prediction file of ${predictionId} does not exist`);
-    } else {
-      res.sendFile(predictionFilePath);
-    }
-  });
+  predictionViewFile(predictionId, 'all')
+    .then((viewFile) => {
+      res.attachment('predictions.csv');
+      res.type('text/csv').sendFile(viewFile);
+    })
+    .catch(() => res.status(401).send(`The prediction file of ${predictionId} does not exist`));
 });
 
 /**
@@ -27,14 +29,9 @@ router.get('/:predictionId/download', (req, res, next) => {
  */
 router.get('/:predictionId/attack', (req, res, next) => {
   const { predictionId } = req.params;
-  const predictionFilePath = `${PREDICTION_PATH}${predictionId}/attacks.csv`;
-  isFileExist(predictionFilePath, (ret) => {
-    if (!ret) {
-      res.status(401).send(`The prediction file for attack traffic of ${predictionId} does not exist`);
-    } else {
-      res.sendFile(predictionFilePath);
-    }
-  });
+  predictionViewFile(predictionId, 'attacks')
+    .then((viewFile) => res.type('text/csv').sendFile(viewFile))
+    .catch(() => res.status(401).send(`The prediction file for attack traffic of ${predictionId} does not exist`));
 });
 
 /**
@@ -42,14 +39,9 @@ router.get('/:predictionId/attack', (req, res, next) => {
  */
 router.get('/:predictionId/normal', (req, res, next) => {
   const { predictionId } = req.params;
-  const predictionFilePath = `${PREDICTION_PATH}${predictionId}/normals.csv`;
-  isFileExist(predictionFilePath, (ret) => {
-    if (!ret) {
-      res.status(401).send(`The prediction file for normal traffic of ${predictionId} does not exist`);
-    } else {
-      res.sendFile(predictionFilePath);
-    }
-  });
+  predictionViewFile(predictionId, 'normals')
+    .then((viewFile) => res.type('text/csv').sendFile(viewFile))
+    .catch(() => res.status(401).send(`The prediction file for normal traffic of ${predictionId} does not exist`));
 });
 
 // /**
@@ -71,13 +63,9 @@ router.get('/:predictionId/normal', (req, res, next) => {
  */
 router.get('/:predictionId', (req, res, next) => {
   const { predictionId } = req.params;
-  readTextFile(`${PREDICTION_PATH}${predictionId}/stats.csv`, (err, prediction) => {
-    if (err) {
-      res.status(401).send({ error: 'Something went wrong!' });
-    } else {
-      res.send({ prediction });
-    }
-  });
+  readPredictionStats(predictionId)
+    .then((prediction) => res.send({ prediction }))
+    .catch(() => res.status(401).send({ error: 'Something went wrong!' }));
 });
 
 /**